@@ -0,0 +1,93 @@
+"""
+Benchmark preparing a large set of facets for display with
+``globus_portal_framework.gsearch.get_facets``.
+
+Run from the repository root:
+
+    python benchmarks/get_facets.py
+"""
+import datetime
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tests.settings')
+
+import django  # noqa: E402
+django.setup()
+
+from django.test import RequestFactory  # noqa: E402
+from globus_portal_framework.gsearch import (  # noqa: E402
+    get_facets, get_search_filters,
+)
+
+BUCKETS = 500
+TERMS, RANGES, DATES = 10, 5, 5
+FACETS = (
+    [{'name': f'Terms {i}', 'field_name': f'terms_{i}', 'size': BUCKETS}
+     for i in range(TERMS)] +
+    [{'name': f'Range {i}', 'field_name': f'range_{i}', 'size': BUCKETS,
+      'type': 'numeric_histogram',
+      'histogram_range': {'low': 0, 'high': BUCKETS}}
+     for i in range(RANGES)] +
+    [{'name': f'Date {i}', 'field_name': f'date_{i}',
+      'type': 'date_histogram', 'date_interval': 'day'}
+     for i in range(DATES)]
+)
+QUERY = '&'.join(
+    [f'filter-match-all.terms_{i}=term {n}'
+     for i in range(TERMS) for n in range(0, BUCKETS, 50)] +
+    [f'filter-range.range_{i}={n}.0--{n + 1}.0'
+     for i in range(RANGES) for n in range(0, BUCKETS, 50)] +
+    [f'filter-day.date_{i}=2020-01-{d:02}'
+     for i in range(DATES) for d in range(1, 29, 3)]
+)
+
+
+class Response:
+    def __init__(self, data):
+        self.data = data
+
+
+def make_facet_results():
+    start = datetime.datetime(2020, 1, 1)
+    buckets = {
+        'terms': lambda n: f'term {n}',
+        'range': lambda n: {'from': float(n), 'to': float(n + 1)},
+        'date': lambda n: (start + datetime.timedelta(hours=n)
+                           ).strftime('%Y-%m-%d %H:%M:%S'),
+    }
+    results = []
+    for idx, facet in enumerate(FACETS):
+        make_value = buckets[facet['field_name'].split('_')[0]]
+        results.append({
+            '@datatype': 'GFacetResult', '@version': '2017-09-01',
+            'name': f'facet_def_{idx}_{facet["field_name"]}',
+            'buckets': [{'@datatype': 'GBucket', '@version': '2017-09-01',
+                         'count': 1, 'value': make_value(n)}
+                        for n in range(BUCKETS)],
+        })
+    return {'facet_results': results}
+
+
+def main():
+    filters = get_search_filters(RequestFactory().get(f'/?{QUERY}'))
+    data = make_facet_results()
+
+    def run():
+        # get_facets may modify the search result, start with a fresh copy
+        response = Response({'facet_results': [
+            dict(f, buckets=[dict(b) for b in f['buckets']])
+            for f in data['facet_results']]})
+        return get_facets(response, FACETS, filters, facet_modifiers=[])
+
+    run()
+    number = 20
+    total = timeit.timeit(run, number=number)
+    print(f'{len(FACETS)} facets x {BUCKETS} buckets: '
+          f'{total / number * 1000:.3f} ms per search')
+
+
+if __name__ == '__main__':
+    main()
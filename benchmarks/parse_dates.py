@@ -0,0 +1,82 @@
+"""
+Benchmark parsing dates for date_histogram facets with thousands of buckets,
+with ``globus_portal_framework.gsearch.get_facets`` and ``parse_date_filter``.
+
+Run from the repository root:
+
+    python benchmarks/parse_dates.py
+"""
+import datetime
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tests.settings')
+
+import django  # noqa: E402
+django.setup()
+
+from django.test import RequestFactory  # noqa: E402
+from globus_portal_framework.gsearch import (  # noqa: E402
+    get_facets, get_search_filters, parse_date_filter,
+)
+from globus_portal_framework.dates import parse_date  # noqa: E402
+
+BUCKETS = 5000
+FACETS = [
+    {'name': 'Hour', 'field_name': 'hour', 'type': 'date_histogram',
+     'date_interval': 'hour'},
+    {'name': 'Day', 'field_name': 'day', 'type': 'date_histogram',
+     'date_interval': 'day'},
+]
+QUERY = '&'.join([f'filter-hour.hour=2020-01-{d:02} 12:00:00'
+                  for d in range(1, 29)] +
+                 [f'filter-day.day=2020-{m:02}-01' for m in range(1, 13)])
+
+
+class Response:
+    def __init__(self, data):
+        self.data = data
+
+
+def make_dates(count, step, fmt):
+    start = datetime.datetime(2020, 1, 1)
+    return [(start + step * n).strftime(fmt) for n in range(count)]
+
+
+def main():
+    hours = make_dates(BUCKETS, datetime.timedelta(hours=1),
+                       '%Y-%m-%d %H:%M:%S')
+    days = make_dates(BUCKETS, datetime.timedelta(days=1), '%Y-%m-%d')
+    data = {'facet_results': [
+        {'name': f'facet_def_{idx}_{facet["field_name"]}',
+         'buckets': [{'count': 1, 'value': d} for d in dates]}
+        for idx, (facet, dates) in enumerate(zip(FACETS, [hours, days]))
+    ]}
+    filters = get_search_filters(RequestFactory().get(f'/?{QUERY}'))
+
+    def run_facets():
+        return get_facets(Response(data), FACETS, filters,
+                          facet_modifiers=[])
+
+    def run_facets_cold():
+        parse_date.cache_clear()
+        return run_facets()
+
+    def run_parse():
+        for date in hours:
+            parse_date_filter(date)
+
+    for name, func in [(f'parse_date_filter, {BUCKETS} dates', run_parse),
+                       (f'get_facets, {len(FACETS)} facets x {BUCKETS} '
+                        f'buckets', run_facets),
+                       ('get_facets, no cached dates', run_facets_cold)]:
+        func()
+        number = 20
+        total = timeit.timeit(func, number=number)
+        print(f'{name}: {total / number * 1000:.3f} ms')
+
+
+if __name__ == '__main__':
+    main()
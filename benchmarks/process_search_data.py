@@ -0,0 +1,54 @@
+"""
+Benchmark processing a large page of search results with
+``globus_portal_framework.gsearch.process_search_data``.
+
+Run from the repository root:
+
+    python benchmarks/process_search_data.py
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tests.settings')
+
+import django  # noqa: E402
+django.setup()
+
+from django.test import override_settings  # noqa: E402
+from globus_portal_framework.gsearch import (  # noqa: E402
+    get_index, process_search_data,
+)
+
+RESULTS = 100
+FIELDS = [f'field_{i}' for i in range(10)] + [
+    (f'dotted_{i}', f'nested_{i}.citation.title') for i in range(20)
+] + [
+    (f'func_{i}', lambda content: content[0].get('field_0')) for i in range(10)
+]
+INDEXES = {'bench': {'uuid': 'bench', 'fields': FIELDS}}
+
+
+def make_results(count):
+    content = {f'field_{i}': f'value {i}' for i in range(10)}
+    content.update({f'nested_{i}': {'citation': {'title': f'title {i}'}}
+                    for i in range(20)})
+    return [{'subject': f'https://example.com/{n}',
+             'entries': [{'content': dict(content)}]} for n in range(count)]
+
+
+def main():
+    results = make_results(RESULTS)
+    with override_settings(SEARCH_INDEXES=INDEXES):
+        fields = get_index('bench')['fields']
+        process_search_data(fields, results)
+        number = 200
+        total = timeit.timeit(lambda: process_search_data(fields, results),
+                              number=number)
+    print(f'{RESULTS} results x {len(FIELDS)} fields: '
+          f'{total / number * 1000:.3f} ms per page')
+
+
+if __name__ == '__main__':
+    main()
@@ -78,6 +78,7 @@ MIDDLEWARE = [
     'globus_portal_framework.middleware.ExpiredTokenMiddleware',
     'globus_portal_framework.middleware.GlobusAuthExceptionMiddleware',
     'social_django.middleware.SocialAuthExceptionMiddleware',
+    'globus_portal_framework.middleware.GlobusTokenStoreMiddleware',
 ]
 
 # Authentication backends setup OAuth2 handling and where user data should be
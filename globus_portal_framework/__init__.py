@@ -10,6 +10,7 @@ from globus_portal_framework.exc import (
 from globus_portal_framework.gclients import (
     load_auth_client, load_transfer_client, load_search_client,
     load_globus_client, load_globus_access_token,
+    load_globus_authorization_header,
 )
 
 from globus_portal_framework.gsearch import (
@@ -36,6 +37,7 @@ __all__ = [
 
     'load_auth_client', 'load_transfer_client', 'load_search_client',
     'load_globus_client', 'load_globus_access_token',
+    'load_globus_authorization_header',
 
     'post_search', 'get_subject', 'get_index', 'get_template',
     'process_search_data', 'get_pagination',
@@ -3,7 +3,7 @@ import requests
 from django.http import StreamingHttpResponse
 from django.core.exceptions import PermissionDenied
 from django.core.exceptions import SuspiciousOperation
-from .gclients import load_globus_access_token
+from .gclients import load_globus_authorization_header
 
 
 log = logging.getLogger(__name__)
@@ -19,9 +19,11 @@ def restricted_endpoint_proxy_stream(request):
     headers = {}
     if resource_server:
         try:
-            token = load_globus_access_token(request.user, resource_server)
-            headers['Authorization'] = 'Bearer {}'.format(token)
+            authorization = load_globus_authorization_header(
+                request.user, resource_server)
         except ValueError:
             raise SuspiciousOperation
+        if authorization:
+            headers['Authorization'] = authorization
     r = requests.get(url, headers=headers, stream=True)
     return StreamingHttpResponse(streaming_content=r)
@@ -10,6 +10,9 @@ class GlobusPortalFrameworkConfig(AppConfig):
     def ready(self):
         # Add System checks
         from globus_portal_framework import checks  # noqa
+        # Compile SEARCH_INDEXES once, instead of on each search
+        from globus_portal_framework.plans import compile_index_plans
+        compile_index_plans()
 
 
 def get_setting(app_setting):
@@ -2,8 +2,11 @@
 Globus Auth OpenID Connect backend, docs at:
     https://docs.globus.org/api/auth
 """
+import functools
 import logging
+import time
 import typing as t
+from django.core.cache import caches
 from social_core.backends.globus import (
     GlobusOpenIdConnect as GlobusOpenIdConnectBase
 )
@@ -11,9 +14,41 @@ from social_core.exceptions import AuthForbidden
 import globus_sdk
 from globus_sdk.scopes import GroupsScopes
 from globus_sdk import config as globus_sdk_config
+from globus_portal_framework.apps import get_setting
+from globus_portal_framework.gclients import (
+    client_pool, get_cached_user_groups, clear_cached_user_groups,
+    compact_user_groups, get_async_executor,
+)
 
 log = logging.getLogger(__name__)
 
+OIDC_CACHE_KEY_PREFIX = 'dgpf:oidc'
+# Process-local copies of cached OIDC data, as {cache key: (expires, data)}.
+# These keep working if the shared cache is a DummyCache or unreachable.
+_oidc_memo = {}
+# Cache keys for signing keys, see invalidate_jwks_keys
+_jwks_cache_keys = set()
+
+
+def get_oidc_cache_key(url: str) -> str:
+    return f'{OIDC_CACHE_KEY_PREFIX}:{url}'
+
+
+def invalidate_jwks_keys():
+    """
+    Drop cached Globus Auth signing keys, in this process and in the cache
+    named by ``GLOBUS_CACHE_ALIAS``, so they are fetched again on next use.
+    social-core calls this as ``get_jwks_keys.invalidate()`` when an id_token
+    is signed by a key which isn't cached, such as after keys are rotated.
+    """
+    keys = list(_jwks_cache_keys)
+    for key in keys:
+        _oidc_memo.pop(key, None)
+    try:
+        caches[get_setting('GLOBUS_CACHE_ALIAS')].delete_many(keys)
+    except Exception as e:
+        log.warning(f'Unable to drop cached Globus Auth keys: {e}')
+
 
 class GlobusOpenIdConnect(GlobusOpenIdConnectBase):
 
@@ -21,6 +56,21 @@ class GlobusOpenIdConnect(GlobusOpenIdConnectBase):
     GLOBUS_APP_URL = 'https://app.globus.org'
     # Fixed by https://github.com/python-social-auth/social-core/pull/577
     JWT_ALGORITHMS = ['RS512']
+    # Groups being fetched during login, see do_auth
+    user_groups_future = None
+
+    def do_auth(self, access_token, *args, **kwargs):
+        """
+        Start fetching the user's groups as soon as tokens are received, if
+        SOCIAL_AUTH_GLOBUS_ALLOWED_GROUPS is set. Groups are fetched on the
+        shared thread pool while user info is loaded and the pipeline runs,
+        and ``auth_allowed`` waits for them.
+        """
+        other_tokens = (kwargs.get('response') or {}).get('other_tokens')
+        if self.setting('ALLOWED_GROUPS', []) and other_tokens:
+            self.user_groups_future = get_async_executor().submit(
+                self.get_user_globus_groups, other_tokens)
+        return super().do_auth(access_token, *args, **kwargs)
 
     def auth_allowed(self, response: t.Mapping[str, dict], details: t.Mapping[str, dict]) -> bool:
         """
@@ -35,15 +85,31 @@ class GlobusOpenIdConnect(GlobusOpenIdConnectBase):
         if not allowed:
             return allowed
 
+        identity_id = response.get('sub')
         allowed_groups = self.setting('ALLOWED_GROUPS', [])
         if not allowed_groups:
             log.debug('settings.SOCIAL_AUTH_GLOBUS_ALLOWED_GROUPS is not '
                       'set, all users are allowed.')
+            # Groups may have changed since this user last logged in
+            if identity_id:
+                clear_cached_user_groups(identity_id)
             return allowed
 
-        identity_id = response.get('sub')
         username = details.get('username')
-        user_groups = self.get_user_globus_groups(response.get('other_tokens'))
+        future = self.user_groups_future
+        if future is not None:
+            # Groups were already requested in do_auth
+            self.user_groups_future = None
+            load_groups = future.result
+        else:
+            load_groups = functools.partial(self.get_user_globus_groups,
+                                            response.get('other_tokens'))
+        if identity_id:
+            # Always check current groups on login, and cache them for later
+            user_groups = get_cached_user_groups(identity_id, load_groups,
+                                                 refresh=True)
+        else:
+            user_groups = compact_user_groups(load_groups())
 
         allowed_user_member_groups = self.match_identity_to_groups(identity_id, user_groups, allowed_groups)
         if allowed_user_member_groups:
@@ -67,7 +133,7 @@ class GlobusOpenIdConnect(GlobusOpenIdConnectBase):
         :returns: subset of allowed_groups where any user identity is a member
         """
         # Reduce groups to intersecting user_groups and portal defined allowed groups
-        allowed_group_ids = [g['uuid'] for g in allowed_groups]
+        allowed_group_ids = {g['uuid'] for g in allowed_groups}
         intersecting_allowed_groups = [group for group in user_groups
                                        if group['id'] in allowed_group_ids]
         return intersecting_allowed_groups
@@ -95,9 +161,62 @@ class GlobusOpenIdConnect(GlobusOpenIdConnectBase):
             )
 
         authorizer = globus_sdk.AccessTokenAuthorizer(groups_token)
-        groups_client = globus_sdk.GroupsClient(authorizer=authorizer)
+        groups_client = client_pool.load_client(globus_sdk.GroupsClient,
+                                                authorizer=authorizer)
         return groups_client.get_my_groups().data
 
+    def oidc_config(self) -> dict:
+        """
+        Get the OpenID Connect discovery document for Globus Auth. The
+        document is cached with the cache named by ``GLOBUS_CACHE_ALIAS``, so
+        it is shared by all processes instead of fetched by each one.
+        """
+        url = f'{self.oidc_endpoint()}/.well-known/openid-configuration'
+        return self.get_cached_oidc_data(url, functools.partial(self.get_json,
+                                                                url))
+
+    def get_jwks_keys(self) -> t.List[dict]:
+        """
+        Get the keys Globus Auth signs id_tokens with. Keys are cached like
+        ``oidc_config``, and are dropped with ``get_jwks_keys.invalidate()``
+        (see ``invalidate_jwks_keys``).
+        """
+        url = self.jwks_uri()
+        _jwks_cache_keys.add(get_oidc_cache_key(url))
+        return self.get_cached_oidc_data(url, self.get_remote_jwks_keys)
+
+    get_jwks_keys.invalidate = invalidate_jwks_keys
+
+    def get_cached_oidc_data(self, url: str,
+                             fetch: t.Callable[[], t.Any]) -> t.Any:
+        """
+        Get data for an OpenID Connect URL from the cache named by
+        ``GLOBUS_CACHE_ALIAS``, or call ``fetch`` and cache the result for
+        ``GLOBUS_OIDC_CACHE_TIMEOUT`` seconds. Data is also kept in this
+        process for the same time, so it isn't fetched on every login if the
+        cache is a DummyCache or can't be reached.
+        """
+        key = get_oidc_cache_key(url)
+        now = time.monotonic()
+        memo = _oidc_memo.get(key)
+        if memo is not None and memo[0] > now:
+            return memo[1]
+        timeout = get_setting('GLOBUS_OIDC_CACHE_TIMEOUT')
+        cache = caches[get_setting('GLOBUS_CACHE_ALIAS')]
+        try:
+            data = cache.get(key)
+        except Exception as e:
+            log.warning(f'Unable to read {key} from cache: {e}')
+            data = None
+        if data is None:
+            data = fetch()
+            try:
+                cache.set(key, data, timeout)
+            except Exception as e:
+                log.warning(f'Unable to cache {key}: {e}')
+        _oidc_memo[key] = (now + timeout, data)
+        return data
+
     def auth_params(self, state=None):
         params = super(GlobusOpenIdConnect, self).auth_params(state)
         return params
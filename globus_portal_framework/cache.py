@@ -0,0 +1,488 @@
+"""
+Cache Globus Search responses using the Django cache framework.
+
+Caching is disabled by default, and can be enabled globally with
+``SEARCH_CACHE_TIMEOUT`` or per-index with ``cache_timeout`` in
+``SEARCH_INDEXES``. Raw Globus Search responses are cached rather than
+processed results, so ``fields`` and ``facet_modifiers`` still run on every
+request and may be changed freely without invalidating the cache.
+
+Cache keys are built from the full search body sent to Globus Search and the
+visibility of the user making the search, so confidential results are never
+shared between users with different visibility. Users with the same Globus
+identities and groups share cache entries. Indexes which only contain public
+records can set ``public_only`` so all users share the anonymous entries.
+
+Concurrent cache misses for the same key within a process are coalesced, so
+only one request is sent to Globus Search and its response is shared by all
+waiting threads. See ``search_flight.stats()`` for the number of requests
+issued and coalesced.
+
+Entries have a soft and hard expiry. After ``cache_timeout`` seconds an entry
+is stale but may still be served for ``cache_stale_timeout`` more seconds.
+The first request to see a stale entry takes a short lock in the cache and
+refreshes the entry in a background thread, while it and all other requests
+(on any node sharing the cache) are served the stale entry.
+
+``acached_search`` and ``acached_subject`` are the same for async views,
+taking coroutine functions instead of plain callables.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import pickle
+import threading
+import time
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.core.cache import caches
+from django.db import connections
+
+from globus_portal_framework.apps import get_setting
+from globus_portal_framework.gclients import get_user_group_set_hash
+
+log = logging.getLogger(__name__)
+
+SEARCH_CACHE_KEY_PREFIX = 'dgpf:search'
+SUBJECT_CACHE_KEY_PREFIX = 'dgpf:subject'
+
+
+class CachedSearchResponse:
+    """Stands in for a globus_sdk.GlobusHTTPResponse loaded from the cache.
+    Only the parsed response ``data`` is stored, which is all DGPF needs to
+    process search results."""
+
+    def __init__(self, data):
+        self.data = data
+
+    def __getitem__(self, key):
+        return self.data[key]
+
+    def get(self, key, default=None):
+        return self.data.get(key, default)
+
+
+class _Call:
+    """An in-flight call tracked by SingleFlight"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls with the same key into a single call. The first
+    thread to call ``do`` for a key runs the function, and any threads
+    calling ``do`` with the same key while it runs wait for it to finish and
+    share the result (or exception). Counters track how many calls were
+    issued and how many were coalesced into an in-flight call.
+
+    ``ado`` does the same for coroutines within an event loop.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._async_calls = {}
+        self.issued = 0
+        self.coalesced = 0
+
+    def do(self, key, func, share=None):
+        """
+        Call ``func``, or wait on an identical in-flight call for ``key``.
+        :param key: Identifies the call. Calls with the same key are shared.
+        :param func: A callable taking no arguments
+        :param share: Optional callable applied to the result before it is
+            handed to waiting threads, such as to give each a copy.
+        :return: The result of ``func``
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = self._calls[key] = _Call()
+                self.issued += 1
+                leader = True
+            else:
+                self.coalesced += 1
+                leader = False
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return share(call.result) if share else call.result
+
+        try:
+            call.result = func()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+        return call.result
+
+    async def ado(self, key, func, share=None):
+        """
+        Await ``func()``, or wait on an identical in-flight coroutine for
+        ``key`` started in the same event loop.
+        :param key: Identifies the call. Calls with the same key are shared.
+        :param func: A coroutine function taking no arguments
+        :param share: Optional callable applied to the result before it is
+            handed to waiting coroutines.
+        :return: The result of ``func``
+        """
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            call = self._async_calls.get((loop, key))
+            if call is None:
+                call = self._async_calls[(loop, key)] = loop.create_future()
+                self.issued += 1
+                leader = True
+            else:
+                self.coalesced += 1
+                leader = False
+
+        if not leader:
+            result = await asyncio.shield(call)
+            return share(result) if share else result
+
+        try:
+            result = await func()
+        except BaseException as e:
+            if isinstance(e, Exception):
+                call.set_exception(e)
+                # The leader raises the error itself, so don't warn if no
+                # other coroutine was waiting to retrieve it.
+                call.exception()
+            else:
+                call.cancel()
+            raise
+        else:
+            call.set_result(result)
+        finally:
+            with self._lock:
+                del self._async_calls[(loop, key)]
+        return result
+
+    def stats(self):
+        """Return counters for calls issued, coalesced, and in flight"""
+        with self._lock:
+            return {
+                'issued': self.issued,
+                'coalesced': self.coalesced,
+                'in_flight': len(self._calls) + len(self._async_calls),
+            }
+
+    def reset(self):
+        """Reset counters to zero"""
+        with self._lock:
+            self.issued = self.coalesced = 0
+
+
+search_flight = SingleFlight()
+
+
+def get_search_cache():
+    """Return the Django cache configured by ``SEARCH_CACHE_ALIAS``"""
+    return caches[get_setting('SEARCH_CACHE_ALIAS')]
+
+
+def get_index_data(index):
+    indexes = get_setting('SEARCH_INDEXES') or {}
+    return indexes.get(index) or {}
+
+
+def get_search_cache_settings(index):
+    """
+    Get the cache timeout, stale timeout, and max entry size for an index.
+    Per-index settings ``cache_timeout``, ``cache_stale_timeout`` and
+    ``cache_max_entry_size`` take precedence over ``SEARCH_CACHE_TIMEOUT``,
+    ``SEARCH_CACHE_STALE_TIMEOUT`` and ``SEARCH_CACHE_MAX_ENTRY_SIZE``.
+    :param index: index key name defined in settings.SEARCH_INDEXES
+    :return: A tuple of (timeout, stale_timeout, max_entry_size). A timeout
+        of 0 means caching is disabled for this index.
+    """
+    index_data = get_index_data(index)
+    timeout = index_data.get('cache_timeout',
+                             get_setting('SEARCH_CACHE_TIMEOUT'))
+    stale_timeout = index_data.get('cache_stale_timeout',
+                                   get_setting('SEARCH_CACHE_STALE_TIMEOUT'))
+    max_size = index_data.get('cache_max_entry_size',
+                              get_setting('SEARCH_CACHE_MAX_ENTRY_SIZE'))
+    return timeout or 0, stale_timeout or 0, max_size
+
+
+def get_visibility_key(user=None, index=None):
+    """
+    Get a key representing which records a user is allowed to see. Anonymous
+    users can only see public records and all share the same key. Logged in
+    users each get their own key.
+
+    On indexes with ``cache_by_groups`` set, logged in users with the same
+    Globus Groups share a key, see
+    ``globus_portal_framework.gclients.get_user_group_set_hash``. Only set
+    ``cache_by_groups`` on indexes where records are visible to ``public`` or
+    to groups, never to individual identities!
+
+    All users share the anonymous key on indexes with ``public_only`` set.
+    Only set ``public_only`` on indexes where every record is public!
+    """
+    index_data = get_index_data(index) if index is not None else {}
+    if index_data.get('public_only'):
+        return 'public'
+    if user is None or not user.is_authenticated:
+        return 'public'
+    if index_data.get('cache_by_groups'):
+        group_hash = get_user_group_set_hash(user)
+        if group_hash:
+            return 'groups:{}'.format(group_hash)
+    return 'user:{}'.format(user.pk)
+
+
+def get_search_cache_key(index, search_data, user=None):
+    """
+    Build a cache key for a search. The search body is serialized with
+    sorted keys and canonical filters (see ``gsearch.get_canonical_filters``)
+    so that equivalent searches produce the same key regardless of the order
+    they were built in.
+    :param index: index key name defined in settings.SEARCH_INDEXES
+    :param search_data: The full search body sent to Globus Search
+    :param user: The user making the search, or None
+    :return: A string suitable for use as a Django cache key
+    """
+    # gsearch depends on this module, import here to avoid a circular import
+    from globus_portal_framework.gsearch import get_canonical_filters
+    if search_data.get('filters'):
+        filters = get_canonical_filters(search_data['filters'])
+        search_data = dict(search_data, filters=filters)
+    body = json.dumps(search_data, sort_keys=True, separators=(',', ':'),
+                      default=str)
+    digest = hashlib.sha256(body.encode('utf-8')).hexdigest()
+    return '{}:{}:{}:{}'.format(SEARCH_CACHE_KEY_PREFIX, index,
+                                get_visibility_key(user, index), digest)
+
+
+def get_subject_cache_key(index, subject, user=None):
+    """
+    Build a cache key for fetching a single subject.
+    :param index: index key name defined in settings.SEARCH_INDEXES
+    :param subject: The Globus Search subject
+    :param user: The user fetching the subject, or None
+    :return: A string suitable for use as a Django cache key
+    """
+    digest = hashlib.sha256(subject.encode('utf-8')).hexdigest()
+    return '{}:{}:{}:{}'.format(SUBJECT_CACHE_KEY_PREFIX, index,
+                                get_visibility_key(user, index), digest)
+
+
+def set_cached_search(key, data, timeout, max_size=None, stale_timeout=0,
+                      pickled=None):
+    """Store raw search response data in the cache, unless the data
+    exceeds max_size in bytes. The entry becomes stale after ``timeout``
+    seconds, and is removed ``stale_timeout`` seconds after that.
+
+    :param pickled: ``data`` already pickled, used to check its size
+    :return: True if the data was cached, False otherwise
+    """
+    if max_size:
+        if pickled is None:
+            pickled = pickle.dumps(data, pickle.HIGHEST_PROTOCOL)
+        size = len(pickled)
+        if size > max_size:
+            log.debug(f'Search result for {key} is {size} bytes, which is '
+                      f'larger than the max entry size {max_size}. Skipping.')
+            return False
+    entry = (time.time() + timeout, data)
+    get_search_cache().set(key, entry, timeout + stale_timeout)
+    return True
+
+
+def cached_search(index, search_data, user, search):
+    """
+    Return a cached search response for the given search, or call ``search``
+    and cache the result if there was no cached response. If caching is
+    disabled for the index, ``search`` is always called.
+
+    Example:
+        >>> cached_search('myindex', search_data, request.user,
+        ...               lambda: client.post_search(uuid, search_data))
+
+    :param index: index key name defined in settings.SEARCH_INDEXES
+    :param search_data: The full search body sent to Globus Search
+    :param user: The user making the search, or None
+    :param search: A callable taking no arguments which performs the search,
+        returning a response with a ``data`` attribute.
+    :return: The response from ``search``, or a CachedSearchResponse
+    """
+    timeout, stale_timeout, max_size = get_search_cache_settings(index)
+    if not timeout:
+        return search()
+    key = get_search_cache_key(index, search_data, user)
+    return get_or_search(key, search, timeout, max_size, stale_timeout)
+
+
+def cached_subject(index, subject, user, get_subject):
+    """
+    Same as ``cached_search``, but for fetching a single subject.
+
+    :param index: index key name defined in settings.SEARCH_INDEXES
+    :param subject: The Globus Search subject
+    :param user: The user fetching the subject, or None
+    :param get_subject: A callable taking no arguments which fetches the
+        subject, returning a response with a ``data`` attribute.
+    :return: The response from ``get_subject``, or a CachedSearchResponse
+    """
+    timeout, stale_timeout, max_size = get_search_cache_settings(index)
+    if not timeout:
+        return get_subject()
+    key = get_subject_cache_key(index, subject, user)
+    return get_or_search(key, get_subject, timeout, max_size, stale_timeout)
+
+
+async def acached_search(index, search_data, user, search):
+    """
+    Async version of ``cached_search``.
+
+    Example:
+        >>> await acached_search(
+        ...     'myindex', search_data, user,
+        ...     lambda: run_async(client.post_search, uuid, search_data))
+
+    :param search: A coroutine function taking no arguments which performs
+        the search, returning a response with a ``data`` attribute.
+    :return: The response from ``search``, or a CachedSearchResponse
+    """
+    timeout, stale_timeout, max_size = get_search_cache_settings(index)
+    if not timeout:
+        return await search()
+    key = await sync_to_async(get_search_cache_key)(index, search_data, user)
+    return await aget_or_search(key, search, timeout, max_size, stale_timeout)
+
+
+async def acached_subject(index, subject, user, get_subject):
+    """
+    Async version of ``cached_subject``, where ``get_subject`` is a coroutine
+    function.
+    """
+    timeout, stale_timeout, max_size = get_search_cache_settings(index)
+    if not timeout:
+        return await get_subject()
+    key = await sync_to_async(get_subject_cache_key)(index, subject, user)
+    return await aget_or_search(key, get_subject, timeout, max_size,
+                                stale_timeout)
+
+
+def get_cached_search(key):
+    """Get cached search response data for key.
+
+    :return: A tuple of (data, stale), or None if nothing is cached
+    """
+    entry = get_search_cache().get(key)
+    if not isinstance(entry, tuple):
+        return None
+    stale_at, data = entry
+    return data, stale_at <= time.time()
+
+
+def get_or_search(key, search, timeout, max_size=None, stale_timeout=0):
+    """Return the cached response for key, or call search and cache the
+    response data. Concurrent misses on the same key share one search.
+    Stale entries are returned as-is and refreshed in the background."""
+    def search_and_cache():
+        response = search()
+        pickled = pickle_and_cache(key, response.data, timeout, max_size,
+                                   stale_timeout)
+        return response, pickled
+
+    cached = get_cached_search(key)
+    if cached is not None:
+        data, stale = cached
+        if stale:
+            refresh_in_background(key, search_and_cache)
+        else:
+            log.debug(f'Search cache hit for {key}')
+        return CachedSearchResponse(data)
+
+    response, _ = search_flight.do(key, search_and_cache,
+                                   share=copy_pickled_response)
+    return response
+
+
+async def aget_or_search(key, search, timeout, max_size=None,
+                         stale_timeout=0):
+    """Async version of ``get_or_search``, where search is a coroutine
+    function. Cache access runs in a thread, outside the event loop."""
+    async def search_and_cache():
+        response = await search()
+        pickled = await sync_to_async(pickle_and_cache)(
+            key, response.data, timeout, max_size, stale_timeout)
+        return response, pickled
+
+    cached = await sync_to_async(get_cached_search)(key)
+    if cached is not None:
+        data, stale = cached
+        if stale:
+            await sync_to_async(refresh_in_background)(
+                key, lambda: async_to_sync(search_and_cache)())
+        else:
+            log.debug(f'Search cache hit for {key}')
+        return CachedSearchResponse(data)
+
+    response, _ = await search_flight.ado(key, search_and_cache,
+                                          share=copy_pickled_response)
+    return response
+
+
+def refresh_in_background(key, search_and_cache):
+    """
+    Refresh a stale cache entry in a background thread. A lock is taken
+    in the search cache so only one thread across all nodes sharing the
+    cache refreshes the entry. If the lock is already held, nothing is done.
+    :return: The thread doing the refresh, or None if the lock was not taken
+    """
+    lock_key = f'{key}:lock'
+    cache = get_search_cache()
+    if not cache.add(lock_key, 1, get_setting('SEARCH_CACHE_LOCK_TIMEOUT')):
+        log.debug(f'Serving stale {key}, refresh already in progress.')
+        return None
+
+    def refresh():
+        try:
+            search_flight.do(key, search_and_cache)
+            log.debug(f'Refreshed stale search cache entry {key}')
+        except Exception as e:
+            log.exception(e)
+        finally:
+            cache.delete(lock_key)
+            connections.close_all()
+
+    log.debug(f'Serving stale {key}, refreshing in the background.')
+    thread = threading.Thread(target=refresh, daemon=True)
+    thread.start()
+    return thread
+
+
+def pickle_and_cache(key, data, timeout, max_size=None, stale_timeout=0):
+    """Pickle search response data and cache it with ``set_cached_search``.
+    The data is pickled before the response is returned to the caller, so
+    waiting threads can copy it while the caller processes the response.
+
+    :return: The pickled data
+    """
+    pickled = pickle.dumps(data, pickle.HIGHEST_PROTOCOL)
+    set_cached_search(key, data, timeout, max_size, stale_timeout,
+                      pickled=pickled)
+    return pickled
+
+
+def copy_pickled_response(result):
+    """Give a thread sharing a search its own copy of the response, from
+    the (response, pickled data) the searching thread returned. The caller
+    which searched may already be modifying the response itself."""
+    _, pickled = result
+    return CachedSearchResponse(pickle.loads(pickled)), pickled
@@ -45,6 +45,11 @@ FILTER_DATE_TYPE_PATTERN = (
     r'(?P<time> \d\d:\d\d:\d\d)?'
 )
 
+# Dates in exactly one of the DATETIME_PARTIAL_FORMATS below
+ISO_DATE_PATTERN = (
+    r'(\d{4})(?:-(\d\d)(?:-(\d\d)(?: (\d\d):(\d\d):(\d\d))?)?)?'
+)
+
 DATETIME_PARTIAL_FORMATS = {
     'year': '%Y',
     'month': '%Y-%m',
@@ -1,37 +1,91 @@
 from django.conf import settings
-from django.urls import resolve, reverse, NoReverseMatch, Resolver404
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.urls import (
+    resolve, reverse, get_urlconf, NoReverseMatch, Resolver404,
+)
 from globus_portal_framework import get_index, IndexNotFound
 
+# Cached context is rebuilt if any of these settings change
+GLOBALS_SETTINGS = {'INSTALLED_APPS', 'SOCIAL_AUTH_GLOBUS_SCOPE',
+                    'PROJECT_TITLE', 'ROOT_URLCONF', 'SEARCH_INDEXES'}
 
-def globals(request):
-    auth_enabled = bool('social_django' in settings.INSTALLED_APPS)
-    scopes = getattr(settings, 'SOCIAL_AUTH_GLOBUS_SCOPE', [])
-    transfer_scope_set = any(['transfer.api.globus.org' in scope
-                              for scope in scopes])
+_static_context = {}
+_search_debugging_enabled = {}
+
+
+def get_static_context():
+    """Get the parts of the 'globus_portal_framework' context which only
+    depend on settings. These are computed once, instead of on each page."""
+    if not _static_context:
+        auth_enabled = bool('social_django' in settings.INSTALLED_APPS)
+        scopes = getattr(settings, 'SOCIAL_AUTH_GLOBUS_SCOPE', [])
+        transfer_scope_set = any(['transfer.api.globus.org' in scope
+                                  for scope in scopes])
+        _static_context.update({
+            'project_title': getattr(settings, 'PROJECT_TITLE',
+                                     'Globus Portal Framework'),
+            'auth_enabled': auth_enabled,
+            'transfer_enabled': auth_enabled and transfer_scope_set,
+        })
+    return _static_context
+
+
+def is_search_debugging_enabled(index, urlconf=None):
+    """Report if search debugging is enabled for an index, so it can be
+    linked in templates. The result is remembered for each urlconf."""
+    key = (urlconf or settings.ROOT_URLCONF, index)
+    enabled = _search_debugging_enabled.get(key)
+    if enabled is None:
+        try:
+            reverse('search-debug', args=[index], urlconf=urlconf)
+            enabled = True
+        except NoReverseMatch:
+            enabled = False
+        _search_debugging_enabled[key] = enabled
+    return enabled
+
+
+def get_request_index(request):
+    """Get the index for the URL the user is visiting, or None. Django has
+    usually resolved the URL already, so ``request.resolver_match`` is used
+    if it is set."""
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        try:
+            match = resolve(request.path_info, getattr(request, 'urlconf',
+                                                       None))
+        except Resolver404:
+            return None
+    return match.kwargs.get('index')
 
+
+def globals(request):
     # Attempt to gather index information on the URL the user is visiting
     # Suppress errors, in case the index isn't valid or registered
-    index, index_data = None, {}
-    try:
-        index = resolve(request.path).kwargs.get('index')
-        index_data = get_index(index)
-    except (IndexNotFound, Resolver404):
-        pass
-
-    # Report if search debugging is enabled so it can be linked in templates
-    try:
-        reverse('search-debug', args=[index])
-        search_debugging_enabled = True
-    except NoReverseMatch:
-        search_debugging_enabled = False
-
-    return {'globus_portal_framework': {
-                'project_title': getattr(settings, 'PROJECT_TITLE',
-                                         'Globus Portal Framework'),
-                'auth_enabled': auth_enabled,
-                'transfer_enabled': auth_enabled and transfer_scope_set,
-                'index_data': index_data,
-                'index': index,
-                'search_debugging_enabled': search_debugging_enabled,
-                }
-            }
+    index, index_data = get_request_index(request), {}
+    if index is not None:
+        try:
+            index_data = get_index(index)
+        except IndexNotFound:
+            pass
+
+    return {'globus_portal_framework': dict(
+        get_static_context(),
+        index_data=index_data,
+        index=index,
+        search_debugging_enabled=is_search_debugging_enabled(index,
+                                                             get_urlconf()),
+    )}
+
+
+def clear_globals_cache():
+    """Clear cached context, so it is computed again on next use"""
+    _static_context.clear()
+    _search_debugging_enabled.clear()
+
+
+@receiver(setting_changed)
+def clear_globals_cache_on_setting_changed(setting, **kwargs):
+    if setting in GLOBALS_SETTINGS:
+        clear_globals_cache()
@@ -0,0 +1,129 @@
+"""
+Parse the partial dates used by date filters and date_histogram facets, such
+as '2019', '2019-12', '2019-12-02' or '2019-12-02 21:00:00'.
+
+The same dates are parsed over and over, both for the buckets of every
+date_histogram facet and for filters on each search, so parsed dates are kept
+in a bounded LRU cache. Dates which exactly match one of the
+DATETIME_PARTIAL_FORMATS are parsed without strptime.
+"""
+import datetime
+import functools
+import re
+
+from globus_portal_framework.exc import InvalidRangeFilter
+from globus_portal_framework.constants import (
+    FILTER_DATE_TYPE_PATTERN, ISO_DATE_PATTERN, DATETIME_PARTIAL_FORMATS,
+)
+
+# Max number of parsed date strings kept in memory
+DATE_CACHE_SIZE = 16384
+
+filter_date_matcher = re.compile(FILTER_DATE_TYPE_PATTERN)
+iso_date_matcher = re.compile(ISO_DATE_PATTERN, re.ASCII)
+
+
+def get_date_format_type(date_str):
+    """
+    Given a date_str, derive the date information contained within the date_str
+    The return value is based on the following map:
+    'year': 'YYYY'
+    'month': 'YYYY-MM'
+    'day': 'YYYY-MM-DD'
+    'time': 'YYYY-MM-DD hh:mm:ss'
+    and will return 'year', 'month', 'day' or 'time'
+
+    Examples:
+        '2019' will return 'day'
+        '2018-01-20 12:30:34' will return 'time'
+    If you want a parsed datetime object, see 'parse_date_filter()' instead.
+    """
+    date_str = str(date_str)
+    match = filter_date_matcher.match(date_str)
+    if not match:
+        return None
+    date_matches = match.groupdict()
+    date_format_set = {dt for dt, value in date_matches.items()
+                       if value is not None}
+    date_format_types = [
+        ('year', {'year'}),
+        ('month', {'year', 'month'}),
+        ('day', {'year', 'month', 'day'}),
+        ('time', {'year', 'month', 'day', 'time'}),
+    ]
+    for name, dft_set in date_format_types:
+        if dft_set == date_format_set:
+            return name
+
+
+def parse_date_filter(serialized_date):
+    """
+    Given a serialized_date (ex: '2019-12-02'), return a dict containing
+    the following info:
+    {
+      'value': serialized_date,
+      'type': 'day',
+      'datetime': <datetime.datetime object>
+    }
+    The date string given can match any date string format types handled by
+    get_date_format_type()
+    :param serialized_date: a date string, ex: '2019-12-02'
+    :return: A dict containing the date string given, whether the date is a
+    year, month, day or time type date, and a datetime object.
+    """
+    # coerce date into str, in case the date was pased as a number, eg 2020
+    dt_fmt_type, dt = parse_date(str(serialized_date))
+    return {
+        'value': serialized_date,
+        'type': dt_fmt_type,
+        'datetime': dt,
+    }
+
+
+def parse_datetime(serialized_date):
+    """
+    Parse a date string into a datetime. Same as
+    ``parse_date_filter(serialized_date)['datetime']``.
+    :param serialized_date: a date string, ex: '2019-12-02'
+    :return: A datetime object
+    """
+    return parse_date(str(serialized_date))[1]
+
+
+@functools.lru_cache(maxsize=DATE_CACHE_SIZE)
+def parse_date(date_str):
+    """
+    Parse a date string into its format type and a datetime. Results are
+    cached, see ``parse_date.cache_info()``. Raises InvalidRangeFilter if the
+    date doesn't match any format types handled by get_date_format_type(),
+    or ValueError if it matches but isn't a real date (ex: '2019-13').
+    :param date_str: a date string, ex: '2019-12-02'
+    :return: A tuple of the format type and datetime, ex:
+        ('day', datetime.datetime(2019, 12, 2, 0, 0))
+    """
+    match = iso_date_matcher.fullmatch(date_str)
+    if match is None:
+        return _parse_date_strptime(date_str)
+    year, month, day, hour, minute, second = match.groups()
+    if hour is not None:
+        return 'time', datetime.datetime(int(year), int(month), int(day),
+                                         int(hour), int(minute), int(second))
+    elif day is not None:
+        return 'day', datetime.datetime(int(year), int(month), int(day))
+    elif month is not None:
+        return 'month', datetime.datetime(int(year), int(month), 1)
+    return 'year', datetime.datetime(int(year), 1, 1)
+
+
+def _parse_date_strptime(date_str):
+    """
+    Parse dates which don't strictly match ISO_DATE_PATTERN with strptime,
+    such as years with non-ASCII digits, or raise InvalidRangeFilter.
+    :meta private:
+    """
+    dt_fmt_type = get_date_format_type(date_str)
+    dt_fmt_str = DATETIME_PARTIAL_FORMATS.get(dt_fmt_type)
+    if dt_fmt_str:
+        return dt_fmt_type, datetime.datetime.strptime(date_str, dt_fmt_str)
+    raise InvalidRangeFilter(code='FilterParseError',
+                             message='Unable to parse {}'.format(date_str))
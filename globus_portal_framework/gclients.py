@@ -1,10 +1,27 @@
 import typing as t
-from datetime import timedelta
+import asyncio
+import contextlib
+import contextvars
+import functools
+import hashlib
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone as dt_timezone
 import django
+from django.contrib.auth.signals import user_logged_out
+from django.core.cache import caches
+from django.db import connections, transaction
+from django.dispatch import receiver
 from django.utils import timezone
 from django.conf import settings
 from django.utils.module_loading import import_string
 import globus_sdk
+from globus_sdk.transport import RequestsTransport
+from jose import jwt, JWTError
+from packaging.version import Version
+import requests
 
 from globus_portal_framework import ExpiredGlobusToken, exc
 from globus_portal_framework.apps import get_setting
@@ -15,37 +32,240 @@ import logging
 
 log = logging.getLogger(__name__)
 
+_async_executor = None
+_async_executor_lock = threading.Lock()
+_revocation_queue = None
 
-def revoke_globus_tokens(user: "django.contrib.auth.models.User"):
+# Globus SDK v4 clients accept a shared transport, v3 clients do not.
+GLOBUS_SDK_V4 = Version(globus_sdk.__version__).major >= 4
+
+
+class GlobusClientPool:
+    """
+    Share HTTP connections between Globus SDK clients in this process.
+    Clients are still created for each user, but every client uses the same
+    ``requests.Session`` so open connections to Globus services are reused
+    instead of starting a new TLS session for each request. On Globus SDK v4,
+    each client class also shares one transport.
+
+    The pool holds at most ``GLOBUS_CLIENT_POOL_SIZE`` open connections per
+    Globus service, and is replaced after ``GLOBUS_CLIENT_POOL_KEEPALIVE``
+    idle seconds so connections closed by the server are not reused. A new
+    pool is created in forked worker processes. Set
+    ``GLOBUS_CLIENT_POOL_SIZE`` to 0 to disable pooling.
     """
-    Revoke all of a user's Globus tokens.
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pid = None
+        self._session = None
+        self._transports = {}
+        self._last_used = 0
+
+    def load_client(self, client_class: t.Type[globus_sdk.BaseClient],
+                    *args, **kwargs) -> globus_sdk.BaseClient:
+        """Create a client using pooled connections. Arguments are passed
+        through to ``client_class``."""
+        pool_size = get_setting('GLOBUS_CLIENT_POOL_SIZE')
+        if not pool_size:
+            return client_class(*args, **kwargs)
+        with self._lock:
+            session = self._get_session(pool_size)
+            if GLOBUS_SDK_V4:
+                transport = self._transports.get(client_class)
+                if transport is None:
+                    transport = RequestsTransport()
+                    transport.session = session
+                    self._transports[client_class] = transport
+        if GLOBUS_SDK_V4:
+            return client_class(*args, transport=transport, **kwargs)
+        client = client_class(*args, **kwargs)
+        client.transport.session = session
+        return client
+
+    def _get_session(self, pool_size: int) -> requests.Session:
+        now = time.monotonic()
+        keepalive = get_setting('GLOBUS_CLIENT_POOL_KEEPALIVE')
+        idle = keepalive and now - self._last_used > keepalive
+        forked = self._pid != os.getpid()
+        if forked:
+            # Never share connections with a parent process
+            self._transports = {}
+        if self._session is None or idle or forked:
+            log.debug('Creating new Globus client connection pool')
+            if self._session is not None:
+                # Release stale sockets. Closing does not shut down the
+                # connections of a parent process.
+                self._session.close()
+            self._session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_maxsize=pool_size)
+            self._session.mount('https://', adapter)
+            self._session.mount('http://', adapter)
+            self._pid = os.getpid()
+            for transport in self._transports.values():
+                transport.session = self._session
+        self._last_used = now
+        return self._session
+
+
+client_pool = GlobusClientPool()
+
+
+def revoke_globus_tokens(user: "django.contrib.auth.models.User",
+                         background: bool = None):
+    """
+    Revoke all of a user's Globus tokens. Each access token and its refresh
+    token are revoked concurrently on the shared thread pool (see
+    ``get_async_executor``). Revocations failing with a server or network
+    error are retried up to ``GLOBUS_REVOKE_TOKENS_RETRIES`` times.
     :param user: A django user object, typically on the request of a view
         (request.user)
+    :param background: Revoke tokens in a background thread and return
+        immediately. Defaults to ``GLOBUS_REVOKE_TOKENS_IN_BACKGROUND``.
     :return: None
     """
     tokens = user.social_auth.get(provider='globus').extra_data
-    ac = globus_sdk.ConfidentialAppAuthClient(
-        settings.SOCIAL_AUTH_GLOBUS_KEY,
-        settings.SOCIAL_AUTH_GLOBUS_SECRET
-    )
     tok_list = [(tokens['access_token'], tokens.get('refresh_token'))]
     tok_list.extend([(t['access_token'], t.get('refresh_token'))
                     for t in tokens.get('other_tokens', [])])
+    if background is None:
+        background = get_setting('GLOBUS_REVOKE_TOKENS_IN_BACKGROUND')
+    if background:
+        get_revocation_queue().submit(_revoke_tokens, str(user), tok_list)
+    else:
+        _revoke_tokens(str(user), tok_list)
 
-    for at, rt in tok_list:
-        try:
-            ac.oauth2_revoke_token(at)
-            if rt:
-                ac.oauth2_revoke_token(rt)
-        except globus_sdk.GlobusAPIError as gapie:
-            log.exception(gapie)
-
-    # Gather info on what was revoked
-    access, refresh = zip(*tok_list)
-    at, rt = filter(None, access), filter(None, refresh)
-    num_at, num_rt = len(list(at)), len(list(rt))
+
+def _revoke_tokens(user: str, tok_list: t.List[t.Tuple[str, str]]):
+    """
+    Revoke (access token, refresh token) pairs concurrently, and log counts
+    :meta private:
+    """
+    ac = client_pool.load_client(
+        globus_sdk.ConfidentialAppAuthClient,
+        settings.SOCIAL_AUTH_GLOBUS_KEY,
+        settings.SOCIAL_AUTH_GLOBUS_SECRET
+    )
+    revoke_pair = functools.partial(_revoke_token_pair, ac)
+    results = list(get_async_executor().map(revoke_pair, tok_list))
+    num_at, num_rt, failed = (sum(counts) for counts in zip(*results))
     log.info(f'Revoked {num_at + num_rt} ({num_at} access, {num_rt} refresh) '
              f'tokens for user {user}')
+    if failed:
+        log.warning(f'Failed to revoke {failed} tokens for user {user}')
+
+
+def _revoke_token_pair(auth_client: globus_sdk.ConfidentialAppAuthClient,
+                       pair: t.Tuple[str, t.Optional[str]]
+                       ) -> t.Tuple[int, int, int]:
+    """
+    Revoke an access token, then its refresh token. The refresh token is
+    not revoked if the access token could not be.
+    :returns: The number of (access, refresh, failed) tokens
+    :meta private:
+    """
+    at, rt = pair
+    num_at = num_rt = 0
+    try:
+        _revoke_token(auth_client, at)
+        num_at = 1
+        if rt:
+            _revoke_token(auth_client, rt)
+            num_rt = 1
+    except (globus_sdk.GlobusAPIError, globus_sdk.NetworkError) as gapie:
+        log.exception(gapie)
+    return num_at, num_rt, len(list(filter(None, pair))) - num_at - num_rt
+
+
+def _revoke_token(auth_client: globus_sdk.ConfidentialAppAuthClient,
+                  token: str):
+    """
+    Revoke a token, retrying server and network errors
+    :meta private:
+    """
+    retries = get_setting('GLOBUS_REVOKE_TOKENS_RETRIES')
+    for attempt in range(retries + 1):
+        try:
+            return auth_client.oauth2_revoke_token(token)
+        except (globus_sdk.GlobusAPIError, globus_sdk.NetworkError) as err:
+            status = getattr(err, 'http_status', None)
+            transient = status is None or status == 429 or status >= 500
+            if not transient or attempt == retries:
+                raise
+            log.debug(f'Retrying token revocation after error: {err}')
+            time.sleep(0.1 * 2 ** attempt)
+
+
+class GlobusTokenStore:
+    """
+    A user's Globus tokens, loaded from Python Social Auth with a single query
+    and indexed by resource server. Use ``get_token_store`` to get the store
+    for a user.
+    """
+
+    def __init__(self, user: "django.contrib.auth.models.User"):
+        try:
+            self.social = user.social_auth.get(provider="globus")
+        except social_django.models.UserSocialAuth.DoesNotExist:
+            self.social = None
+        self.extra_data = self.social.extra_data if self.social else {}
+        self.tokens = {tok["resource_server"]: tok
+                       for tok in self.extra_data.get("other_tokens") or []}
+
+    @property
+    def is_globus_user(self) -> bool:
+        return self.social is not None
+
+    def get_token(self, token_name: str) -> t.Optional[dict]:
+        """Get a token by resource server. Tokens for 'auth.globus.org' are
+        stored on the Globus association itself, alongside other tokens."""
+        if token_name == "auth.globus.org":
+            return self.extra_data if self.social else None
+        return self.tokens.get(token_name)
+
+
+# Token stores for the current request, by user pk. See token_store_scope.
+_token_stores = contextvars.ContextVar("globus_portal_framework_token_stores",
+                                       default=None)
+
+
+@contextlib.contextmanager
+def token_store_scope():
+    """
+    Keep token stores loaded by ``get_token_store`` until the end of the
+    block, so each user's tokens are only loaded once. This is used by
+    ``globus_portal_framework.middleware.GlobusTokenStoreMiddleware`` for
+    each request.
+    """
+    reset_token = _token_stores.set({})
+    try:
+        yield
+    finally:
+        _token_stores.reset(reset_token)
+
+
+def get_token_store(user: "django.contrib.auth.models.User") -> GlobusTokenStore:
+    """
+    Get the Globus tokens for a user. Inside ``token_store_scope`` (such as
+    in a request with ``GlobusTokenStoreMiddleware``), tokens are loaded once
+    and kept for the rest of the scope. Otherwise, tokens are loaded each time.
+    :param user: A Django User object. Usually this comes from request.user
+    """
+    stores = _token_stores.get()
+    if stores is None:
+        return GlobusTokenStore(user)
+    store = stores.get(user.pk)
+    if store is None:
+        store = stores[user.pk] = GlobusTokenStore(user)
+    return store
+
+
+def clear_token_store(user: "django.contrib.auth.models.User"):
+    """Forget the tokens loaded for a user in the current scope, so they are
+    loaded again on next use. Call this after changing a user's tokens."""
+    stores = _token_stores.get()
+    if stores is not None:
+        stores.pop(user.pk, None)
 
 
 def is_globus_user(user):
@@ -56,12 +276,7 @@ def is_globus_user(user):
     """
     if user.is_anonymous:
         return False
-
-    try:
-        user.social_auth.get(provider="globus").extra_data
-        return True
-    except social_django.models.UserSocialAuth.DoesNotExist:
-        return False
+    return get_token_store(user).is_globus_user
 
 
 def load_globus_access_token(user: "django.contrib.auth.models.User", token_name: str):
@@ -94,15 +309,17 @@ def load_globus_access_token(user: "django.contrib.auth.models.User", token_name
                     f"User {user} does not have"
                     " a Globus association in social_django.models.UserSocialAuth"
                 )
-        tok_list = user.social_auth.get(provider="globus").extra_data
+        store = get_token_store(user)
         if token_name == "auth.globus.org":
-            return tok_list["access_token"]
-        if tok_list.get("other_tokens"):
-            service_tokens = {t["resource_server"]: t for t in tok_list["other_tokens"]}
+            return store.extra_data["access_token"]
+        if store.tokens:
+            service_tokens = store.tokens
             service_token = service_tokens.get(token_name)
             if service_token:
-                exp_td = timedelta(seconds=service_token["expires_in"])
-                if user.last_login + exp_td < timezone.now():
+                # Tokens without a known expiration are used as-is, and are
+                # rejected by Globus if they have expired.
+                expires = get_token_expiration(user, service_token)
+                if expires is not None and expires < timezone.now():
                     raise ExpiredGlobusToken(token_name=token_name)
                 return service_token["access_token"]
             else:
@@ -113,6 +330,214 @@ def load_globus_access_token(user: "django.contrib.auth.models.User", token_name
                 )
 
 
+def get_user_principals(user: "django.contrib.auth.models.User") -> t.Set[str]:
+    """
+    Get the Globus principals which determine the ``visible_to`` records a user
+    can see in Globus Search. This includes a principal for each identity in
+    the user's identity set, and for each group the user is a member of if the
+    user has a groups token.
+
+    Example:
+        {'urn:globus:auth:identity:c8e9c6f8-...',
+         'urn:globus:groups:id:08d8cd36-...'}
+
+    :param user: A Django User with a Globus association
+    :raises globus_sdk.GlobusError: If user groups could not be fetched
+    :returns: A set of principal URNs
+    """
+    social = get_token_store(user).social
+    if social is None:
+        raise social_django.models.UserSocialAuth.DoesNotExist(
+            f'User {user} has no Globus association')
+    identities = {social.uid}
+    id_token = social.extra_data.get('id_token')
+    if isinstance(id_token, str):
+        try:
+            claims = jwt.get_unverified_claims(id_token)
+            identities.update(i['sub'] for i in claims.get('identity_set', [])
+                              if i.get('sub'))
+        except JWTError as jwte:
+            log.warning(f'Unable to read identity set for {user}: {jwte}')
+    principals = {f'urn:globus:auth:identity:{i}' for i in identities}
+
+    resource_servers = {tok.get('resource_server') for tok in
+                        social.extra_data.get('other_tokens', [])}
+    if 'groups.api.globus.org' in resource_servers:
+        principals.update(f'urn:globus:groups:id:{g["id"]}'
+                          for g in get_user_cached_groups(user))
+    return principals
+
+
+def get_user_group_set_hash(
+        user: "django.contrib.auth.models.User") -> t.Optional[str]:
+    """
+    Get a stable hash of the Globus Groups a user is a member of, using groups
+    cached by ``get_user_cached_groups``. Users in the same groups always
+    produce the same hash, which allows caches to share entries between users
+    on indexes where records are only visible to ``public`` or to groups.
+
+    Identities are not included, so the hash says nothing about records
+    visible to individual identities.
+
+    :param user: A Django User object. Usually this comes from request.user
+    :returns: A hex digest, or None if the user has no Globus association, no
+        groups token, or groups could not be fetched.
+    """
+    if not user or not is_globus_user(user):
+        return None
+    if 'groups.api.globus.org' not in get_token_store(user).tokens:
+        return None
+    try:
+        group_ids = {g['id'] for g in get_user_cached_groups(user)}
+    except (globus_sdk.GlobusError, exc.GlobusPortalException) as e:
+        log.exception(e)
+        return None
+    return hashlib.sha256(
+        '\n'.join(sorted(group_ids)).encode('utf-8')
+    ).hexdigest()
+
+
+def get_token_lifetime(user: "django.contrib.auth.models.User",
+                       token_name: str = 'search.api.globus.org') -> int:
+    """
+    Get the number of seconds until a user's token expires, or zero if the
+    token has already expired or does not exist.
+    :param user: A Django User with a Globus association
+    :param token_name: The name of a token by resource server
+    """
+    store = get_token_store(user)
+    token = store.tokens.get(token_name, store.extra_data)
+    expires = get_token_expiration(user, token)
+    if expires is None:
+        return 0
+    return max(int((expires - timezone.now()).total_seconds()), 0)
+
+
+def get_token_expiration(user: "django.contrib.auth.models.User",
+                         token: dict) -> t.Optional[datetime]:
+    """
+    Get the time a token expires. Tokens from login expire 'expires_in'
+    seconds after the user logged in. Refreshed tokens record the time they
+    expire in 'expires_at_seconds'.
+    :param user: A Django User with a Globus association
+    :param token: A token dict, from ``GlobusTokenStore.get_token``
+    :returns: A timezone aware datetime, or None if the expiration is unknown
+    """
+    if token.get('expires_at_seconds'):
+        return datetime.fromtimestamp(token['expires_at_seconds'],
+                                      tz=dt_timezone.utc)
+    if not token.get('expires_in') or not user.last_login:
+        return None
+    return user.last_login + timedelta(seconds=token['expires_in'])
+
+
+def load_refresh_token_authorizer(user: "django.contrib.auth.models.User",
+                                  token_name: str
+                                  ) -> t.Optional[
+                                      globus_sdk.RefreshTokenAuthorizer]:
+    """
+    Load an authorizer which refreshes a user's access token when it is about
+    to expire, or when a Globus service rejects it. Refreshed tokens are saved
+    with ``save_refreshed_tokens``. This is used by ``load_globus_client`` if
+    ``GLOBUS_TOKEN_REFRESH`` is enabled, and requires users to log in with
+    refresh tokens ('access_type': 'offline').
+    :param user: A Django User object. Usually this comes from request.user
+    :param token_name: The name of a token by resource server
+    :raises ExpiredGlobusToken: If the token expired and could not be
+        refreshed
+    :returns: A RefreshTokenAuthorizer, or None if there is no refresh token
+    """
+    if not user or not user.is_authenticated:
+        return None
+    token = get_token_store(user).get_token(token_name)
+    if not token or not token.get('refresh_token'):
+        return None
+    expires = get_token_expiration(user, token)
+    auth_client = client_pool.load_client(
+        globus_sdk.ConfidentialAppAuthClient,
+        settings.SOCIAL_AUTH_GLOBUS_KEY,
+        settings.SOCIAL_AUTH_GLOBUS_SECRET
+    )
+    # The SDK needs both an access token and its expiration, or neither.
+    # Without both, it gets a new access token right away.
+    current = {}
+    if token.get('access_token') and expires is not None:
+        current = {'access_token': token['access_token'],
+                   'expires_at': int(expires.timestamp())}
+    try:
+        authorizer = globus_sdk.RefreshTokenAuthorizer(
+            token['refresh_token'], auth_client,
+            on_refresh=functools.partial(save_refreshed_tokens, user),
+            **current
+        )
+        # Refresh now if the token has expired, so a failed refresh can
+        # fall back to logging in again (See ExpiredTokenMiddleware)
+        authorizer.ensure_valid_token()
+    except globus_sdk.GlobusAPIError as gapie:
+        log.info(f'Unable to refresh {token_name} tokens for user {user}: '
+                 f'{gapie}')
+        raise ExpiredGlobusToken(token_name=token_name) from gapie
+    return authorizer
+
+
+def load_globus_authorization_header(
+        user: "django.contrib.auth.models.User",
+        token_name: str) -> t.Optional[str]:
+    """
+    Get an Authorization header value for a user's token, for requests made
+    without a Globus SDK client, such as to HTTPS endpoints. If
+    ``GLOBUS_TOKEN_REFRESH`` is enabled, expired tokens are refreshed (see
+    ``load_refresh_token_authorizer``), otherwise the access token from
+    ``load_globus_access_token`` is used.
+
+    Example:
+        >>> headers = {'Authorization': load_globus_authorization_header(
+        ...     request.user, 'transfer.api.globus.org')}
+
+    :param user: A Django User object. Usually this comes from request.user
+    :param token_name: The name of a token by resource server
+    :raises ValueError: If no tokens match the token name given
+    :raises ExpiredGlobusToken: If the token expired and was not refreshed
+    :returns: A header value such as 'Bearer <token>', or None if the user
+        has no token
+    """
+    if get_setting('GLOBUS_TOKEN_REFRESH'):
+        authorizer = load_refresh_token_authorizer(user, token_name)
+        if authorizer is not None:
+            return authorizer.get_authorization_header()
+    token = load_globus_access_token(user, token_name)
+    return f'Bearer {token}' if token else None
+
+
+def save_refreshed_tokens(user: "django.contrib.auth.models.User",
+                          token_response: globus_sdk.OAuthTokenResponse):
+    """
+    Save tokens from a refresh to the user's Globus association. The row is
+    locked while tokens are written, so concurrent refreshes for the same
+    user don't overwrite each other's tokens.
+    :param user: A Django User with a Globus association
+    :param token_response: The response from refreshing tokens
+    """
+    refreshed = {}
+    for resource_server, token in token_response.by_resource_server.items():
+        refreshed[resource_server] = {
+            key: token[key] for key in ('access_token', 'refresh_token',
+                                        'expires_at_seconds')
+            if token.get(key)
+        }
+    with transaction.atomic():
+        social = (social_django.models.UserSocialAuth.objects
+                  .select_for_update().get(user=user, provider='globus'))
+        if 'auth.globus.org' in refreshed:
+            social.extra_data.update(refreshed.pop('auth.globus.org'))
+        for token in social.extra_data.get('other_tokens') or []:
+            token.update(refreshed.get(token['resource_server'], {}))
+        social.save(update_fields=['extra_data'])
+    clear_token_store(user)
+    log.debug(f'Saved refreshed tokens for user {user}: '
+              f'{list(token_response.by_resource_server)}')
+
+
 def load_globus_client(user: "django.contrib.auth.models.User", client: globus_sdk.BaseClient, token_name: str, require_authorized: bool = False) -> globus_sdk.BaseClient:
     """Load a globus client with a given user and the name of the token. If
     the user is Anonymous (Not logged in), then an unauthenticated client is
@@ -130,11 +555,16 @@ def load_globus_client(user: "django.contrib.auth.models.User", client: globus_s
     An 'AnonymousUser' is not logged in, so they will get a regular search
     client and can only search on public data.
     """
+    if get_setting('GLOBUS_TOKEN_REFRESH'):
+        authorizer = load_refresh_token_authorizer(user, token_name)
+        if authorizer is not None:
+            return client_pool.load_client(client, authorizer=authorizer)
     token = load_globus_access_token(user, token_name)
     if token:
-        return client(authorizer=globus_sdk.AccessTokenAuthorizer(token))
+        authorizer = globus_sdk.AccessTokenAuthorizer(token)
+        return client_pool.load_client(client, authorizer=authorizer)
     elif not require_authorized:
-        return client()
+        return client_pool.load_client(client)
     else:
         raise exc.PortalAuthException(
             message='Authenticated User {} has no tokens for {}. Is {} missing '
@@ -177,11 +607,203 @@ def load_transfer_client(user: "django.contrib.auth.models.User") -> globus_sdk.
                        'transfer.api.globus.org', require_authorized=True)
 
 
-def get_user_groups(user: "django.contrib.auth.models.User") -> t.Mapping[str, dict]:
-    """Get all user groups from the groups.api.globus.org service."""
+def get_user_groups(user: "django.contrib.auth.models.User") -> t.List[dict]:
+    """
+    Get all user groups from the groups.api.globus.org service. This always
+    fetches the full response from Globus Groups, see ``get_user_cached_groups``
+    for cached group memberships.
+    """
     groups_client = load_globus_client(user,
                                        globus_sdk.GroupsClient,
                                        'groups.api.globus.org',
                                        require_authorized=True
                                        )
     return groups_client.get_my_groups().data
+
+
+def get_user_cached_groups(
+        user: "django.contrib.auth.models.User") -> t.List[dict]:
+    """
+    Get a user's groups, cached by the user's identity. Groups only include
+    the ids, names, and the user's memberships, see ``compact_user_groups``
+    and ``get_cached_user_groups``.
+    :param user: A Django User with a Globus association
+    :raises globus_sdk.GlobusError: If user groups could not be fetched
+    :returns: A list of compacted groups
+    """
+    social = get_token_store(user).social if user.is_authenticated else None
+    if social is None:
+        return compact_user_groups(get_user_groups(user))
+    return get_cached_user_groups(social.uid,
+                                  functools.partial(get_user_groups, user))
+
+
+def compact_user_groups(groups: t.Iterable[dict]) -> t.List[dict]:
+    """
+    Reduce groups from ``GroupsClient.get_my_groups()`` to the group ids,
+    names, and the user's memberships (identity, username, and role).
+    Everything else in the response, such as policies and descriptions, is
+    dropped.
+    """
+    return [{
+        'id': group['id'],
+        'name': group.get('name'),
+        'my_memberships': [{
+            'identity_id': m.get('identity_id'),
+            'username': m.get('username'),
+            'role': m.get('role'),
+        } for m in group.get('my_memberships') or []],
+    } for group in groups]
+
+
+def get_groups_cache_key(identity_id: str) -> str:
+    return f'dgpf:groups:{identity_id}'
+
+
+def get_cached_user_groups(identity_id: str,
+                           load_groups: t.Callable[[], t.Iterable[dict]],
+                           refresh: bool = False) -> t.List[dict]:
+    """
+    Get a user's groups from the cache named by ``GLOBUS_CACHE_ALIAS``, or
+    call ``load_groups`` to fetch them from Globus Groups. Groups are stored
+    with ``compact_user_groups`` for ``GLOBUS_GROUPS_CACHE_TIMEOUT`` seconds.
+    Within ``GLOBUS_GROUPS_REFRESH_AHEAD`` seconds of expiring, cached groups
+    are still returned but are fetched again in a background thread, so
+    active users rarely wait on Globus Groups.
+    :param identity_id: The Globus identity the groups were fetched for
+    :param load_groups: Fetches groups from ``GroupsClient.get_my_groups()``
+    :param refresh: Always fetch groups, replacing any cached groups
+    :returns: A list of compacted groups
+    """
+    timeout = get_setting('GLOBUS_GROUPS_CACHE_TIMEOUT')
+    cache = caches[get_setting('GLOBUS_CACHE_ALIAS')]
+    key = get_groups_cache_key(identity_id)
+    entry = cache.get(key) if timeout and not refresh else None
+    if entry is None:
+        return _fetch_user_groups(identity_id, load_groups)
+    fetched, groups = entry
+    refresh_ahead = get_setting('GLOBUS_GROUPS_REFRESH_AHEAD')
+    if refresh_ahead and time.time() - fetched > timeout - refresh_ahead:
+        refresh_user_groups_in_background(identity_id, load_groups)
+    return groups
+
+
+def _fetch_user_groups(identity_id: str,
+                       load_groups: t.Callable[[], t.Iterable[dict]]
+                       ) -> t.List[dict]:
+    """
+    Fetch groups and cache them as (time fetched, groups).
+    :meta private:
+    """
+    groups = compact_user_groups(load_groups())
+    timeout = get_setting('GLOBUS_GROUPS_CACHE_TIMEOUT')
+    if timeout:
+        caches[get_setting('GLOBUS_CACHE_ALIAS')].set(
+            get_groups_cache_key(identity_id), (time.time(), groups), timeout)
+    return groups
+
+
+def refresh_user_groups_in_background(
+        identity_id: str, load_groups: t.Callable[[], t.Iterable[dict]]
+) -> t.Optional[threading.Thread]:
+    """
+    Fetch groups for a cached entry in a background thread. A lock is taken
+    in the cache so only one thread across all nodes sharing the cache
+    fetches groups for a user. If the lock is already held, nothing is done.
+    :return: The thread fetching groups, or None if the lock was not taken
+    """
+    key = get_groups_cache_key(identity_id)
+    lock_key = f'{key}:lock'
+    cache = caches[get_setting('GLOBUS_CACHE_ALIAS')]
+    if not cache.add(lock_key, 1, get_setting('GLOBUS_GROUPS_REFRESH_AHEAD')):
+        return None
+
+    def refresh():
+        try:
+            _fetch_user_groups(identity_id, load_groups)
+            log.debug(f'Refreshed cached groups {key}')
+        except Exception as e:
+            log.exception(e)
+        finally:
+            cache.delete(lock_key)
+            connections.close_all()
+
+    thread = threading.Thread(target=refresh, daemon=True)
+    thread.start()
+    return thread
+
+
+def is_allowed_group_member(user: "django.contrib.auth.models.User",
+                            allowed_groups: t.List[dict] = None) -> bool:
+    """
+    Check if a user is a member of any group in
+    ``SOCIAL_AUTH_GLOBUS_ALLOWED_GROUPS``, using groups cached by
+    ``get_user_cached_groups``. Users are always allowed if no groups are
+    set.
+    :param user: A Django User with a Globus association
+    :param allowed_groups: Groups to check instead of
+        ``SOCIAL_AUTH_GLOBUS_ALLOWED_GROUPS``
+    :raises globus_sdk.GlobusError: If user groups could not be fetched
+    """
+    if allowed_groups is None:
+        allowed_groups = getattr(settings, 'SOCIAL_AUTH_GLOBUS_ALLOWED_GROUPS',
+                                 [])
+    if not allowed_groups:
+        return True
+    allowed_ids = {g['uuid'] for g in allowed_groups}
+    return not allowed_ids.isdisjoint(
+        g['id'] for g in get_user_cached_groups(user))
+
+
+def clear_cached_user_groups(identity_id: str):
+    """Remove cached groups for an identity, so they are fetched again."""
+    caches[get_setting('GLOBUS_CACHE_ALIAS')].delete(
+        get_groups_cache_key(identity_id))
+
+
+@receiver(user_logged_out)
+def clear_cached_user_groups_on_logout(sender, user=None, **kwargs):
+    if user is not None and is_globus_user(user):
+        clear_cached_user_groups(get_token_store(user).social.uid)
+
+
+def get_revocation_queue() -> ThreadPoolExecutor:
+    """Get the single background thread used to revoke tokens after users
+    log out, when ``GLOBUS_REVOKE_TOKENS_IN_BACKGROUND`` is set. Jobs wait in
+    its queue and run in order."""
+    global _revocation_queue
+    with _async_executor_lock:
+        if _revocation_queue is None:
+            _revocation_queue = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix='dgpf-revoke')
+        return _revocation_queue
+
+
+def get_async_executor() -> ThreadPoolExecutor:
+    """Get the shared thread pool used by ``run_async``. The pool is created
+    on first use, with at most ``GLOBUS_ASYNC_MAX_WORKERS`` threads."""
+    global _async_executor
+    with _async_executor_lock:
+        if _async_executor is None:
+            _async_executor = ThreadPoolExecutor(
+                max_workers=get_setting('GLOBUS_ASYNC_MAX_WORKERS'),
+                thread_name_prefix='dgpf-async',
+            )
+        return _async_executor
+
+
+async def run_async(func: t.Callable, *args, **kwargs):
+    """
+    Call a blocking Globus SDK function without blocking the event loop. The
+    Globus SDK has no async transport, so calls run on a shared thread pool
+    (see ``get_async_executor``) and the event loop is free to serve other
+    requests while the HTTP request is in flight.
+
+    Example:
+        >>> client = await sync_to_async(load_search_client)(user)
+        >>> await run_async(client.post_search, index_uuid, search_data)
+    """
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    call = functools.partial(context.run, func, *args, **kwargs)
+    return await loop.run_in_executor(get_async_executor(), call)
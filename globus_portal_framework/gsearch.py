@@ -4,30 +4,43 @@ import re
 import json
 import logging
 import math
+import bisect
 import collections
+import collections.abc
 import datetime
+import functools
 import pathlib
-from urllib.parse import quote_plus, unquote_plus
+from urllib.parse import quote_plus, unquote_plus, urlencode, parse_qsl
 
 from django import template
-from django.utils.module_loading import import_string
 from django.conf import settings
+from asgiref.sync import sync_to_async
 import globus_sdk
 
 from globus_portal_framework.apps import get_setting
 from globus_portal_framework import load_search_client, IndexNotFound, exc
+from globus_portal_framework.gclients import run_async
+from globus_portal_framework.cache import (
+    cached_search, cached_subject, acached_search, acached_subject,
+)
+from globus_portal_framework.plans import (
+    get_index_plan, get_facets_plan, get_facet_modifiers, get_fields_plan,
+)
+from globus_portal_framework.dates import (  # noqa: F401
+    get_date_format_type, parse_date_filter, parse_datetime,
+)
 from globus_portal_framework.constants import (
-    FILTER_QUERY_PATTERN, FILTER_TYPES, FILTER_RANGE,
+    FILTER_QUERY_PATTERN, FILTER_TYPES, FILTER_RANGE, FILTER_MATCH_ALL,
     FILTER_DATE_RANGES, FILTER_DEFAULT_RANGE_SEPARATOR,
-    FILTER_DATE_TYPE_PATTERN, DATETIME_PARTIAL_FORMATS,
+    DATETIME_PARTIAL_FORMATS,
     FACET_NAME_PATTERN,
 
     FILTER_YEAR, FILTER_MONTH, FILTER_DAY, FILTER_HOUR, FILTER_MINUTE,
     FILTER_SECOND,
 
-    VALID_SEARCH_FACET_KEYS, VALID_SEARCH_KEYS,
+    VALID_SEARCH_FACET_KEYS,
 
-    DEFAULT_FACET_MODIFIERS, DEFAULT_SEARCH_VERSION
+    DEFAULT_FACET_MODIFIERS,
 )
 FILTER_RANGE_SEPARATOR = getattr(settings, 'FILTER_RANGE_SEPARATOR',
                                  FILTER_DEFAULT_RANGE_SEPARATOR)
@@ -35,7 +48,6 @@ FILTER_RANGE_SEPARATOR = getattr(settings, 'FILTER_RANGE_SEPARATOR',
 
 log = logging.getLogger(__name__)
 filter_query_matcher = re.compile(FILTER_QUERY_PATTERN)
-filter_date_matcher = re.compile(FILTER_DATE_TYPE_PATTERN)
 facet_name_matcher = re.compile(FACET_NAME_PATTERN)
 
 
@@ -84,48 +96,99 @@ def post_search(index, query, filters, user=None, page=1, search_kwargs=None):
 
     client = load_search_client(user)
     index_data = get_index(index)
-    search_data = {k: index_data[k] for k in VALID_SEARCH_KEYS
-                   if k in index_data}
-    version = search_data.get('@version', DEFAULT_SEARCH_VERSION)
+    search_data = _get_search_data(index, query, filters, page,
+                                   search_kwargs)
+    try:
+        result = cached_search(
+            index, search_data, user,
+            lambda: client.post_search(index_data['uuid'], search_data)
+        )
+        return _process_search_result(index_data, result, filters)
+    except globus_sdk.SearchAPIError as sapie:
+        return _search_error(sapie, index_data, user, search_data)
+
+
+async def apost_search(index, query, filters, user=None, page=1,
+                       search_kwargs=None):
+    """Async version of ``post_search``, for use in async views. The request
+    to Globus Search is made with ``globus_portal_framework.gclients.run_async``
+    so the event loop is not blocked while waiting on Globus Search. ``user``
+    must already be loaded from the database, since lazy loading is not
+    allowed in async code."""
+    if not index or not query:
+        return {'search_results': [], 'facets': []}
+
+    client = await sync_to_async(load_search_client)(user)
+    index_data = get_index(index)
+    search_data = _get_search_data(index, query, filters, page,
+                                   search_kwargs)
+    try:
+        result = await acached_search(
+            index, search_data, user,
+            lambda: run_async(client.post_search, index_data['uuid'],
+                              search_data)
+        )
+        return _process_search_result(index_data, result, filters)
+    except globus_sdk.SearchAPIError as sapie:
+        return _search_error(sapie, index_data, user, search_data)
+
+
+def _get_search_data(index, query, filters, page, search_kwargs):
+    """
+    Build the search body sent to Globus Search by post_search
+    :meta private:
+    """
+    search_data = get_index_plan(index).new_search_data()
     search_data.update({
-        '@version': version,
         'q': query,
-        'facets': prepare_search_facets(index_data.get('facets', [])),
         'filters': filters,
         'offset': (int(page) - 1) * get_setting('SEARCH_RESULTS_PER_PAGE'),
         'limit': get_setting('SEARCH_RESULTS_PER_PAGE')
     })
     search_data.update(search_kwargs or {})
-    try:
-        result = client.post_search(index_data['uuid'], search_data)
-        return {
-            'search_results': process_search_data(index_data.get('fields', []),
-                                                  result.data['gmeta']),
-            'facets': get_facets(result, index_data.get('facets', []),
-                                 filters, index_data.get('filter_match'),
-                                 index_data.get('facet_modifiers', [])),
-            'pagination': get_pagination(result.data['total'],
-                                         result.data['offset']),
-            'count': result.data['count'],
-            'offset': result.data['offset'],
-            'total': result.data['total'],
-            }
-    except globus_sdk.SearchAPIError as sapie:
-        log.exception(sapie)
-        etext = ('There was an error in {}, you can file '
-                 'an issue here:\n{}\nWith the following data: \n\n')
-        gs = 'https://github.com/globusonline/globus-search/issues'
-        dgpf = 'https://github.com/globus/django-globus-portal-framework'
-        if str(sapie.http_status).startswith('5'):
-            error = etext.format('Globus Search', gs)
-        else:
-            error = etext.format('Globus Portal Framework', dgpf)
-        full_error = '{}Index ID: {}\nAuthenticated? {}\nParams: \n{}'.format(
-            error, index_data['uuid'],
-            user.is_authenticated if user else False,
-            json.dumps(search_data, indent=2)
-        )
-        log.error(full_error)
+    return search_data
+
+
+def _process_search_result(index_data, result, filters):
+    """
+    Process a Globus Search response into the context returned by post_search
+    :meta private:
+    """
+    return {
+        'search_results': process_search_data(index_data.get('fields', []),
+                                              result.data['gmeta'],
+                                              get_lazy_fields(index_data)),
+        'facets': get_facets(result, index_data.get('facets', []),
+                             filters, index_data.get('filter_match'),
+                             index_data.get('facet_modifiers', [])),
+        'pagination': get_pagination(result.data['total'],
+                                     result.data['offset']),
+        'count': result.data['count'],
+        'offset': result.data['offset'],
+        'total': result.data['total'],
+        }
+
+
+def _search_error(sapie, index_data, user, search_data):
+    """
+    Log a Globus Search error and return the error context for post_search
+    :meta private:
+    """
+    log.exception(sapie)
+    etext = ('There was an error in {}, you can file '
+             'an issue here:\n{}\nWith the following data: \n\n')
+    gs = 'https://github.com/globusonline/globus-search/issues'
+    dgpf = 'https://github.com/globus/django-globus-portal-framework'
+    if str(sapie.http_status).startswith('5'):
+        error = etext.format('Globus Search', gs)
+    else:
+        error = etext.format('Globus Portal Framework', dgpf)
+    full_error = '{}Index ID: {}\nAuthenticated? {}\nParams: \n{}'.format(
+        error, index_data['uuid'],
+        user.is_authenticated if user else False,
+        json.dumps(search_data, indent=2)
+    )
+    log.error(full_error)
     return {'error': 'There was an error in your search, please try a '
             'different query or contact your administrator.'}
 
@@ -176,6 +239,161 @@ def get_search_filters(
     return filters
 
 
+def get_canonical_filters(filters):
+    """
+    Normalize filters from get_search_filters() so equivalent searches give
+    the same list. Values are de-duplicated and sorted, and filters are sorted
+    by field name and type. 'match_all' filters on the same field are combined,
+    since results need to match every value either way. Other filter types
+    are kept separate, since combining them would change the results. Filters
+    with other keys (such as nested 'not' filters) are kept as they are.
+    :param filters: A list of filters for Globus Search
+    :return: A new list of filters
+    """
+    def sort_key(value):
+        return json.dumps(value, sort_keys=True, default=str)
+
+    canonical, other = [], []
+    match_all = {}
+    for uf in filters:
+        if not set(uf).issubset({'field_name', 'type', 'values'}):
+            other.append(uf)
+            continue
+        values = list(uf.get('values', []))
+        if uf['type'] == FILTER_TYPES[FILTER_MATCH_ALL]:
+            if uf['field_name'] in match_all:
+                match_all[uf['field_name']]['values'].extend(values)
+                continue
+            uf = match_all[uf['field_name']] = dict(uf)
+        else:
+            uf = dict(uf)
+        uf['values'] = values
+        canonical.append(uf)
+    for uf in canonical:
+        unique = {sort_key(v): v for v in uf['values']}
+        uf['values'] = [unique[k] for k in sorted(unique)]
+    return (sorted(canonical, key=sort_key) +
+            sorted(other, key=sort_key))
+
+
+def get_canonical_query_params(
+        request,
+        filter_match_default=get_setting('DEFAULT_FILTER_MATCH')
+        ):
+    """
+    Get normalized query params for a search, so the same search always
+    has the same URL. Params are sorted and values de-duplicated, only the
+    last 'page' is kept and 'page=1' is dropped, and 'filter.<field_name>' is
+    spelled out with its filter type, such as 'filter-match-all.<field_name>'.
+    If spelling it out would combine two params for a filter type other than
+    match-all, the params are left as they are, since combining them would
+    change the results.
+    :param request: The Django request for a search
+    :param filter_match_default: The filter type used for 'filter.' params
+    :return: A list of (key, value) tuples
+    """
+    params = collections.defaultdict(set)
+    sources = collections.defaultdict(set)
+    for key in request.GET.keys():
+        values = request.GET.getlist(key)
+        if key == 'page':
+            # Searches use the last page, like request.GET.get('page')
+            values = values[-1:]
+        match = filter_query_matcher.match(key)
+        if match:
+            filter_type = (match.groupdict().get('filter_type') or
+                           filter_match_default)
+            _, filter_name = key.split('.', maxsplit=1)
+            canonical_key = get_search_filter_query_key(filter_name,
+                                                        filter_type)
+            if filter_type != FILTER_MATCH_ALL:
+                sources[canonical_key].add(key)
+        elif key == 'page' and values == ['1']:
+            continue
+        else:
+            canonical_key = key
+        params[canonical_key].update(values)
+    for canonical_key, keys in sources.items():
+        if len(keys) > 1:
+            del params[canonical_key]
+            for key in keys:
+                params[key].update(request.GET.getlist(key))
+    return [(key, value) for key in sorted(params)
+            for value in sorted(params[key])]
+
+
+def get_canonical_query_string(
+        request,
+        filter_match_default=get_setting('DEFAULT_FILTER_MATCH')
+        ):
+    """
+    Get one normalized query string for a search, see
+    get_canonical_query_params().
+    :param request: The Django request for a search
+    :param filter_match_default: The filter type used for 'filter.' params
+    :return: A url encoded query string, without a leading '?'
+    """
+    return urlencode(get_canonical_query_params(request,
+                                                filter_match_default))
+
+
+def get_canonical_search_url(request):
+    """
+    Get the canonical URL for a search, see get_canonical_query_string().
+    Only the decoded params are compared, so a URL which encodes the same
+    params differently (such as 'q=*' or 'q=a%20b') is already canonical.
+    :param request: The Django request for a search
+    :return: The canonical URL, or None if the request URL is already
+        canonical.
+    """
+    params = get_canonical_query_params(request)
+    current = parse_qsl(request.META.get('QUERY_STRING', ''),
+                        keep_blank_values=True)
+    if params == current:
+        return None
+    query_string = urlencode(params)
+    return f'{request.path}?{query_string}' if query_string else request.path
+
+
+def set_search_session(request, index, query):
+    """
+    Record the user's last search in their session, to fill in context such
+    as the 'Back To Search' link on a result detail page. The session is
+    stored as:
+
+    .. code-block:: python
+
+        request.session['search'] = {
+            'full_query': 'filter-match-all.foo=bar&q=baz',
+            'query': 'baz',
+            'index': 'myindex',
+        }
+
+    ``full_query`` is the canonical query string for the search, see
+    get_canonical_query_string(). The session is only written if the search
+    changed, so repeating a search doesn't save the session again. If
+    ``SEARCH_SESSION_ANONYMOUS`` is False, nothing is recorded for anonymous
+    users.
+
+    :param request: The Django request for a search
+    :param index: The name of the index (key in SEARCH_INDEXES)
+    :param query: The query for the search
+    :return: True if the session was changed, False otherwise
+    """
+    if (not get_setting('SEARCH_SESSION_ANONYMOUS') and
+            not request.user.is_authenticated):
+        return False
+    search = {
+        'full_query': get_canonical_query_string(request),
+        'query': query,
+        'index': index,
+    }
+    if request.session.get('search') == search:
+        return False
+    request.session['search'] = search
+    return True
+
+
 def get_date_range_for_date(date_str, interval):
     """
     Given a date string, parse it and derive a range based on the given
@@ -309,7 +527,8 @@ def generate_globus_search_facet_name(facet_definition, order_index):
                                     facet_definition['field_name'])
 
 
-def resolve_facet_results(portal_defined_facets, facet_results):
+def resolve_facet_results(portal_defined_facets, facet_results,
+                          facets_plan=None):
     """
     Resolve and combine the results from Globus Search to the portal defined
     facets. Resolution is done via parsing the ID generated by
@@ -320,13 +539,15 @@ def resolve_facet_results(portal_defined_facets, facet_results):
     Returns a list of portal defined facets with additional results from Globus
     search added: unique_name, buckets, and value. The ordering exactly matches
     the ordering of facets defined in settings.py
+
+    :param facets_plan: The compiled plan for ``portal_defined_facets``, see
+        ``globus_portal_framework.plans``. Found automatically if not given.
     """
-    # Set general facet information. prepare_search_facets will ensure we get
-    # all GS fields and the dev didn't leave anything out in the definition.
-    facets = prepare_search_facets(portal_defined_facets)
-    for prepped_facet, def_facet in zip(facets, portal_defined_facets):
-        prepped_facet['unique_name'] = prepped_facet.pop('name')
-        prepped_facet['name'] = def_facet.get('name', def_facet['field_name'])
+    # Set general facet information. The plan was compiled with
+    # prepare_search_facets, which ensures we get all GS fields and the dev
+    # didn't leave anything out in the definition.
+    facets_plan = facets_plan or get_facets_plan(portal_defined_facets)
+    facets = [fplan.new_result() for fplan in facets_plan.facets]
 
     # Set all of the facet results that came back from Globus Search on the
     # facets defined above.
@@ -338,8 +559,7 @@ def resolve_facet_results(portal_defined_facets, facet_results):
             # the user. Working facets will still be rendered. This should
             # Probably never happen unless we want to support custom facet id
             # generation, a feature probably nobody would be interested in.
-            pfacets = prepare_search_facets(portal_defined_facets)
-            names = ', '.join([pf['name'] for pf in pfacets])
+            names = ', '.join([fp.unique_name for fp in facets_plan.facets])
             log.error('Facet "{}" from Globus Search did not match any '
                       'configured facets: {}'.format(fresult['name'], names))
             continue
@@ -412,15 +632,39 @@ def get_template(index: str, base_template: str):
     but is instead used by views that want to return custom views for
     different indices.
 
+    Templates are only looked up the first time they are used for an index,
+    and the result is kept in the index plan's ``template_manifest``. When
+    ``DEBUG`` is on, templates are looked up every time so new overrides are
+    found without restarting the server.
+
     :param index: The string representing this search index
     :param base_template: The string for the template
     :return: The overridden template if it exists, or the base_template if an
         override does not exist.
     """
+    if settings.DEBUG:
+        return find_template_override(get_index(index), base_template)
+    manifest = get_index_plan(index).template_manifest
+    template_override = manifest.get(base_template)
+    if template_override is None:
+        template_override = manifest[base_template] = find_template_override(
+            get_index(index), base_template)
+    return template_override
+
+
+def find_template_override(index_data, base_template):
+    """
+    Look up the index-overridden template for ``base_template`` with the
+    template loaders. See ``get_template``, which caches the result.
+
+    :param index_data: The index settings from SEARCH_INDEXES
+    :param base_template: The string for the template
+    :return: The overridden template if it exists, or the base_template if an
+        override does not exist.
+    """
     template_override = base_template
     try:
-        idata = get_index(index)
-        base_dir = idata.get('template_override_dir', '')
+        base_dir = index_data.get('template_override_dir', '')
         to = os.path.join(base_dir, base_template)
         # Raises TemplateDoesNotExist if it cannot find the template
         template.loader.get_template(to)
@@ -454,88 +698,356 @@ def get_subject(index, subject, user=None):
     client = load_search_client(user)
     try:
         idata = get_index(index)
-        result = client.get_subject(idata['uuid'], unquote_plus(subject))
-        return process_search_data(idata.get('fields', {}), [result.data])[0]
+        result = cached_subject(
+            index, subject, user,
+            lambda: client.get_subject(idata['uuid'], unquote_plus(subject))
+        )
+        return process_search_data(idata.get('fields', {}), [result.data],
+                                   get_lazy_fields(idata))[0]
+    except globus_sdk.SearchAPIError:
+        return {'subject': subject, 'error': 'No data was found for subject'}
+
+
+async def aget_subject(index, subject, user=None):
+    """
+    Async version of ``get_subject``, for use in async views. ``user`` must
+    already be loaded from the database, since lazy loading is not allowed
+    in async code.
+    """
+    client = await sync_to_async(load_search_client)(user)
+    try:
+        idata = get_index(index)
+        result = await acached_subject(
+            index, subject, user,
+            lambda: run_async(client.get_subject, idata['uuid'],
+                              unquote_plus(subject))
+        )
+        return process_search_data(idata.get('fields', {}), [result.data],
+                                   get_lazy_fields(idata))[0]
     except globus_sdk.SearchAPIError:
         return {'subject': subject, 'error': 'No data was found for subject'}
 
 
-def _get_dotted_path(item, key):
+class batch:
+    """
+    Mark a field function as a batch mapper. Batch mappers are called once
+    for a whole page of search results instead of once for each result, so
+    expensive setup (such as a bulk lookup or vectorizing with NumPy) only
+    happens once. Batch and regular mappers can be mixed in the same
+    ``fields`` list.
+
+    The function receives a list with the content of each result on the
+    page, where each item is the same list a regular field function
+    receives. It must return a list with one value per result, in the same
+    order.
+
+    Example:
+        >>> def size_gb(page):
+        ...     return [c[0]['size'] / 1e9 for c in page]
+        >>> 'fields': [('size_gb', batch(size_gb))]
+    """
+
+    def __init__(self, func):
+        self.func = func
+        functools.update_wrapper(self, func)
+
+    def __call__(self, page):
+        return self.func(page)
+
+    def __repr__(self):
+        return f'batch({self.func!r})'
+
+
+class LazyField:
+    """
+    A field value which is computed the first time it is used, then
+    remembered. Django templates call it automatically when rendered.
+    """
+    __slots__ = ('func', 'args', 'value', 'evaluated')
+
+    def __init__(self, func, *args):
+        self.func = func
+        self.args = args
+        self.value = None
+        self.evaluated = False
+
+    def __call__(self):
+        if not self.evaluated:
+            self.value = self.func(*self.args)
+            self.evaluated = True
+            self.func = self.args = None
+        return self.value
+
+    def __repr__(self):
+        if self.evaluated:
+            return f'LazyField({self.value!r})'
+        return 'LazyField(<not evaluated>)'
+
+
+class LazyResult(dict):
+    """
+    A processed search result where fields are computed on first access,
+    returned by ``process_search_data`` for indexes with ``lazy_fields``
+    set. Fields which are never used (such as by a template) are never
+    computed. Accessing a field with ``[]``, ``get()``, ``items()`` or
+    ``values()`` returns the computed value, and ``json.dumps(result)``
+    serializes computed values.
+
+    Copies made with ``dict(result)``, ``{**result}`` or ``dict.update()``
+    skip these methods, so fields which were not computed yet are copied as
+    ``LazyField`` placeholders. This keeps Django template contexts built from
+    a result lazy, and templates call placeholders automatically. Elsewhere,
+    use ``resolve()`` to get a plain dict of computed values.
+    """
+
+    def __getitem__(self, key):
+        value = super().__getitem__(key)
+        if isinstance(value, LazyField):
+            value = value()
+            super().__setitem__(key, value)
+        return value
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def items(self):
+        return [(key, self[key]) for key in self]
+
+    def values(self):
+        return [self[key] for key in self]
+
+    def pop(self, key, *default):
+        value = super().pop(key, *default)
+        return value() if isinstance(value, LazyField) else value
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def copy(self):
+        return LazyResult(super().copy())
+
+    def resolve(self) -> dict:
+        """Compute all fields, and return them as a plain dict"""
+        return dict(self.items())
+
+    def __eq__(self, other):
+        return self.resolve() == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        return repr(self.resolve())
+
+    def __reduce__(self):
+        return LazyResult, (self.resolve(),)
+
+
+def _batch_item(page_values, idx):
     """
-    Helper function to retrieve a field under a nested key, eg ("title", "citation.title")
+    Get the value for a single result from a lazy batch field
     :meta private:
     """
-    if item is None:
-        # ES schema allows for a field to simply be missing (or its nested pieces)
-        # If we get a dotted path and the segment is empty, report that fact
-        return None
-    elif not isinstance(item, dict):
-        raise ValueError('Cannot fetch key from primitive value')
-    elif key in item:
-        # Though discouraged, ES does allow a field name to contain dots. Exact top level match will be preferred.
-        return item[key]
-    else:
-        parts = key.split('.', maxsplit=1)
-        if len(parts) > 1:
-            return _get_dotted_path(item.get(parts[0]), parts[1])
-        else:
+    return page_values()[idx]
+
+
+def get_lazy_fields(index_data):
+    """Check if fields should be computed lazily for an index, set with
+    ``lazy_fields`` in SEARCH_INDEXES or ``SEARCH_LAZY_FIELDS`` globally."""
+    return index_data.get('lazy_fields', get_setting('SEARCH_LAZY_FIELDS'))
+
+
+def compile_field_mapper(mapper):
+    """
+    Compile a single field mapper from the 'fields' setting in
+    SEARCH_INDEXES into a (field_name, accessor, is_batch) tuple. Regular
+    accessors take (default_content, content) for a search result and return
+    the field value. Batch accessors take the content of each result on a
+    page and return a list of values. Returns None if the mapper will never
+    produce a field. See ``process_search_data``.
+    """
+    if isinstance(mapper, str):
+        return mapper, lambda default_content, content: (
+            default_content.get(mapper)), False
+    elif isinstance(mapper, collections.abc.Iterable) and len(mapper) == 2:
+        field_name, map_approach = mapper
+        if isinstance(map_approach, str):
+            return (field_name, _compile_dotted_path(field_name, map_approach),
+                    False)
+        elif isinstance(map_approach, batch):
+            return field_name, _compile_batch(field_name, map_approach), True
+        elif callable(map_approach):
+            return (field_name, _compile_function(field_name, map_approach),
+                    False)
+    return None
+
+
+def compile_field_mappers(field_mappers):
+    """
+    Compile field mappers from the 'fields' setting in SEARCH_INDEXES.
+    Fields which overwrite previous fields are logged here, once, instead of
+    for each search result.
+    :return: A tuple of (field_name, accessor, is_batch) tuples
+    """
+    compiled = []
+    names = {'subject', 'all'}
+    for mapper in field_mappers:
+        field = compile_field_mapper(mapper)
+        if field is None:
+            continue
+        if field[0] in names:
+            log.warning('{} defined by {} overwrite previous fields in '
+                        'search.'.format([field[0]], mapper))
+        names.add(field[0])
+        compiled.append(field)
+    return tuple(compiled)
+
+
+def _compile_dotted_path(field_name, key):
+    """
+    Compile a dotted path, eg "citation.title", into an accessor for a nested
+    field. The path is split ahead of time into each nesting level.
+    :meta private:
+    """
+    # At each level, ES allows a field name to contain dots. Exact matches on
+    # the remaining path are preferred before descending a level.
+    steps = []
+    remaining = key
+    while '.' in remaining:
+        head, rest = remaining.split('.', maxsplit=1)
+        steps.append((remaining, head))
+        remaining = rest
+    last = remaining
+
+    def get_field(default_content, content):
+        item = default_content
+        try:
+            for path, head in steps:
+                if item is None:
+                    # ES schema allows for a field to simply be missing (or
+                    # its nested pieces)
+                    return None
+                elif not isinstance(item, dict):
+                    raise ValueError('Cannot fetch key from primitive value')
+                elif path in item:
+                    return item[path]
+                item = item.get(head)
+            if item is None:
+                return None
+            elif not isinstance(item, dict):
+                raise ValueError('Cannot fetch key from primitive value')
             # Once at the right nesting level, missing values are ok
-            return item.get(key)
+            return item.get(last)
+        except ValueError:
+            log.exception(f'No key at specified nesting level for field "{field_name}"')
+            return None
+    return get_field
+
 
-def process_search_data(field_mappers, results):
+def _compile_function(field_name, func):
+    """
+    Wrap a user defined field function, logging any errors it raises
+    :meta private:
+    """
+    def get_field(default_content, content):
+        try:
+            return func(content)
+        except Exception:
+            log.exception(f'Error rendering content for field "{field_name}"')
+            return None
+    return get_field
+
+
+def _compile_batch(field_name, func):
+    """
+    Wrap a batch field function, logging any errors it raises. If the
+    function fails, the field is None for every result on the page.
+    :meta private:
+    """
+    def get_fields(page):
+        try:
+            values = list(func(page))
+        except Exception:
+            log.exception(f'Error rendering content for field "{field_name}"')
+            return [None] * len(page)
+        if len(values) != len(page):
+            log.error(f'Batch field "{field_name}" returned {len(values)} '
+                      f'values for {len(page)} results')
+            return [None] * len(page)
+        return values
+    return get_fields
+
+
+def process_search_data(field_mappers, results, lazy=False):
     """
     Process results in a general search result, running the mapping function
     for each result and preparing other general data for being shown in
     templates (such as quoting the subject and including the index).
+
+    Field mappers are compiled once per index, see
+    ``globus_portal_framework.plans``.
     :param results: List of GMeta results, which would be the r.data['gmeta']
     in from a simple query to Globus Search. See here:
     https://docs.globus.org/api/search/schemas/GMetaResult/
+    :param lazy: Return LazyResults, which only compute each field the first
+    time it is used.
     :return: A list of search results:
     """
-    structured_results = []
+    fields_plan = get_fields_plan(field_mappers)
+    page = []
     for gmeta_result in results:
 
         entries = gmeta_result['entries']
         content = [e['content'] for e in entries]
-        result = {
-            'subject': quote_plus(gmeta_result['subject']),
-            'all': content
-        }
 
         if len(content) == 0:
             log.warning('Subject {} contained no content, skipping...'.format(
                 gmeta_result['subject']
             ))
             continue
-        default_content = content[0]
+        page.append((gmeta_result['subject'], content))
+
+    if fields_plan.batch:
+        contents = [content for _, content in page]
+        batch_values = [
+            (LazyField(accessor, contents) if lazy else accessor(contents))
+            if is_batch else None
+            for _, accessor, is_batch in fields_plan.fields
+        ]
+    else:
+        batch_values = [None] * len(fields_plan.fields)
 
-        for mapper in field_mappers:
-            field = {}
-            if isinstance(mapper, str):
-                field = {mapper: default_content.get(mapper)}
-            elif isinstance(mapper, collections.abc.Iterable) \
-                    and len(mapper) == 2:
-                field_name, map_approach = mapper
-                if isinstance(map_approach, str):
-                    try:
-                        field = {field_name: _get_dotted_path(default_content, map_approach)}
-                    except ValueError:
-                        log.exception(f'No key at specified nesting level for field "{field_name}"')
-                        field = {field_name: None}
-                elif callable(map_approach):
-                    try:
-                        field = {field_name: map_approach(content)}
-                    except Exception:
-                        log.exception(f'Error rendering content for field "{field_name}"')
-                        field = {field_name: None}
-
-            overwrites = [name for name in field.keys()
-                          if name in result.keys()]
-            if overwrites:
-                log.warning('{} defined by {} overwrite previous fields in '
-                            'search.'.format(overwrites, mapper))
-
-            result.update(field)
+    structured_results = []
+    for idx, (subject, content) in enumerate(page):
+        default_content = content[0]
+        result = {
+            'subject': quote_plus(subject),
+            'all': content
+        }
+        if lazy:
+            result = LazyResult(result)
+            for (field_name, accessor, is_batch), values in zip(
+                    fields_plan.fields, batch_values):
+                if is_batch:
+                    result[field_name] = LazyField(_batch_item, values, idx)
+                else:
+                    result[field_name] = LazyField(accessor, default_content,
+                                                   content)
+            structured_results.append(result)
+            continue
+        for (field_name, accessor, is_batch), values in zip(fields_plan.fields,
+                                                            batch_values):
+            if is_batch:
+                result[field_name] = values[idx]
+            else:
+                result[field_name] = accessor(default_content, content)
         structured_results.append(result)
     return structured_results
 
@@ -602,69 +1114,6 @@ def serialize_gsearch_range(gsearch_range):
                            gsearch_range['to'])
 
 
-def get_date_format_type(date_str):
-    """
-    Given a date_str, derive the date information contained within the date_str
-    The return value is based on the following map:
-    'year': 'YYYY'
-    'month': 'YYYY-MM'
-    'day': 'YYYY-MM-DD'
-    'time': 'YYYY-MM-DD hh:mm:ss'
-    and will return 'year', 'month', 'day' or 'time'
-
-    Examples:
-        '2019' will return 'day'
-        '2018-01-20 12:30:34' will return 'time'
-    If you want a parsed datetime object, see 'parse_date_filter()' instead.
-    """
-    date_str = str(date_str)
-    match = filter_date_matcher.match(date_str)
-    if not match:
-        return None
-    date_matches = match.groupdict()
-    date_format_set = {dt for dt, value in date_matches.items()
-                       if value is not None}
-    date_format_types = [
-        ('year', {'year'}),
-        ('month', {'year', 'month'}),
-        ('day', {'year', 'month', 'day'}),
-        ('time', {'year', 'month', 'day', 'time'}),
-    ]
-    for name, dft_set in date_format_types:
-        if dft_set == date_format_set:
-            return name
-
-
-def parse_date_filter(serialized_date):
-    """
-    Given a serialized_date (ex: '2019-12-02'), return a dict containing
-    the following info:
-    {
-      'value': serialized_date,
-      'type': 'day',
-      'datetime': <datetime.datetime object>
-    }
-    The date string given can match any date string format types handled by
-    get_date_format_type()
-    :param serialized_date: a date string, ex: '2019-12-02'
-    :return: A dict containing the date string given, whether the date is a
-    year, month, day or time type date, and a datetime object.
-    """
-    # coerce date into str, in case the date was pased as a number, eg 2020
-    sdate = str(serialized_date)
-    dt_fmt_type = get_date_format_type(sdate)
-    dt_fmt_str = DATETIME_PARTIAL_FORMATS.get(dt_fmt_type)
-    if dt_fmt_str:
-        return {
-            'value': serialized_date,
-            'type': dt_fmt_type,
-            'datetime': datetime.datetime.strptime(sdate, dt_fmt_str)
-        }
-    raise exc.InvalidRangeFilter(code='FilterParseError',
-                                 message='Unable to parse {}'
-                                         ''.format(sdate))
-
-
 def parse_range_filter_bounds(range_filter):
     """
     Low level utility to parse the lower or upper range of a given range filter
@@ -809,6 +1258,215 @@ def get_active_filters(facet_field_name, filter_type, user_filters):
     return filter_vals
 
 
+_MISSING = object()
+
+
+class Facet(collections.abc.MutableMapping):
+    """
+    A facet prepared for display by ``get_facets``. Facets behave like the
+    dicts returned by ``resolve_facet_results``, so they work the same way in
+    templates and facet modifiers. The facet's field name, filter type, and
+    filter query key are kept here once, instead of on every ``Bucket``.
+
+    Use ``to_dict()`` to get plain dicts, such as before serializing facets
+    to JSON. Pickled facets store buckets as tuples, without any of their
+    shared keys.
+    """
+    __slots__ = ('data', 'field_name', 'filter_type', 'query_key')
+
+    def __init__(self, data, filter_type=None, query_key=None):
+        self.data = data
+        self.field_name = data.get('field_name')
+        self.filter_type = filter_type
+        self.query_key = query_key
+
+    def __getitem__(self, key):
+        return self.data[key]
+
+    def __setitem__(self, key, value):
+        self.data[key] = value
+
+    def __delitem__(self, key):
+        del self.data[key]
+
+    def __iter__(self):
+        return iter(self.data)
+
+    def __len__(self):
+        return len(self.data)
+
+    def __repr__(self):
+        return repr(self.to_dict())
+
+    def to_dict(self) -> dict:
+        """Get the facet and its buckets as plain dicts"""
+        facet = dict(self.data)
+        if facet.get('buckets') is not None:
+            facet['buckets'] = [dict(b) for b in facet['buckets']]
+        return facet
+
+    def __reduce__(self):
+        data = dict(self.data)
+        if data.get('buckets') is not None:
+            data['buckets'] = [b.to_tuple() if isinstance(b, Bucket) else b
+                               for b in data['buckets']]
+        return _unpickle_facet, (data, self.filter_type, self.query_key)
+
+
+def _unpickle_facet(data, filter_type, query_key):
+    """
+    Rebuild a pickled Facet, see ``Facet.__reduce__``
+    :meta private:
+    """
+    facet = Facet(data, filter_type, query_key)
+    if data.get('buckets') is not None:
+        data['buckets'] = [Bucket(facet, *b) if isinstance(b, tuple) else b
+                           for b in data['buckets']]
+    return facet
+
+
+class Bucket(collections.abc.MutableMapping):
+    """
+    A facet bucket prepared for display by ``get_facets``. Buckets behave like
+    dicts with the keys: count, value, search_filter_query_key, field_name,
+    filter_type, checked, and datetime. Only the count, value, checked, and
+    datetime are stored on the bucket. The rest are read from its ``Facet``.
+    Any other keys set on a bucket (such as by a facet modifier) are kept in
+    ``extra``.
+    """
+    __slots__ = ('facet', 'count', 'value', 'checked', 'datetime', 'extra')
+    keys_order = ('count', 'value', 'search_filter_query_key', 'field_name',
+                  'filter_type', 'checked', 'datetime')
+    facet_keys = {
+        'search_filter_query_key': 'query_key',
+        'field_name': 'field_name',
+        'filter_type': 'filter_type',
+    }
+
+    def __init__(self, facet, count, value, checked=False, datetime=None,
+                 extra=None):
+        self.facet = facet
+        self.count = count
+        self.value = value
+        self.checked = checked
+        self.datetime = datetime
+        self.extra = extra
+
+    def __getitem__(self, key):
+        if self.extra is not None and key in self.extra:
+            value = self.extra[key]
+        elif key in self.facet_keys:
+            value = getattr(self.facet, self.facet_keys[key])
+        elif key in self.keys_order:
+            value = getattr(self, key)
+        else:
+            raise KeyError(key)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        if key in self.keys_order and key not in self.facet_keys:
+            setattr(self, key, value)
+        else:
+            if self.extra is None:
+                self.extra = {}
+            self.extra[key] = value
+
+    def __delitem__(self, key):
+        self[key]
+        if key in self.keys_order:
+            self[key] = _MISSING
+        else:
+            del self.extra[key]
+
+    def __iter__(self):
+        for key in self.keys_order:
+            try:
+                self[key]
+            except KeyError:
+                continue
+            yield key
+        if self.extra is not None:
+            for key, value in self.extra.items():
+                if key not in self.keys_order and value is not _MISSING:
+                    yield key
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return repr(self.to_dict())
+
+    def to_dict(self) -> dict:
+        """Get the bucket as a plain dict"""
+        return dict(self)
+
+    def to_tuple(self) -> tuple:
+        """Get the bucket as a tuple, without any keys from the facet"""
+        bucket = (self.count, self.value, self.checked, self.datetime)
+        return bucket + (self.extra,) if self.extra else bucket
+
+    def __reduce__(self):
+        return Bucket, (self.facet,) + self.to_tuple()
+
+
+def _group_active_filters(user_filters):
+    """
+    Group values for user filters by (field_name, Globus Search filter type),
+    so filters for each facet can be found without scanning every filter.
+    :meta private:
+    """
+    grouped = collections.defaultdict(list)
+    for uf in user_filters:
+        grouped[(uf['field_name'], uf['type'])].extend(uf.get('values', []))
+    return grouped
+
+
+def _compile_bucket_check(filter_type, filter_vals):
+    """
+    Compile the raw values of active filters for a facet into a function
+    which tells whether a bucket value is 'checked'. See get_active_filters()
+    for how filters are compared against buckets. Terms and ranges are
+    checked with set membership, and date buckets by bisecting the merged,
+    sorted date ranges of the filters.
+    :meta private:
+    """
+    if not filter_vals:
+        return lambda value: False
+    if filter_type in FILTER_DATE_RANGES:
+        ranges = sorted((parse_datetime(f['from']), parse_datetime(f['to']))
+                        for f in filter_vals)
+        starts, ends = [], []
+        for start, end in ranges:
+            if start >= end:
+                continue
+            if ends and start <= ends[-1]:
+                ends[-1] = max(ends[-1], end)
+            else:
+                starts.append(start)
+                ends.append(end)
+
+        def is_checked(dt):
+            idx = bisect.bisect_right(starts, dt) - 1
+            return idx >= 0 and dt < ends[idx]
+        return is_checked
+
+    if filter_type == FILTER_RANGE:
+        filter_vals = [serialize_gsearch_range(r) for r in filter_vals]
+    try:
+        values = frozenset(filter_vals)
+    except TypeError:
+        values = filter_vals
+
+    def is_checked(value):
+        try:
+            return value in values
+        except TypeError:
+            return value in filter_vals
+    return is_checked
+
+
 def get_facets(search_result, portal_defined_facets, filters,
                filter_match=None, facet_modifiers=None):
     """Prepare facets for display. Globus Search data is removed from results
@@ -832,7 +1490,8 @@ def get_facets(search_result, portal_defined_facets, filters,
     a single parameter for the list of facets. Each function is called in the
     order it is defined.
 
-    :return: A list of facets. An example is here:
+    :return: A list of facets, as ``Facet`` objects containing ``Bucket``
+        objects. Both can be used like dicts. An example is here:
         [
             {
             'name': 'Contributor'
@@ -865,9 +1524,14 @@ def get_facets(search_result, portal_defined_facets, filters,
         ]
 
     """
+    facets_plan = get_facets_plan(portal_defined_facets, filter_match)
     facets = resolve_facet_results(portal_defined_facets,
-                                   search_result.data.get('facet_results', []))
-    for facet in facets:
+                                   search_result.data.get('facet_results', []),
+                                   facets_plan)
+    active_filters = _group_active_filters(filters)
+    for idx, fplan in enumerate(facets_plan.facets):
+        facet = facets[idx] = Facet(facets[idx], fplan.filter_type,
+                                    fplan.query_key)
         # Some facet types, like avg and sum, don't have buckets. Skip them
         # completely.
         buckets = facet.get('buckets')
@@ -876,49 +1540,41 @@ def get_facets(search_result, portal_defined_facets, filters,
 
         # Get the filter type, and any active filters for this category.
         # active_filters will determine which buckets are 'checked'
-        filter_type = get_facet_filter_type(facet, default_terms=filter_match)
-        active_filter_vals = get_active_filters(facet['field_name'],
-                                                filter_type, filters)
+        filter_type = fplan.filter_type
+        is_checked = _compile_bucket_check(
+            filter_type,
+            active_filters.get((facet.field_name, fplan.search_filter_type),
+                               []))
+        is_range = filter_type == FILTER_RANGE
+        is_date = filter_type in FILTER_DATE_RANGES
+
+        # Only keep data relevant to the search, dropping any extra Globus
+        # Search keys. Filtering info is shared through the facet.
+        prepared = []
         for bucket in buckets:
-            # Remove any extra Globus Search keys, only keep data relevant
-            # to the search.
-            for extraneous_key in set(bucket).difference({'count', 'value'}):
-                bucket.pop(extraneous_key)
-
-            # Add filtering info to the bucket, and any extra general context
-            bucket.update({
-                'search_filter_query_key': get_search_filter_query_key(
-                    facet['field_name'], filter_type),
-                'field_name': facet['field_name'],
-                'filter_type': filter_type,
-            })
-
+            value = bucket['value']
             # If the bucket value is a range, serialize it
-            if filter_type == FILTER_RANGE:
-                bucket['value'] = serialize_gsearch_range(bucket['value'])
-
+            if is_range:
+                value = serialize_gsearch_range(value)
             # Set "Checked" Value, and datetime if applicable
-            if filter_type in FILTER_DATE_RANGES:
-                buck_dt = parse_date_filter(bucket['value'])['datetime']
-                bucket['checked'] = any([
-                    buck_dt >= afilter['from'] and buck_dt < afilter['to']
-                    for afilter in active_filter_vals
-                ])
-                bucket['datetime'] = buck_dt
+            if is_date:
+                buck_dt = parse_datetime(value)
+                prepared.append(Bucket(facet, bucket.get('count'), value,
+                                       is_checked(buck_dt), buck_dt))
             else:
-                bucket['checked'] = bucket['value'] in active_filter_vals
-                bucket['datetime'] = None
+                prepared.append(Bucket(facet, bucket.get('count'), value,
+                                       is_checked(value)))
+        facet['buckets'] = prepared
     # Apply user modifications to all finished facets. Catch ALL facet mod
     # exceptions. Typically, this happens due to an edge case in the modifier,
     # and should not result in the search page failing to load.
     facet_modifiers = (facet_modifiers if facet_modifiers is not None
                        else DEFAULT_FACET_MODIFIERS)
-    for fmodder in facet_modifiers:
+    # Raises ImportError for bad modifiers. Don't catch these, developer error.
+    modifiers = get_facet_modifiers(facet_modifiers)
+    for fmodder, modifier in zip(facet_modifiers, modifiers):
         try:
-            facets = import_string(fmodder)(facets)
-        except ImportError:
-            # Don't catch these. Developer error.
-            raise
+            facets = modifier(facets)
         except Exception as e:
             log.exception(e)
             log.error('Facet modifier raised exception {}'.format(fmodder))
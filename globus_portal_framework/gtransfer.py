@@ -9,7 +9,7 @@ from globus_portal_framework import (
     PreviewPermissionDenied, PreviewServerError, PreviewException,
     PreviewBinaryData, PreviewNotFound, ExpiredGlobusToken,
 
-    load_transfer_client, load_globus_access_token
+    load_transfer_client, load_globus_authorization_header
 )
 
 log = logging.getLogger(__name__)
@@ -183,8 +183,8 @@ def preview(user, url, scope, chunk_size=512):
     * PreviewException -- Something else we didn't expect
     """
     try:
-        token = load_globus_access_token(user, scope)
-        headers = {'Authorization': 'Bearer {}'.format(token)}
+        authorization = load_globus_authorization_header(user, scope)
+        headers = {'Authorization': authorization} if authorization else {}
         # Use 'with' with 'stream' so we close the connection after we return.
         with requests.get(url, stream=True, headers=headers) as r:
             if r.status_code == 200:
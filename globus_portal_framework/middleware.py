@@ -4,9 +4,19 @@ from django.http.response import HttpResponseRedirect
 from django.utils.deprecation import MiddlewareMixin
 from django.urls import reverse
 from django.contrib import auth
+from django.conf import settings
+from django.core.cache import caches
+import globus_sdk
 from social_core.exceptions import AuthForbidden
 
-from globus_portal_framework.exc import ExpiredGlobusToken
+from globus_portal_framework.exc import (
+    ExpiredGlobusToken, GlobusPortalException,
+)
+from globus_portal_framework.apps import get_setting
+from globus_portal_framework.gclients import (
+    token_store_scope, is_globus_user, is_allowed_group_member,
+    get_token_store, get_groups_cache_key,
+)
 
 log = logging.getLogger(__name__)
 
@@ -19,6 +29,9 @@ class ExpiredTokenMiddleware(MiddlewareMixin):
     be logged into Globus, and so this will manifest as a request that takes
     slightly longer than usual, as it does all the OAuth redirects to grab
     tokens then does the work the user originally intended.
+
+    If ``GLOBUS_TOKEN_REFRESH`` is enabled, expired tokens are refreshed
+    instead, and users are only redirected if tokens could not be refreshed.
     """
 
     def process_exception(self, request, exception):
@@ -74,3 +87,78 @@ class GlobusAuthExceptionMiddleware(MiddlewareMixin):
         strategy.session_set('session_required_identities', req_ids_string)
         return HttpResponseRedirect(reverse('social:begin',
                                             kwargs={'backend': 'globus'}))
+
+
+class GlobusTokenStoreMiddleware(MiddlewareMixin):
+    """
+    Load each user's Globus tokens at most once per request. Without this,
+    every client loaded with ``load_globus_client`` (such as the search,
+    transfer, and groups clients on a detail page) queries Python Social Auth
+    for the user's tokens again. See
+    ``globus_portal_framework.gclients.get_token_store``.
+    """
+
+    def __call__(self, request):
+        with token_store_scope():
+            return super().__call__(request)
+
+    async def __acall__(self, request):
+        with token_store_scope():
+            return await super().__acall__(request)
+
+
+class GlobusAllowedGroupsMiddleware(MiddlewareMixin):
+    """
+    Check that logged in users are still members of a group in
+    SOCIAL_AUTH_GLOBUS_ALLOWED_GROUPS, which is otherwise only checked at
+    login. Users who are no longer members are logged out and redirected to
+    the allowed-groups page.
+
+    Memberships are checked with groups cached by
+    ``globus_portal_framework.gclients.get_user_cached_groups``, so removing
+    a user from a group takes effect within ``GLOBUS_GROUPS_CACHE_TIMEOUT``
+    seconds.
+    Cached groups are refreshed in the background shortly before they
+    expire, so active users don't wait on Globus Groups. If groups can't be
+    fetched, such as for users who logged in without a groups token, users
+    are allowed through and the error is logged once per
+    ``GLOBUS_GROUPS_CACHE_TIMEOUT``.
+    """
+
+    def process_request(self, request):
+        allowed_groups = getattr(settings, 'SOCIAL_AUTH_GLOBUS_ALLOWED_GROUPS',
+                                 [])
+        user = request.user
+        if (not allowed_groups or not user.is_authenticated or
+                not is_globus_user(user)):
+            return
+        store = get_token_store(user)
+        if 'groups.api.globus.org' not in store.tokens:
+            self.log_groups_error(
+                store.social.uid, f'User {user} has no groups token, '
+                                  f'unable to check allowed groups.')
+            return
+        try:
+            if is_allowed_group_member(user, allowed_groups):
+                return
+        except (globus_sdk.GlobusError, GlobusPortalException,
+                ValueError) as e:
+            self.log_groups_error(
+                store.social.uid, f'Unable to check allowed groups for user '
+                                  f'{user}: {e}')
+            return
+        log.info(f'User {user} is no longer a member of any allowed group, '
+                 f'logging out.')
+        auth.logout(request)
+        return HttpResponseRedirect(reverse('allowed-groups'))
+
+    def log_groups_error(self, identity_id, message):
+        """Log a warning the first time groups can't be checked for a user
+        within ``GLOBUS_GROUPS_CACHE_TIMEOUT``, and at debug level after."""
+        cache = caches[get_setting('GLOBUS_CACHE_ALIAS')]
+        timeout = get_setting('GLOBUS_GROUPS_CACHE_TIMEOUT')
+        key = f'{get_groups_cache_key(identity_id)}:error'
+        if timeout and not cache.add(key, 1, timeout):
+            log.debug(message)
+        else:
+            log.warning(message)
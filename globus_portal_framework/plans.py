@@ -0,0 +1,258 @@
+"""
+Compile SEARCH_INDEXES into immutable plans for each index.
+
+Index settings don't change while a portal is running, so everything derived
+from them is computed once instead of on every search: facets prepared for
+Globus Search, the static parts of the search body, filter types and query
+keys for each facet, imported facet modifier modules, accessor functions
+for each field in 'fields', and which templates are overridden. Plans are
+compiled when the app is ready, and recompiled if settings change (such as
+with ``override_settings`` in tests).
+
+Plans are read-only. Use ``IndexPlan.new_search_data()`` and
+``FacetPlan.new_result()`` to get fresh copies for a single request.
+"""
+import dataclasses
+import importlib
+import logging
+import threading
+import typing as t
+
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from globus_portal_framework.apps import get_setting
+from globus_portal_framework.constants import (
+    VALID_SEARCH_KEYS, DEFAULT_SEARCH_VERSION, DEFAULT_FACET_MODIFIERS,
+    FILTER_TYPES,
+)
+
+log = logging.getLogger(__name__)
+
+# Plans are recompiled if any of these settings change
+PLAN_SETTINGS = {'SEARCH_INDEXES', 'DEFAULT_FILTER_MATCH', 'TEMPLATES'}
+
+_lock = threading.Lock()
+_index_plans = {}
+_facet_modifiers = {}
+
+
+@dataclasses.dataclass(frozen=True)
+class FacetPlan:
+    """A single facet definition, compiled for processing facet results"""
+    name: str
+    unique_name: str
+    field_name: str
+    search_facet: dict
+    filter_type: t.Optional[str]
+    query_key: t.Optional[str]
+    search_filter_type: t.Optional[str]
+
+    def new_result(self) -> dict:
+        """Start a new facet result for Globus Search facet results"""
+        facet = dict(self.search_facet)
+        facet['unique_name'] = facet.pop('name')
+        facet['name'] = self.name
+        return facet
+
+
+@dataclasses.dataclass(frozen=True)
+class FacetsPlan:
+    """
+    A list of facet definitions compiled with a default filter match. The
+    original ``definitions`` are kept to find the plan for a list of facets
+    passed to ``globus_portal_framework.gsearch.get_facets``.
+    """
+    definitions: list
+    filter_match: t.Optional[str]
+    facets: t.Tuple[FacetPlan, ...]
+
+    def search_facets(self) -> t.List[dict]:
+        """Get a new copy of the facets to send to Globus Search"""
+        return [dict(f.search_facet) for f in self.facets]
+
+
+@dataclasses.dataclass(frozen=True)
+class FieldsPlan:
+    """
+    Field mappers from the 'fields' setting, compiled into (field_name,
+    accessor, is_batch) tuples. See ``gsearch.compile_field_mapper``.
+    ``batch`` is True if any field is a batch mapper.
+    """
+    definitions: list
+    fields: t.Tuple[t.Tuple[str, t.Callable, bool], ...]
+    batch: bool
+
+
+@dataclasses.dataclass(frozen=True)
+class IndexPlan:
+    """An index from SEARCH_INDEXES compiled for searching"""
+    index: str
+    data: dict
+    search_template: dict
+    facets_plan: FacetsPlan
+    facet_modifiers: t.Tuple[str, ...]
+    fields_plan: FieldsPlan
+    # Templates resolved by gsearch.get_template, filled in as they are used.
+    # Maps base template names to the template used for this index.
+    template_manifest: t.Dict[str, str] = dataclasses.field(
+        default_factory=dict, compare=False, repr=False)
+
+    def new_search_data(self) -> dict:
+        """Get a new search body with all static parts filled in. Only the
+        query, filters, offset, and limit are left for the request."""
+        search_data = dict(self.search_template)
+        search_data['facets'] = self.facets_plan.search_facets()
+        return search_data
+
+
+def compile_facets_plan(definitions: list,
+                        filter_match: str = None) -> FacetsPlan:
+    """Compile facet definitions from SEARCH_INDEXES into a FacetsPlan"""
+    # gsearch depends on this module, import here to avoid a circular import
+    from globus_portal_framework import gsearch
+    facets = []
+    prepared = gsearch.prepare_search_facets(definitions)
+    for definition, search_facet in zip(definitions, prepared):
+        filter_type = gsearch.get_facet_filter_type(definition,
+                                                    default_terms=filter_match)
+        query_key = None
+        if filter_type:
+            query_key = gsearch.get_search_filter_query_key(
+                definition['field_name'], filter_type)
+        facets.append(FacetPlan(
+            name=definition.get('name', definition['field_name']),
+            unique_name=search_facet['name'],
+            field_name=definition['field_name'],
+            search_facet=search_facet,
+            filter_type=filter_type,
+            query_key=query_key,
+            search_filter_type=FILTER_TYPES.get(filter_type),
+        ))
+    return FacetsPlan(definitions=definitions, filter_match=filter_match,
+                      facets=tuple(facets))
+
+
+def compile_fields_plan(definitions: list) -> FieldsPlan:
+    """Compile the 'fields' setting from SEARCH_INDEXES into a FieldsPlan"""
+    from globus_portal_framework import gsearch
+    fields = gsearch.compile_field_mappers(definitions)
+    return FieldsPlan(definitions=definitions, fields=fields,
+                      batch=any(is_batch for _, _, is_batch in fields))
+
+
+def compile_index_plan(index: str) -> IndexPlan:
+    """Compile an index from SEARCH_INDEXES into an IndexPlan. Raises
+    IndexNotFound if the index does not exist."""
+    from globus_portal_framework import gsearch
+    index_data = gsearch.get_index(index)
+    search_template = {k: index_data[k] for k in VALID_SEARCH_KEYS
+                       if k in index_data}
+    search_template.setdefault('@version', DEFAULT_SEARCH_VERSION)
+    facets_plan = compile_facets_plan(index_data.get('facets', []),
+                                      index_data.get('filter_match'))
+    modifiers = tuple(index_data.get('facet_modifiers',
+                                     DEFAULT_FACET_MODIFIERS))
+    # Import modifiers now, so errors surface when the index is compiled
+    get_facet_modifiers(modifiers)
+    return IndexPlan(
+        index=index,
+        data=index_data,
+        search_template=search_template,
+        facets_plan=facets_plan,
+        facet_modifiers=modifiers,
+        fields_plan=compile_fields_plan(index_data.get('fields', [])),
+    )
+
+
+def compile_index_plans() -> t.Mapping[str, IndexPlan]:
+    """Compile plans for all indexes in SEARCH_INDEXES. Indexes which fail
+    to compile are logged, and retried the next time they are used."""
+    for index in get_setting('SEARCH_INDEXES') or {}:
+        try:
+            get_index_plan(index)
+        except Exception as e:
+            log.exception(e)
+            log.error(f'Failed to compile search index "{index}"')
+    return dict(_index_plans)
+
+
+def get_index_plan(index: str) -> IndexPlan:
+    """Get the compiled plan for an index, compiling it if needed"""
+    plan = _index_plans.get(index)
+    if plan is None:
+        with _lock:
+            plan = _index_plans.get(index)
+            if plan is None:
+                plan = _index_plans[index] = compile_index_plan(index)
+    return plan
+
+
+def get_facets_plan(definitions: list,
+                    filter_match: str = None) -> FacetsPlan:
+    """Get the compiled plan for a list of facet definitions. If the
+    definitions are from an index in SEARCH_INDEXES, the plan compiled for
+    that index is returned. Otherwise, a new plan is compiled."""
+    for plan in list(_index_plans.values()):
+        fplan = plan.facets_plan
+        if (fplan.definitions is definitions and
+                fplan.filter_match == filter_match):
+            return fplan
+    return compile_facets_plan(definitions, filter_match)
+
+
+def get_fields_plan(definitions: list) -> FieldsPlan:
+    """Get the compiled plan for field mappers. If the field mappers are
+    from an index in SEARCH_INDEXES, the plan compiled for that index is
+    returned. Otherwise, a new plan is compiled."""
+    for plan in list(_index_plans.values()):
+        if plan.fields_plan.definitions is definitions:
+            return plan.fields_plan
+    return compile_fields_plan(definitions)
+
+
+def get_facet_modifiers(import_strings: t.Iterable[str]
+                        ) -> t.Tuple[t.Callable, ...]:
+    """Resolve facet modifier import strings into functions. Modules are only
+    imported once, but functions are looked up on each call so they can still
+    be patched (such as in tests). Raises ImportError if a modifier could not
+    be imported."""
+    key = tuple(import_strings)
+    modules = _facet_modifiers.get(key)
+    if modules is None:
+        modules = _facet_modifiers[key] = tuple(
+            _import_module(modifier) for modifier in key)
+    modifiers = []
+    for module, attr in modules:
+        try:
+            modifiers.append(getattr(module, attr))
+        except AttributeError as err:
+            raise ImportError(f'Module "{module.__name__}" does not define '
+                              f'a "{attr}" attribute') from err
+    return tuple(modifiers)
+
+
+def _import_module(import_str: str):
+    """
+    Import the module for a dotted path, and return (module, attribute name)
+    :meta private:
+    """
+    try:
+        module_path, attr = import_str.rsplit('.', 1)
+    except ValueError as err:
+        raise ImportError(f"{import_str} doesn't look like a module "
+                          f"path") from err
+    return importlib.import_module(module_path), attr
+
+
+def clear_plans():
+    """Clear all compiled plans, so they are compiled again on next use"""
+    with _lock:
+        _index_plans.clear()
+        _facet_modifiers.clear()
+
+
+@receiver(setting_changed)
+def clear_plans_on_setting_changed(setting, **kwargs):
+    if setting in PLAN_SETTINGS:
+        clear_plans()
@@ -76,6 +76,13 @@ SEARCH_INDEXES = {
 }
 
 GLOBUS_CLIENT_LOADER = 'globus_portal_framework.gclients.load_globus_client'
+# Max threads used by async views for blocking Globus SDK calls
+GLOBUS_ASYNC_MAX_WORKERS = 32
+# Globus SDK clients share connections in each process. Keep up to this many
+# open connections per Globus service, and drop them after this many idle
+# seconds. A pool size of 0 disables connection pooling.
+GLOBUS_CLIENT_POOL_SIZE = 10
+GLOBUS_CLIENT_POOL_KEEPALIVE = 60
 
 SEARCH_RESULTS_PER_PAGE = 10
 SEARCH_MAX_PAGES = 10
@@ -85,8 +92,57 @@ SEARCH_MAX_PAGES = 10
 # if there is a lot of search data in the index, as searches will take a while
 DEFAULT_QUERY = '*'
 DEFAULT_FILTER_MATCH = FILTER_MATCH_ALL
+# Compute each field in 'fields' the first time a template uses it, instead
+# of computing every field for every result. Indexes can override this with
+# 'lazy_fields' in SEARCH_INDEXES.
+SEARCH_LAZY_FIELDS = False
+# Redirect searches to one canonical URL, so the same search isn't split
+# across many URLs in caches (such as a CDN). Filter params are sorted and
+# de-duplicated, 'filter.' is spelled out with its type, and 'page=1' is
+# dropped.
+SEARCH_CANONICAL_REDIRECT = False
+# Record the last search in the session of anonymous users, for 'Back To
+# Search' links. Set to False to avoid creating sessions for anonymous users.
+SEARCH_SESSION_ANONYMOUS = True
+
+# Cache Globus Search responses with the Django cache named below. Timeouts
+# are in seconds, and a timeout of 0 disables caching. Stale entries are
+# served for SEARCH_CACHE_STALE_TIMEOUT more seconds while one request
+# refreshes them in the background. Indexes can override these with
+# 'cache_timeout', 'cache_stale_timeout' and 'cache_max_entry_size'.
+SEARCH_CACHE_ALIAS = 'default'
+SEARCH_CACHE_TIMEOUT = 0
+SEARCH_CACHE_STALE_TIMEOUT = 0
+SEARCH_CACHE_MAX_ENTRY_SIZE = 1024 * 1024
+# Max seconds a background refresh may hold its lock on a stale entry
+SEARCH_CACHE_LOCK_TIMEOUT = 30
 
 GLOBUS_NON_USERS_ALLOWED_PUBLIC_ACCESS = True
+# Refresh expired Globus tokens instead of sending users through login again.
+# Requires refresh tokens, see 'access_type' in
+# SOCIAL_AUTH_GLOBUS_AUTH_EXTRA_ARGUMENTS. Users without refresh tokens are
+# still sent to login when their tokens expire.
+GLOBUS_TOKEN_REFRESH = False
+# Tokens are revoked when users log out. Revoke them in a background thread
+# so logout returns right away, and retry revocations that fail with server
+# or network errors this many times.
+GLOBUS_REVOKE_TOKENS_IN_BACKGROUND = False
+GLOBUS_REVOKE_TOKENS_RETRIES = 2
+
+# Django cache used for small per-user Globus data, such as each user's
+# Globus Groups memberships.
+GLOBUS_CACHE_ALIAS = 'default'
+# Seconds to cache each user's Globus Groups memberships. Groups are always
+# fetched again when a user logs in, and dropped when they log out. Set to 0
+# to fetch groups from Globus on each use.
+GLOBUS_GROUPS_CACHE_TIMEOUT = 300
+# Cached groups are fetched again in the background when they are used within
+# this many seconds of expiring.
+GLOBUS_GROUPS_REFRESH_AHEAD = 60
+# Seconds to cache the Globus Auth OpenID Connect configuration and signing
+# keys used at login, in GLOBUS_CACHE_ALIAS and in each process. Keys are
+# always fetched again if an unknown key is used.
+GLOBUS_OIDC_CACHE_TIMEOUT = 24 * 60 * 60
 
 PREVIEW_DATA_SIZE = 2048
 
@@ -138,6 +194,8 @@ MIDDLEWARE = [
     'globus_portal_framework.middleware.GlobusAuthExceptionMiddleware',
     # Redirect to auth page if expired tokens, then back to original page
     'globus_portal_framework.middleware.ExpiredTokenMiddleware',
+    # Load each user's Globus tokens only once per request
+    'globus_portal_framework.middleware.GlobusTokenStoreMiddleware',
 ]
 
 AUTHENTICATION_BACKENDS = [
@@ -172,6 +230,10 @@ SOCIAL_AUTH_GLOBUS_SCOPE = [
 #     'globus_portal_framework.middleware.GlobusAuthExceptionMiddleware'
 #     This redirects the user for expected exceptions, you need to handle these
 #     exceptions yourself if you don't add this.
+# Optional: Add to MIDDLEWARE the following to also check groups after login:
+#     'globus_portal_framework.middleware.GlobusAllowedGroupsMiddleware'
+#     Users who leave all groups are logged out within
+#     GLOBUS_GROUPS_CACHE_TIMEOUT seconds.
 # SOCIAL_AUTH_GLOBUS_ALLOWED_GROUPS = [
 #     {
 #         'name': 'Portal Users Group',
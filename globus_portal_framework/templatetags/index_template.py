@@ -60,6 +60,9 @@ You specify index templates in the base template using the following:
 In the example above, ``search-base.html`` will attempt to load ``<index_name>/globus-portal-framework/v3/components/search-results.html``
 and will fall back on ``globus-portal-framework/v3/components/search-results.html`` if an index-specific template does
 not exist.
+
+Which templates are overridden for each index is only looked up once, and then remembered until the server restarts.
+With ``DEBUG = True``, templates are looked up every time, so new override templates are picked up right away.
 """
 import re
 import logging
@@ -205,6 +205,10 @@ def search(request: HttpRequest, index: str) -> HttpResponse:
     Example request:
     http://myhost/?q=foo*&page=2&filter.my.special.filter=goodresults
     """
+    if get_setting('SEARCH_CANONICAL_REDIRECT'):
+        canonical_url = gsearch.get_canonical_search_url(request)
+        if canonical_url:
+            return redirect(canonical_url)
     context = {}
     query = gsearch.get_search_query(request)
     if query:
@@ -212,12 +216,7 @@ def search(request: HttpRequest, index: str) -> HttpResponse:
         context['search'] = gsearch.post_search(
             index, query, filters, request.user, request.GET.get('page', 1)
         )
-        request.session['search'] = {
-            'full_query': urlparse(request.get_full_path()).query,
-            'query': query,
-            'filters': filters,
-            'index': index,
-        }
+        gsearch.set_search_session(request, index, query)
         error = context['search'].get('error')
         if error:
             messages.error(request, error)
@@ -231,7 +230,8 @@ def search_debug(request, index):
     results = gsearch.post_search(index, query, filters, request.user, 1)
     context = {
         'search': results,
-        'facets': dumps(results['facets'], indent=2)
+        # Facets and buckets are mappings, dump them as plain dicts
+        'facets': dumps(results['facets'], indent=2, default=dict)
     }
     tvers = gsearch.get_template_path('search-debug.html', index=index)
     return render(request, gsearch.get_template(index, tvers), context)
@@ -451,14 +451,9 @@ def allowed_groups(request: HttpRequest) -> HttpResponse:
     context = {'allowed_groups': copy.deepcopy(portal_groups)}
     if request.user.is_authenticated:
         try:
-            groups_client = gclients.load_globus_client(
-                    request.user,
-                    globus_sdk.GroupsClient,
-                    'groups.api.globus.org',
-                    require_authorized=True
-            )
             user_groups = {
-                g['id']: g for g in groups_client.get_my_groups()
+                g['id']: g
+                for g in gclients.get_user_cached_groups(request.user)
             }
             for group in context['allowed_groups']:
                 if user_groups.get(group['uuid']):
@@ -1,30 +1,69 @@
 import logging
 import typing as t
-from urllib.parse import urlparse
 import django
+from asgiref.sync import sync_to_async
 from django.views.generic import View
+from django.utils.functional import cached_property
 from django.conf import settings
-from django.shortcuts import render
+from django.shortcuts import render, redirect
 from django.contrib import messages
 import globus_sdk
+from globus_portal_framework.apps import get_setting
 from globus_portal_framework.gsearch import (
     get_template,
+    get_canonical_search_url,
+    set_search_session,
     get_search_filters,
     get_facets,
     get_search_query,
     process_search_data,
+    get_lazy_fields,
     get_index,
-    prepare_search_facets,
     get_pagination,
     get_subject,
+    aget_subject,
 )
-from globus_portal_framework.gclients import load_search_client
+from globus_portal_framework.gclients import load_search_client, run_async
+from globus_portal_framework.cache import cached_search, acached_search
+from globus_portal_framework.plans import get_index_plan
 import globus_portal_framework.exc
 
 
 log = logging.getLogger(__name__)
 
 
+class SearchState:
+    """
+    The parsed search for a single request to a SearchView, built once by
+    ``SearchView.search_state`` and used by all of its hooks. Values are
+    taken from the view's ``query``, ``filters``, ``page``, ``offset``,
+    ``sort``, and ``facets`` properties, so overriding those still works.
+
+    Subclass this and set ``search_state_class`` on your view to keep any
+    extra values derived from the request in one place:
+
+    .. code-block:: python
+
+        class MySearchState(SearchState):
+            def __init__(self, view):
+                super().__init__(view)
+                self.show_hidden = view.request.GET.get("hidden") == "true"
+
+        class MySearchView(SearchView):
+            search_state_class = MySearchState
+    """
+
+    def __init__(self, view: "SearchView"):
+        self.request = view.request
+        self.index = view.kwargs.get("index")
+        self.query = view.query
+        self.filters = view.filters
+        self.page = view.page
+        self.offset = view.offset
+        self.sort = view.sort
+        self.facets = view.facets
+
+
 class SearchView(View):
     """
     Customize components of a search during different phases of receiving a
@@ -41,12 +80,19 @@ class SearchView(View):
     """
 
     DEFAULT_TEMPLATE = "globus-portal-framework/v2/search.html"
+    search_state_class = SearchState
 
     def __init__(self, template: str = None, results_per_page: int = 10):
         super().__init__()
         self.template = template or self.DEFAULT_TEMPLATE
         self.results_per_page = results_per_page
 
+    @cached_property
+    def search_state(self) -> SearchState:
+        """The parsed search for this request, built once with
+        ``search_state_class``"""
+        return self.search_state_class(self)
+
     @property
     def query(self) -> t.Mapping[str, str]:
         """Process the query using ``globus_portal_framework.gsearch.get_search_query``"""
@@ -59,10 +105,11 @@ class SearchView(View):
 
     @property
     def facets(self) -> t.Mapping[str, str]:
-        """Get facets using ``globus_portal_framework.gsearch.prepare_search_facets``"""
+        """Get facets prepared for Globus Search from the compiled index plan,
+        see ``globus_portal_framework.plans``"""
         index = self.kwargs.get("index")
         if index:
-            return prepare_search_facets(get_index(index).get("facets"))
+            return get_index_plan(index).facets_plan.search_facets()
         return []
 
     @property
@@ -97,20 +144,45 @@ class SearchView(View):
     ) -> t.Mapping[str, str]:
         """If you want to inject or modify any parameters in the
         globus_sdk.SearchClient.post_search function, you can override this
-        function."""
-        return client.post_search(index_uuid, search_client_data)
+        function. If search caching is enabled for the index, the response is
+        cached here using the final ``search_client_data``, so pass any
+        modified search body to ``super().post_search`` to keep caching."""
+        return cached_search(
+            self.kwargs.get("index"),
+            search_client_data,
+            self.request.user,
+            lambda: client.post_search(index_uuid, search_client_data),
+        )
+
+    def get_search_data(self) -> t.Mapping[str, str]:
+        """Build the search body sent to Globus Search"""
+        state = self.search_state
+        return {
+            "q": state.query,
+            "filters": state.filters,
+            "facets": state.facets,
+            "offset": state.offset,
+            "sort": state.sort,
+            "limit": self.results_per_page,
+        }
+
+    def get_canonical_redirect(self) -> t.Optional[django.http.HttpResponse]:
+        """If SEARCH_CANONICAL_REDIRECT is set, get a redirect to the canonical
+        URL for this search. Returns None if the URL is already canonical, see
+        ``globus_portal_framework.gsearch.get_canonical_search_url``"""
+        if get_setting("SEARCH_CANONICAL_REDIRECT"):
+            canonical_url = get_canonical_search_url(self.request)
+            if canonical_url:
+                return redirect(canonical_url)
+        return None
 
     def set_search_session_data(self, index: str):
         """Set some metadata about the search in the user's session. This will
         record some data about their last search to fill in some basic DGPF
         context, such as the 'Back To Search' link on a result detail page.
+        See ``globus_portal_framework.gsearch.set_search_session``.
         """
-        self.request.session["search"] = {
-            "full_query": urlparse(self.request.get_full_path()).query,
-            "query": self.query,
-            "filters": self.filters,
-            "index": index,
-        }
+        set_search_session(self.request, index, self.search_state.query)
 
     def process_result(
         self, index_info: t.Mapping[str, str], search_result: t.Mapping[str, str]
@@ -122,12 +194,14 @@ class SearchView(View):
         return {
             "search": {
                 "search_results": process_search_data(
-                    index_info.get("fields", []), search_result.data["gmeta"]
+                    index_info.get("fields", []),
+                    search_result.data["gmeta"],
+                    get_lazy_fields(index_info),
                 ),
                 "facets": get_facets(
                     search_result,
                     index_info.get("facets", []),
-                    self.filters,
+                    self.search_state.filters,
                     index_info.get("filter_match"),
                     index_info.get("facet_modifiers"),
                 ),
@@ -143,19 +217,11 @@ class SearchView(View):
     def get_context_data(self, index: str) -> t.Mapping[str, str]:
         """calls post_search and process_result. If there is an error, returns
         a context with a single 'error' var and logs the exception."""
-        data = {
-            "q": self.query,
-            "filters": self.filters,
-            "facets": self.facets,
-            "offset": self.offset,
-            "sort": self.sort,
-            "limit": self.results_per_page,
-        }
+        data = self.get_search_data()
         try:
             index_info = self.get_index_info(index)
-            result = self.post_search(
-                self.get_search_client(), index_info["uuid"], data
-            )
+            client = self.get_search_client()
+            result = self.post_search(client, index_info["uuid"], data)
             return self.process_result(index_info, result)
         except globus_portal_framework.exc.ExpiredGlobusToken:
             # Don't catch this exception. Middleware will automatically
@@ -180,6 +246,9 @@ class SearchView(View):
         If there is an error, a Django message is sent which can be rendered
         by templates that support them.
         """
+        canonical_redirect = self.get_canonical_redirect()
+        if canonical_redirect:
+            return canonical_redirect
         context = self.get_context_data(index)
         self.set_search_session_data(index)
         error = context.get("error")
@@ -209,3 +278,94 @@ class DetailView(View):
         globus_portal_framework.gsearch.get_template."""
         context = self.get_context_data(index, subject)
         return render(request, get_template(index, self.template), context)
+
+
+async def aload_user(request: django.http.HttpRequest):
+    """Load the lazy ``request.user`` in a thread, outside the event loop.
+    Django loads the user from the database on first access, which is not
+    allowed in async code. Afterwards, ``request.user`` is safe to use."""
+    await sync_to_async(lambda: request.user.is_authenticated)()
+    return request.user
+
+
+class AsyncSearchView(SearchView):
+    """
+    An async version of SearchView for ASGI deployments. The request to Globus
+    Search does not block the event loop, so a single worker can serve many
+    searches at once. Blocking Globus SDK calls run on a shared thread pool,
+    see ``globus_portal_framework.gclients.run_async``.
+
+    Hooks are the same as SearchView, except ``post_search``,
+    ``get_context_data``, and ``get`` are coroutines. ``process_result``
+    is unchanged.
+    """
+
+    async def post_search(
+        self,
+        client: globus_sdk.SearchClient,
+        index_uuid: str,
+        search_client_data: t.Mapping[str, str],
+    ) -> t.Mapping[str, str]:
+        """Async version of SearchView.post_search"""
+        return await acached_search(
+            self.kwargs.get("index"),
+            search_client_data,
+            self.request.user,
+            lambda: run_async(
+                client.post_search, index_uuid, search_client_data
+            ),
+        )
+
+    async def get_context_data(self, index: str) -> t.Mapping[str, str]:
+        """Async version of SearchView.get_context_data"""
+        data = self.get_search_data()
+        try:
+            index_info = self.get_index_info(index)
+            client = await sync_to_async(self.get_search_client)()
+            result = await self.post_search(client, index_info["uuid"], data)
+            return self.process_result(index_info, result)
+        except globus_portal_framework.exc.ExpiredGlobusToken:
+            raise
+        except Exception as e:
+            if settings.DEBUG:
+                raise
+            log.exception(e)
+        return {
+            "error": "There was an error in your search, please try a "
+            "different query or contact your administrator."
+        }
+
+    async def get(self, request: django.http.HttpRequest, index: str, *args, **kwargs):
+        """Async version of SearchView.get. The session, messages, and template
+        rendering all run outside the event loop."""
+        canonical_redirect = self.get_canonical_redirect()
+        if canonical_redirect:
+            return canonical_redirect
+        await aload_user(request)
+        context = await self.get_context_data(index)
+        await sync_to_async(self.set_search_session_data)(index)
+        error = context.get("error")
+        if error:
+            await sync_to_async(messages.error)(request, error)
+        template = await sync_to_async(get_template)(index, self.template)
+        log.debug(f"Using template {template}")
+        return await sync_to_async(render)(request, template, context)
+
+
+class AsyncDetailView(DetailView):
+    """An async version of DetailView for ASGI deployments. ``get_context_data``
+    and ``get`` are coroutines."""
+
+    async def get_context_data(self, index: str, subject: str) -> t.Mapping[str, str]:
+        """Call globus_portal_framework.gsearch.aget_subject using the index, subject,
+        and user and return the result."""
+        return await aget_subject(index, subject, self.request.user)
+
+    async def get(
+        self, request: django.http.HttpRequest, index: str, subject: str
+    ):
+        """Async version of DetailView.get"""
+        await aload_user(request)
+        context = await self.get_context_data(index, subject)
+        template = await sync_to_async(get_template)(index, self.template)
+        return await sync_to_async(render)(request, template, context)
@@ -1,7 +1,10 @@
 from unittest.mock import Mock
 import pytest
 import copy
+import time
+from datetime import timedelta
 import globus_sdk
+from django.utils import timezone
 from tests import mocks
 
 
@@ -84,3 +87,34 @@ def user():
     resource_servers = ['transfer.api.globus.org', 'groups.api.globus.org',
                         'auth.globus.org', 'search.api.globus.org']
     return mocks.mock_user('bob', resource_servers)
+
+
+@pytest.fixture
+def expired_user():
+    user = mocks.mock_user('bob', ['search.api.globus.org',
+                                   'transfer.api.globus.org'])
+    user.last_login = timezone.now() - timedelta(days=3)
+    user.save()
+    return user
+
+
+@pytest.fixture
+def token_refresh(settings, mock_app):
+    settings.GLOBUS_TOKEN_REFRESH = True
+    response = mock_app.return_value.oauth2_refresh_token.return_value
+    response.by_resource_server = {'search.api.globus.org': {
+        'access_token': 'new_access_token',
+        'refresh_token': 'new_refresh_token',
+        'expires_at_seconds': int(time.time()) + 3600,
+    }}
+    return mock_app.return_value.oauth2_refresh_token
+
+
+@pytest.fixture
+def transfer_token_refresh(token_refresh):
+    response = token_refresh.return_value
+    response.by_resource_server = {
+        'transfer.api.globus.org':
+            response.by_resource_server['search.api.globus.org']
+    }
+    return token_refresh
@@ -122,6 +122,8 @@ MIDDLEWARE = [
     'globus_portal_framework.middleware.GlobusAuthExceptionMiddleware',
     # Redirect to auth page if expired tokens, then back to original page
     'globus_portal_framework.middleware.ExpiredTokenMiddleware',
+    # Load each user's Globus tokens only once per request
+    'globus_portal_framework.middleware.GlobusTokenStoreMiddleware',
 ]
 
 AUTHENTICATION_BACKENDS = [
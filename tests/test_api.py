@@ -0,0 +1,53 @@
+from unittest import mock
+import pytest
+
+from django.urls import reverse
+
+
+@pytest.fixture
+def proxy_request(monkeypatch):
+    get = mock.Mock(return_value=[b'data'])
+    monkeypatch.setattr('globus_portal_framework.api.requests.get', get)
+    return get
+
+
+def proxy(client, resource_server='transfer.api.globus.org'):
+    return client.get(reverse('restricted_endpoint_proxy_stream'), {
+        'url': 'https://example.com/foo.txt',
+        'resource_server': resource_server,
+    })
+
+
+@pytest.mark.django_db
+def test_proxy_stream(client, proxy_request, user):
+    client.force_login(user)
+    r = proxy(client)
+    assert r.status_code == 200
+    assert b''.join(r.streaming_content) == b'data'
+    _, kwargs = proxy_request.call_args
+    assert kwargs['headers'] == {'Authorization': 'Bearer access_token'}
+
+
+@pytest.mark.django_db
+def test_proxy_stream_refreshes_expired_token(client, proxy_request,
+                                              transfer_token_refresh,
+                                              expired_user):
+    last_login = expired_user.last_login
+    client.force_login(expired_user)
+    expired_user.last_login = last_login
+    expired_user.save()
+    proxy(client)
+    transfer_token_refresh.assert_called_once_with('refresh_token')
+    _, kwargs = proxy_request.call_args
+    assert kwargs['headers'] == {'Authorization': 'Bearer new_access_token'}
+
+
+@pytest.mark.django_db
+def test_proxy_stream_unknown_resource_server(client, proxy_request, user):
+    client.force_login(user)
+    assert proxy(client, 'unknown.api.globus.org').status_code == 400
+    assert not proxy_request.called
+
+
+def test_proxy_stream_requires_login(client, proxy_request):
+    assert proxy(client).status_code == 403
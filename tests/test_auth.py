@@ -1,9 +1,18 @@
 import pytest
 import social_core
+import time
 from unittest.mock import Mock
+import jwt as pyjwt
+from cryptography.hazmat.primitives.asymmetric import rsa
+from jwt.algorithms import RSAAlgorithm
+from social_core.backends.globus import (
+    GlobusOpenIdConnect as GlobusOpenIdConnectBase
+)
 
+from django.core.cache import cache
 from tests.mocks import mock_tokens
 from globus_portal_framework.auth import GlobusOpenIdConnect
+from globus_portal_framework.gclients import get_groups_cache_key
 
 
 class MockResponseEnvelope:
@@ -172,3 +181,133 @@ def test_denied_by_whitelist(settings, user_details, groups_client):
     goidc = GlobusOpenIdConnect()
     assert goidc.auth_allowed(response, user_details) is False
     assert not groups_client.return_value.get_my_groups.called
+
+
+def test_login_refreshes_cached_groups(settings, mock_group_tokens, groups,
+                                       user_details, groups_client):
+    settings.SOCIAL_AUTH_GLOBUS_ALLOWED_GROUPS = [
+       {'name': 'Portal Users Group',
+        'uuid': 'test-group-1-uuid'}
+    ]
+    key = get_groups_cache_key('mal-ident-1-uuid')
+    cache.set(key, (time.time(), []))
+    groups_client.return_value.get_my_groups.return_value = groups
+    goidc = GlobusOpenIdConnect()
+    response = {'sub': 'mal-ident-1-uuid', 'other_tokens': mock_group_tokens}
+    assert goidc.auth_allowed(response, user_details) is True
+    _, cached_groups = cache.get(key)
+    assert [g['id'] for g in cached_groups] == ['test-group-1-uuid',
+                                                'test-group-2-uuid']
+
+
+def test_login_clears_cached_groups(settings, user_details):
+    settings.SOCIAL_AUTH_GLOBUS_ALLOWED_GROUPS = []
+    key = get_groups_cache_key('mal-ident-1-uuid')
+    cache.set(key, (time.time(), []))
+    goidc = GlobusOpenIdConnect()
+    assert goidc.auth_allowed({'sub': 'mal-ident-1-uuid'}, user_details)
+    assert cache.get(key) is None
+
+
+def signing_key(kid):
+    private_key = rsa.generate_private_key(public_exponent=65537,
+                                           key_size=2048)
+    jwk = RSAAlgorithm.to_jwk(private_key.public_key(), as_dict=True)
+    return private_key, dict(jwk, kid=kid, alg='RS512')
+
+
+@pytest.fixture(scope='module')
+def signing_keys():
+    return {kid: signing_key(kid) for kid in ['key-1', 'key-2']}
+
+
+@pytest.fixture
+def oidc(monkeypatch, signing_keys):
+    cache.clear()
+    monkeypatch.setattr('globus_portal_framework.auth._oidc_memo', {})
+    config = {'jwks_uri': 'https://auth.globus.org/jwk.json'}
+    monkeypatch.setattr(GlobusOpenIdConnect, 'get_json',
+                        Mock(return_value=config))
+    monkeypatch.setattr(GlobusOpenIdConnect, 'get_remote_jwks_keys',
+                        Mock(return_value=[signing_keys['key-1'][1]]))
+    yield GlobusOpenIdConnect
+    cache.clear()
+
+
+def mock_id_token(signing_keys, kid):
+    private_key, _ = signing_keys[kid]
+    return pyjwt.encode({'sub': 'mal-ident-1-uuid'}, private_key,
+                        algorithm='RS512', headers={'kid': kid})
+
+
+def test_oidc_config_and_keys_are_cached(oidc, signing_keys):
+    for _ in range(3):
+        key = GlobusOpenIdConnect().find_valid_key(
+            mock_id_token(signing_keys, 'key-1'))
+        assert key['kid'] == 'key-1'
+    assert oidc.get_json.call_count == 1
+    assert oidc.get_remote_jwks_keys.call_count == 1
+
+
+def test_oidc_data_kept_in_process_without_cache(settings, oidc,
+                                                 signing_keys):
+    settings.CACHES = dict(settings.CACHES, dummy={
+        'BACKEND': 'django.core.cache.backends.dummy.DummyCache'})
+    settings.GLOBUS_CACHE_ALIAS = 'dummy'
+    for _ in range(3):
+        GlobusOpenIdConnect().find_valid_key(
+            mock_id_token(signing_keys, 'key-1'))
+    assert oidc.get_json.call_count == 1
+    assert oidc.get_remote_jwks_keys.call_count == 1
+
+
+def test_keys_fetched_again_for_unknown_key(monkeypatch, oidc, signing_keys):
+    goidc = GlobusOpenIdConnect()
+    goidc.find_valid_key(mock_id_token(signing_keys, 'key-1'))
+    oidc.get_remote_jwks_keys.return_value = [signing_keys['key-2'][1]]
+    key = goidc.find_valid_key(mock_id_token(signing_keys, 'key-2'))
+    assert key['kid'] == 'key-2'
+    assert oidc.get_remote_jwks_keys.call_count == 2
+    # Other processes sharing the cache get the new keys
+    monkeypatch.setattr('globus_portal_framework.auth._oidc_memo', {})
+    assert goidc.get_jwks_keys() == [signing_keys['key-2'][1]]
+    assert oidc.get_remote_jwks_keys.call_count == 2
+
+
+def test_unknown_key_after_fetching_keys(oidc, signing_keys):
+    unknown = signing_key('bad')[0]
+    id_token = pyjwt.encode({'sub': 'mal-ident-1-uuid'}, unknown,
+                            algorithm='RS512', headers={'kid': 'bad'})
+    assert GlobusOpenIdConnect().find_valid_key(id_token) is None
+    assert oidc.get_remote_jwks_keys.call_count == 2
+
+
+def test_groups_fetched_during_login(settings, monkeypatch, mock_group_tokens,
+                                     groups, user_details, groups_client):
+    settings.SOCIAL_AUTH_GLOBUS_ALLOWED_GROUPS = [
+       {'name': 'Portal Users Group',
+        'uuid': 'test-group-1-uuid'}
+    ]
+    groups_client.return_value.get_my_groups.return_value = groups
+    goidc = GlobusOpenIdConnect()
+
+    def pipeline(access_token, *args, response=None, **kwargs):
+        assert goidc.user_groups_future is not None
+        return goidc.auth_allowed(response, user_details)
+    monkeypatch.setattr(GlobusOpenIdConnectBase, 'do_auth', pipeline)
+
+    response = {'sub': 'mal-ident-1-uuid', 'other_tokens': mock_group_tokens}
+    assert goidc.do_auth('access_token', response=response) is True
+    assert groups_client.return_value.get_my_groups.call_count == 1
+    assert goidc.user_groups_future is None
+    assert cache.get(get_groups_cache_key('mal-ident-1-uuid')) is not None
+
+
+def test_groups_not_fetched_during_login_without_allowed_groups(
+        settings, monkeypatch, mock_group_tokens, groups_client):
+    settings.SOCIAL_AUTH_GLOBUS_ALLOWED_GROUPS = []
+    monkeypatch.setattr(GlobusOpenIdConnectBase, 'do_auth', Mock())
+    goidc = GlobusOpenIdConnect()
+    goidc.do_auth('access_token', response={'other_tokens': mock_group_tokens})
+    assert goidc.user_groups_future is None
+    assert not groups_client.return_value.get_my_groups.called
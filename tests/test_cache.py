@@ -0,0 +1,379 @@
+import asyncio
+import threading
+import time
+
+import pytest
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.urls import include, path, reverse
+
+from globus_portal_framework.cache import (
+    SingleFlight, CachedSearchResponse, cached_search, get_or_search,
+    get_search_cache_key, get_search_cache_settings, search_flight,
+)
+from globus_portal_framework.gsearch import (
+    post_search, apost_search, get_subject, get_search_filters,
+)
+from globus_portal_framework.views.generic import SearchView
+from tests import mocks
+
+
+class LimitSearchView(SearchView):
+    """Modifies the search body in post_search, after get_search_data"""
+
+    def post_search(self, client, index_uuid, search_client_data):
+        search_client_data['limit'] = int(self.request.GET.get('limit', 10))
+        return super().post_search(client, index_uuid, search_client_data)
+
+
+urlpatterns = [
+    path('<index>/search-view/', SearchView.as_view(), name='search-view'),
+    path('<index>/limit-search-view/', LimitSearchView.as_view(),
+         name='limit-search-view'),
+    path('', include('globus_portal_framework.urls')),
+]
+
+
+@pytest.fixture
+def search_cache(settings):
+    settings.SEARCH_CACHE_TIMEOUT = 60
+    cache.clear()
+    yield cache
+    cache.clear()
+
+
+class MockSearch:
+    def __init__(self, data=None):
+        self.data = data or dict(mocks.MOCK_EMPTY_SEARCH)
+        self.call_count = 0
+
+    def __call__(self):
+        self.call_count += 1
+        return self
+
+
+def test_cache_disabled_by_default():
+    search = MockSearch()
+    cached_search('testindex', {'q': '*'}, None, search)
+    cached_search('testindex', {'q': '*'}, None, search)
+    assert search.call_count == 2
+
+
+def test_cached_search_hit(search_cache):
+    search = MockSearch()
+    cached_search('testindex', {'q': '*'}, None, search)
+    response = cached_search('testindex', {'q': '*'}, None, search)
+    assert search.call_count == 1
+    assert response.data == mocks.MOCK_EMPTY_SEARCH
+
+
+def test_cached_search_per_index_timeout(settings, search_cache):
+    settings.SEARCH_INDEXES = {
+        'testindex': dict(settings.SEARCH_INDEXES['testindex'],
+                          cache_timeout=0)
+    }
+    search = MockSearch()
+    cached_search('testindex', {'q': '*'}, None, search)
+    cached_search('testindex', {'q': '*'}, None, search)
+    assert search.call_count == 2
+    assert get_search_cache_settings('testindex')[0] == 0
+
+
+def test_cached_search_max_entry_size(settings, search_cache):
+    settings.SEARCH_CACHE_MAX_ENTRY_SIZE = 10
+    search = MockSearch()
+    cached_search('testindex', {'q': '*'}, None, search)
+    cached_search('testindex', {'q': '*'}, None, search)
+    assert search.call_count == 2
+
+
+def test_cache_key_ignores_body_ordering():
+    first = {'q': '*', 'limit': 10, 'offset': 0}
+    second = {'offset': 0, 'limit': 10, 'q': '*'}
+    assert (get_search_cache_key('testindex', first) ==
+            get_search_cache_key('testindex', second))
+
+
+@pytest.mark.parametrize('changed', [
+    {'q': 'foo'}, {'offset': 10}, {'limit': 20}, {'@version': '2017-09-01'},
+    {'sort': [{'field_name': 'a', 'order': 'asc'}]},
+    {'filters': [{'type': 'match_all', 'field_name': 'a', 'values': ['b']}]},
+])
+def test_cache_key_covers_search_body(changed):
+    body = {'q': '*', 'limit': 10, 'offset': 0, '@version': 'query#1.0.0'}
+    assert (get_search_cache_key('testindex', body) !=
+            get_search_cache_key('testindex', dict(body, **changed)))
+
+
+def test_cache_key_uses_canonical_filters(rf):
+    first = get_search_filters(rf.get('/?filter.a=1&filter.b=2&filter.b=3'))
+    second = get_search_filters(
+        rf.get('/?filter-match-all.b=3&filter.a=1&filter.b=2'))
+    assert first != second
+    assert (get_search_cache_key('testindex', {'q': '*', 'filters': first}) ==
+            get_search_cache_key('testindex', {'q': '*', 'filters': second}))
+
+
+@pytest.mark.django_db
+def test_cache_key_separates_users(groups_client, user):
+    groups_client.return_value.get_my_groups.return_value.data = []
+    body = {'q': '*'}
+    anon_key = get_search_cache_key('testindex', body, AnonymousUser())
+    assert anon_key == get_search_cache_key('testindex', body, None)
+    assert anon_key != get_search_cache_key('testindex', body, user)
+
+
+def test_post_search_uses_cache(search_cache, search_client_inst,
+                                globus_response):
+    globus_response.data = mocks.MOCK_EMPTY_SEARCH
+    search_client_inst.post_search.return_value = globus_response
+    first = post_search('testindex', '*', [], user=None, page=1)
+    second = post_search('testindex', '*', [], user=None, page=1)
+    assert search_client_inst.post_search.call_count == 1
+    assert first == second
+
+
+def test_search_uses_cache(search_cache, client, mock_data_search):
+    client.get(reverse('search', args=['testindex']))
+    r = client.get(reverse('search', args=['testindex']))
+    assert r.status_code == 200
+    assert mock_data_search.post_search.call_count == 1
+
+
+@pytest.mark.urls('tests.test_cache')
+def test_search_view_uses_cache(search_cache, client, mock_data_search):
+    client.get(reverse('search-view', args=['testindex']))
+    r = client.get(reverse('search-view', args=['testindex']))
+    assert r.status_code == 200
+    assert mock_data_search.post_search.call_count == 1
+
+
+@pytest.mark.urls('tests.test_cache')
+def test_search_view_cache_key_uses_post_search_body(search_cache, client,
+                                                     mock_data_search):
+    url = reverse('limit-search-view', args=['testindex'])
+    client.get(url + '?limit=5')
+    client.get(url + '?limit=50')
+    assert mock_data_search.post_search.call_count == 2
+    client.get(url + '?limit=5')
+    assert mock_data_search.post_search.call_count == 2
+
+
+@pytest.mark.django_db
+def test_users_do_not_share_entries_by_default(search_cache, groups_client,
+                                               user):
+    other = mocks.mock_user('alice', ['groups.api.globus.org'])
+    body = {'q': '*'}
+    assert (get_search_cache_key('testindex', body, user) !=
+            get_search_cache_key('testindex', body, other))
+    assert not groups_client.return_value.get_my_groups.called
+
+
+@pytest.mark.django_db
+def test_cache_by_groups_index_shares_group_entries(settings, search_cache,
+                                                    groups_client, user):
+    settings.SEARCH_INDEXES = {
+        'testindex': dict(settings.SEARCH_INDEXES['testindex'],
+                          cache_by_groups=True)
+    }
+    groups_client.return_value.get_my_groups.return_value.data = [
+        {'id': 'group-1'}]
+    member = mocks.mock_user('alice', ['groups.api.globus.org'])
+    no_groups_token = mocks.mock_user('carol', ['search.api.globus.org'])
+    body = {'q': '*'}
+    key = get_search_cache_key('testindex', body, user)
+    assert key == get_search_cache_key('testindex', body, member)
+    assert key != get_search_cache_key('testindex', body, no_groups_token)
+    assert key != get_search_cache_key('testindex', body, None)
+
+
+@pytest.mark.django_db
+def test_public_only_index_shares_anonymous_entry(settings, user):
+    settings.SEARCH_INDEXES = {
+        'testindex': dict(settings.SEARCH_INDEXES['testindex'],
+                          public_only=True)
+    }
+    body = {'q': '*'}
+    assert (get_search_cache_key('testindex', body, user) ==
+            get_search_cache_key('testindex', body, None))
+
+
+@pytest.mark.django_db
+def test_cached_subject(search_cache, mock_data_get_subject):
+    get_subject('testindex', 'mysubject')
+    get_subject('testindex', 'mysubject')
+    assert mock_data_get_subject.get_subject.call_count == 1
+
+
+def test_single_flight_coalesces_concurrent_calls():
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def slow_search():
+        calls.append(1)
+        release.wait(5)
+        return 'result'
+
+    results = []
+    threads = [threading.Thread(
+        target=lambda: results.append(flight.do('key', slow_search)))
+        for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    while flight.stats()['issued'] + flight.stats()['coalesced'] < 5:
+        time.sleep(0.01)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+    assert results == ['result'] * 5
+    assert flight.stats() == {'issued': 1, 'coalesced': 4, 'in_flight': 0}
+
+
+def test_single_flight_shares_exceptions():
+    flight = SingleFlight()
+    release = threading.Event()
+
+    def failing_search():
+        release.wait(5)
+        raise ValueError('Search failed')
+
+    errors = []
+
+    def do():
+        try:
+            flight.do('key', failing_search)
+        except ValueError as ve:
+            errors.append(ve)
+    threads = [threading.Thread(target=do) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    while flight.stats()['issued'] + flight.stats()['coalesced'] < 3:
+        time.sleep(0.01)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert len(errors) == 3
+    assert flight.stats()['in_flight'] == 0
+
+
+def test_single_flight_sequential_calls_are_not_coalesced():
+    flight = SingleFlight()
+    assert flight.do('key', lambda: 1) == 1
+    assert flight.do('key', lambda: 2) == 2
+    assert flight.stats()['issued'] == 2
+
+
+def test_shared_search_copied_before_leader_modifies_it(search_cache):
+    release = threading.Event()
+
+    class LiveResponse:
+        def __init__(self):
+            self.data = {'gmeta': [{'subject': 'foo'}]}
+
+    def slow_search():
+        release.wait(5)
+        return LiveResponse()
+
+    results = []
+
+    def search_and_process():
+        response = get_or_search('key', slow_search, 60)
+        if isinstance(response, LiveResponse):
+            # The leader processes its response in place, like field mappers
+            response.data['gmeta'].extend({'subject': i} for i in range(100))
+        results.append(response)
+
+    search_flight.reset()
+    threads = [threading.Thread(target=search_and_process) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    while search_flight.stats()['issued'] + \
+            search_flight.stats()['coalesced'] < 5:
+        time.sleep(0.01)
+    release.set()
+    for thread in threads:
+        thread.join()
+    shared = [r for r in results if isinstance(r, CachedSearchResponse)]
+    assert len(shared) == 4
+    assert all(r.data == {'gmeta': [{'subject': 'foo'}]} for r in shared)
+
+
+def test_stale_entry_served_and_refreshed(settings, search_cache):
+    settings.SEARCH_CACHE_STALE_TIMEOUT = 60
+    key = get_search_cache_key('testindex', {'q': '*'})
+    stale = {'total': 'stale'}
+    search_cache.set(key, (time.time() - 1, stale), 60)
+
+    search = MockSearch()
+    response = cached_search('testindex', {'q': '*'}, None, search)
+    assert response.data == stale
+    for _ in range(500):
+        if search_cache.get(f'{key}:lock') is None:
+            break
+        time.sleep(0.01)
+    assert search.call_count == 1
+    assert search_cache.get(key)[1] == mocks.MOCK_EMPTY_SEARCH
+
+
+def test_stale_entry_not_refreshed_while_locked(settings, search_cache):
+    settings.SEARCH_CACHE_STALE_TIMEOUT = 60
+    key = get_search_cache_key('testindex', {'q': '*'})
+    search_cache.set(key, (time.time() - 1, {'total': 'stale'}), 60)
+    search_cache.set(f'{key}:lock', 1, 60)
+
+    search = MockSearch()
+    response = cached_search('testindex', {'q': '*'}, None, search)
+    assert response.data == {'total': 'stale'}
+    assert search.call_count == 0
+
+
+def test_single_flight_coalesces_concurrent_coroutines():
+    flight = SingleFlight()
+    calls = []
+
+    async def slow_search():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return 'result'
+
+    async def search_concurrently():
+        return await asyncio.gather(
+            *[flight.ado('key', slow_search) for _ in range(5)])
+
+    assert asyncio.run(search_concurrently()) == ['result'] * 5
+    assert len(calls) == 1
+    assert flight.stats() == {'issued': 1, 'coalesced': 4, 'in_flight': 0}
+
+
+def test_single_flight_shares_coroutine_exceptions():
+    flight = SingleFlight()
+
+    async def failing_search():
+        await asyncio.sleep(0.01)
+        raise ValueError('Search failed')
+
+    async def search_concurrently():
+        return await asyncio.gather(
+            *[flight.ado('key', failing_search) for _ in range(3)],
+            return_exceptions=True)
+
+    results = asyncio.run(search_concurrently())
+    assert all(isinstance(r, ValueError) for r in results)
+    assert flight.stats()['in_flight'] == 0
+
+
+def test_apost_search_uses_cache(search_cache, search_client_inst,
+                                 globus_response):
+    globus_response.data = mocks.MOCK_EMPTY_SEARCH
+    search_client_inst.post_search.return_value = globus_response
+
+    async def search_twice():
+        first = await apost_search('testindex', '*', [], user=None, page=1)
+        second = await apost_search('testindex', '*', [], user=None, page=1)
+        return first, second
+
+    first, second = asyncio.run(search_twice())
+    assert search_client_inst.post_search.call_count == 1
+    assert first == second
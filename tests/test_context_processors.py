@@ -0,0 +1,61 @@
+from unittest import mock
+
+import pytest
+from django.urls import reverse
+
+from globus_portal_framework.context_processors import (
+    globals, clear_globals_cache,
+)
+
+
+def test_globals_for_search_page(rf):
+    request = rf.get(reverse('search', args=['testindex']))
+    context = globals(request)['globus_portal_framework']
+    assert context['index'] == 'testindex'
+    assert context['index_data']['uuid']
+    assert context['project_title']
+    assert context['search_debugging_enabled'] is True
+
+
+def test_globals_without_index(rf):
+    context = globals(rf.get('/'))['globus_portal_framework']
+    assert context['index'] is None
+    assert context['index_data'] == {}
+
+
+def test_globals_unknown_url(rf):
+    context = globals(rf.get('/not/a/real/page/'))['globus_portal_framework']
+    assert context['index'] is None
+
+
+def test_globals_uses_resolver_match(client, mock_data_search):
+    with mock.patch('globus_portal_framework.context_processors.resolve') as r:
+        response = client.get(reverse('search', args=['testindex']))
+    assert response.status_code == 200
+    assert not r.called
+    assert response.context['globus_portal_framework']['index'] == (
+        'testindex')
+
+
+def test_globals_static_context_computed_once(rf):
+    clear_globals_cache()
+    search_url = reverse('search', args=['testindex'])
+    globals(rf.get('/'))
+    globals(rf.get(search_url))
+    with mock.patch('globus_portal_framework.context_processors.reverse') as r:
+        globals(rf.get('/'))
+        context = globals(rf.get(search_url))['globus_portal_framework']
+    assert not r.called
+    assert context['search_debugging_enabled'] is True
+
+
+@pytest.mark.parametrize('scopes, transfer_enabled', [
+    ([], False),
+    (['urn:globus:auth:scope:transfer.api.globus.org:all'], True),
+])
+def test_globals_recomputed_on_settings_change(rf, settings, scopes,
+                                               transfer_enabled):
+    globals(rf.get('/'))
+    settings.SOCIAL_AUTH_GLOBUS_SCOPE = scopes
+    context = globals(rf.get('/'))['globus_portal_framework']
+    assert context['transfer_enabled'] is transfer_enabled
@@ -0,0 +1,45 @@
+import datetime
+
+import pytest
+
+from globus_portal_framework.dates import (
+    parse_date, parse_date_filter, parse_datetime, get_date_format_type,
+)
+from globus_portal_framework.exc import InvalidRangeFilter
+
+
+@pytest.mark.parametrize('date, dt_type, dt', [
+    ('2019', 'year', datetime.datetime(2019, 1, 1)),
+    ('2019-12', 'month', datetime.datetime(2019, 12, 1)),
+    ('2019-12-02', 'day', datetime.datetime(2019, 12, 2)),
+    ('2019-12-02 21:01:02', 'time', datetime.datetime(2019, 12, 2, 21, 1, 2)),
+    (2019, 'year', datetime.datetime(2019, 1, 1)),
+])
+def test_parse_date_filter(date, dt_type, dt):
+    assert parse_date_filter(date) == {
+        'value': date, 'type': dt_type, 'datetime': dt}
+    assert get_date_format_type(date) == dt_type
+    assert parse_datetime(date) == dt
+
+
+def test_parse_date_is_cached():
+    parse_date.cache_clear()
+    first = parse_date_filter('2019-12-02')
+    second = parse_date_filter('2019-12-02')
+    assert first == second and first is not second
+    assert parse_date.cache_info().hits == 1
+
+
+@pytest.mark.parametrize('date', [
+    'not a date', '2019-12-02T21:01:02', '2019-12-02 21:01', '201',
+])
+def test_parse_date_filter_invalid(date):
+    with pytest.raises((InvalidRangeFilter, ValueError)):
+        parse_date_filter(date)
+
+
+def test_parse_date_filter_invalid_date_not_cached():
+    parse_date.cache_clear()
+    with pytest.raises(ValueError):
+        parse_date_filter('2019-13')
+    assert parse_date.cache_info().currsize == 0
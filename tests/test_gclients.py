@@ -1,13 +1,24 @@
 import pytest
+from unittest import mock
+import time
 from datetime import timedelta
 import globus_sdk
 
 from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.urls import reverse
 from django.utils import timezone
+from jose import jwt
+from social_django.models import UserSocialAuth
 
 from globus_portal_framework.gclients import (
     load_globus_client, load_search_client, load_transfer_client,
-    revoke_globus_tokens, get_user_groups
+    revoke_globus_tokens, get_user_groups, get_user_cached_groups,
+    get_user_principals, get_user_group_set_hash, GlobusClientPool,
+    get_token_store,
+    token_store_scope, clear_token_store, load_globus_access_token,
+    get_token_lifetime, get_groups_cache_key, get_cached_user_groups,
+    is_allowed_group_member, get_revocation_queue,
 )
 from globus_portal_framework import (
     ExpiredGlobusToken, PortalAuthException
@@ -110,9 +121,371 @@ def test_revocation_globus_err(mock_app, globus_api_error):
     assert mock_app.return_value.oauth2_revoke_token.call_count == 3
 
 
+@pytest.mark.django_db
+def test_revocation_retries_server_errors(mock_app, globus_api_error):
+    server_error = globus_api_error()
+    server_error.http_status = 503
+    revoke = mock_app.return_value.oauth2_revoke_token
+    revoke.side_effect = [server_error] + [None] * 6
+
+    user = mock_user('alice', ['search.api.globus.org',
+                               'transfer.api.globus.org'])
+    revoke_globus_tokens(user)
+    # One retry, plus an access and refresh token for each of 3 services
+    assert revoke.call_count == 7
+
+
+@pytest.mark.django_db
+def test_revocation_in_background(settings, mock_app):
+    settings.GLOBUS_REVOKE_TOKENS_IN_BACKGROUND = True
+    user = mock_user('alice', ['search.api.globus.org'])
+    revoke_globus_tokens(user)
+    # Wait for jobs ahead in the queue to finish
+    get_revocation_queue().submit(lambda: None).result(5)
+    assert mock_app.return_value.oauth2_revoke_token.call_count == 4
+
+
 @pytest.mark.django_db
 def test_get_groups(groups_client, user, client):
     # get user with public groups scope
+    groups_client.return_value.get_my_groups.return_value.data = []
     client.force_login(user)
     get_user_groups(user)
     assert groups_client.return_value.get_my_groups.called
+
+
+@pytest.mark.django_db
+def test_get_groups_cached_by_identity(groups_client, user, mock_data):
+    groups = mock_data['get_user_groups']
+    groups_client.return_value.get_my_groups.return_value.data = groups
+    cached = get_user_cached_groups(user)
+    assert get_user_cached_groups(user) == cached
+    assert groups_client.return_value.get_my_groups.call_count == 1
+    # Only ids, names, and memberships are kept
+    assert [g['id'] for g in cached] == [g['id'] for g in groups]
+    assert cached[1]['my_memberships'][1] == {
+        'identity_id': 'mal-ident-2-uuid', 'username': 'mal@anl.gov',
+        'role': 'member'}
+    assert 'group_type' not in cached[0]
+    social = user.social_auth.get(provider='globus')
+    assert cache.get(get_groups_cache_key(social.uid))[1] == cached
+    # Groups fetched directly are never compacted
+    assert get_user_groups(user) == groups
+
+
+@pytest.mark.django_db
+def test_get_groups_cache_disabled(settings, groups_client, user):
+    settings.GLOBUS_GROUPS_CACHE_TIMEOUT = 0
+    groups_client.return_value.get_my_groups.return_value.data = []
+    get_user_cached_groups(user)
+    get_user_cached_groups(user)
+    assert groups_client.return_value.get_my_groups.call_count == 2
+
+
+@pytest.mark.django_db
+def test_cached_groups_cleared_on_logout(groups_client, user, client,
+                                         mock_app):
+    groups_client.return_value.get_my_groups.return_value.data = []
+    get_user_cached_groups(user)
+    client.force_login(user)
+    client.get(reverse('logout'))
+    get_user_cached_groups(user)
+    assert groups_client.return_value.get_my_groups.call_count == 2
+
+
+@pytest.fixture
+def groups_cache():
+    cache.clear()
+    yield cache
+    cache.clear()
+
+
+def mock_id_token(identity_ids):
+    claims = {'identity_set': [{'sub': i} for i in identity_ids]}
+    return jwt.encode(claims, 'secret')
+
+
+@pytest.mark.django_db
+def test_get_user_principals(groups_client, user):
+    groups_client.return_value.get_my_groups.return_value.data = [
+        {'id': 'group-uuid'}
+    ]
+    uid = user.social_auth.get(provider='globus').uid
+    assert get_user_principals(user) == {
+        f'urn:globus:auth:identity:{uid}',
+        'urn:globus:groups:id:group-uuid',
+    }
+
+
+@pytest.mark.django_db
+def test_get_user_principals_includes_identity_set():
+    alice = mock_user('alice', ['search.api.globus.org'])
+    mock_user('alice2', ['search.api.globus.org'])
+    identities = [s.uid for s in UserSocialAuth.objects.all()]
+    social = alice.social_auth.get(provider='globus')
+    social.extra_data['id_token'] = mock_id_token(identities)
+    social.save()
+    assert get_user_principals(alice) == {
+        f'urn:globus:auth:identity:{i}' for i in identities}
+
+
+@pytest.mark.django_db
+def test_get_user_principals_without_groups_token(groups_client):
+    user = mock_user('bob', ['search.api.globus.org'])
+    assert len(get_user_principals(user)) == 1
+    assert not groups_client.return_value.get_my_groups.called
+
+
+@pytest.mark.django_db
+def test_group_set_hash_shared_by_group_members(groups_cache,
+                                                groups_client):
+    alice = mock_user('alice', ['groups.api.globus.org'])
+    bob = mock_user('bob', ['groups.api.globus.org'])
+    my_groups = groups_client.return_value.get_my_groups
+    my_groups.return_value.data = [{'id': 'group-1'}, {'id': 'group-2'}]
+    ghash = get_user_group_set_hash(alice)
+    assert ghash is not None
+    my_groups.return_value.data = [{'id': 'group-2'}, {'id': 'group-1'}]
+    assert get_user_group_set_hash(bob) == ghash
+
+
+@pytest.mark.django_db
+def test_group_set_hash_uses_cached_groups(groups_cache, groups_client,
+                                           user):
+    groups_client.return_value.get_my_groups.return_value.data = []
+    get_user_group_set_hash(user)
+    get_user_group_set_hash(user)
+    assert groups_client.return_value.get_my_groups.call_count == 1
+
+
+@pytest.mark.django_db
+def test_group_set_hash_changes_with_groups(groups_cache, groups_client,
+                                            user):
+    groups_client.return_value.get_my_groups.return_value.data = [
+        {'id': 'group-1'}]
+    ghash = get_user_group_set_hash(user)
+    uid = user.social_auth.get(provider='globus').uid
+    get_cached_user_groups(uid, lambda: [], refresh=True)
+    assert get_user_group_set_hash(user) != ghash
+
+
+@pytest.mark.django_db
+def test_group_set_hash_without_groups_token(groups_client):
+    user = mock_user('bob', ['search.api.globus.org'])
+    assert get_user_group_set_hash(user) is None
+    assert not groups_client.return_value.get_my_groups.called
+
+
+@pytest.mark.django_db
+def test_group_set_hash_groups_error(groups_cache, groups_client, user):
+    my_groups = groups_client.return_value.get_my_groups
+    my_groups.side_effect = globus_sdk.GlobusError()
+    assert get_user_group_set_hash(user) is None
+
+
+def test_group_set_hash_anonymous_user():
+    assert get_user_group_set_hash(AnonymousUser()) is None
+
+
+@pytest.fixture
+def client_pool(monkeypatch):
+    pool = GlobusClientPool()
+    monkeypatch.setattr('globus_portal_framework.gclients.client_pool', pool)
+    return pool
+
+
+def test_pooled_clients_share_session(client_pool):
+    first = load_search_client(AnonymousUser())
+    second = load_search_client(AnonymousUser())
+    transfer = client_pool.load_client(globus_sdk.TransferClient)
+    assert first is not second
+    assert first.transport.session is second.transport.session
+    assert first.transport.session is transfer.transport.session
+
+
+@pytest.mark.django_db
+def test_pooled_clients_keep_user_authorizer(client_pool):
+    user = mock_user('bob', ['search.api.globus.org'])
+    authorized = load_search_client(user)
+    anonymous = load_search_client(AnonymousUser())
+    assert authorized.authorizer is not None
+    assert anonymous.authorizer is None
+    assert authorized.transport.session is anonymous.transport.session
+
+
+def test_client_pool_disabled(settings, client_pool):
+    settings.GLOBUS_CLIENT_POOL_SIZE = 0
+    first = load_search_client(AnonymousUser())
+    second = load_search_client(AnonymousUser())
+    assert first.transport.session is not second.transport.session
+
+
+def test_client_pool_replaced_after_keepalive(settings, client_pool):
+    settings.GLOBUS_CLIENT_POOL_KEEPALIVE = 60
+    session = load_search_client(AnonymousUser()).transport.session
+    client_pool._last_used -= 61
+    with mock.patch.object(session, 'close') as close:
+        new_session = load_search_client(AnonymousUser()).transport.session
+    assert new_session is not session
+    close.assert_called_once()
+
+
+def test_client_pool_not_shared_after_fork(monkeypatch, client_pool):
+    session = load_search_client(AnonymousUser()).transport.session
+    monkeypatch.setattr('os.getpid', lambda: -1)
+    assert load_search_client(AnonymousUser()).transport.session is not session
+
+
+@pytest.mark.django_db
+def test_token_store_indexes_tokens_by_resource_server():
+    user = mock_user('bob', ['search.api.globus.org',
+                             'transfer.api.globus.org'])
+    store = get_token_store(user)
+    assert store.is_globus_user
+    assert set(store.tokens) == {'search.api.globus.org',
+                                 'transfer.api.globus.org'}
+
+
+@pytest.mark.django_db
+def test_token_store_loaded_once_in_scope(django_assert_num_queries):
+    user = mock_user('bob', ['search.api.globus.org',
+                             'transfer.api.globus.org'])
+    with token_store_scope():
+        with django_assert_num_queries(1):
+            for resource_server in ['search.api.globus.org',
+                                    'transfer.api.globus.org',
+                                    'search.api.globus.org']:
+                assert load_globus_access_token(user, resource_server)
+        assert get_token_store(user) is get_token_store(user)
+    assert get_token_store(user) is not get_token_store(user)
+
+
+@pytest.mark.django_db
+def test_clear_token_store():
+    user = mock_user('bob', ['search.api.globus.org'])
+    with token_store_scope():
+        store = get_token_store(user)
+        clear_token_store(user)
+        assert get_token_store(user) is not store
+    # Outside of a scope, there is nothing to clear
+    clear_token_store(user)
+
+
+@pytest.mark.django_db
+def test_load_client_with_token_refresh(search_client, token_refresh):
+    user = mock_user('bob', ['search.api.globus.org'])
+    load_search_client(user)
+    _, kwargs = search_client.call_args
+    assert isinstance(kwargs['authorizer'], globus_sdk.RefreshTokenAuthorizer)
+    assert kwargs['authorizer'].access_token == 'access_token'
+    assert not token_refresh.called
+
+
+@pytest.mark.django_db
+def test_load_client_refreshes_expired_tokens(search_client, token_refresh,
+                                              expired_user):
+    with pytest.raises(ExpiredGlobusToken):
+        load_globus_access_token(expired_user, 'search.api.globus.org')
+    load_search_client(expired_user)
+    token_refresh.assert_called_once_with('refresh_token')
+    _, kwargs = search_client.call_args
+    assert kwargs['authorizer'].access_token == 'new_access_token'
+
+    # Refreshed tokens are saved, other tokens are left alone
+    social = UserSocialAuth.objects.get(user=expired_user)
+    tokens = {t['resource_server']: t
+              for t in social.extra_data['other_tokens']}
+    assert tokens['search.api.globus.org']['refresh_token'] == (
+        'new_refresh_token')
+    assert tokens['transfer.api.globus.org']['access_token'] == 'access_token'
+    assert load_globus_access_token(expired_user, 'search.api.globus.org') == (
+        'new_access_token')
+    assert 3500 < get_token_lifetime(expired_user) <= 3600
+
+
+@pytest.mark.django_db
+def test_failed_token_refresh_raises_expired(search_client, token_refresh,
+                                             globus_api_error, expired_user):
+    token_refresh.side_effect = globus_api_error
+    with pytest.raises(ExpiredGlobusToken):
+        load_search_client(expired_user)
+
+
+@pytest.mark.django_db
+def test_token_refresh_with_unknown_expiration(search_client, token_refresh):
+    user = mock_user('bob', ['search.api.globus.org'])
+    user.last_login = None
+    user.save()
+    load_search_client(user)
+    token_refresh.assert_called_once_with('refresh_token')
+    _, kwargs = search_client.call_args
+    assert kwargs['authorizer'].access_token == 'new_access_token'
+
+
+@pytest.mark.django_db
+def test_failed_token_refresh_with_unknown_expiration(
+        search_client, token_refresh, globus_api_error):
+    token_refresh.side_effect = globus_api_error
+    user = mock_user('bob', ['search.api.globus.org'])
+    user.last_login = None
+    user.save()
+    with pytest.raises(ExpiredGlobusToken):
+        load_search_client(user)
+
+
+@pytest.mark.django_db
+def test_access_token_with_unknown_expiration():
+    user = mock_user('bob', ['search.api.globus.org'])
+    user.last_login = None
+    user.save()
+    assert load_globus_access_token(user, 'search.api.globus.org') == (
+        'access_token')
+
+
+@pytest.mark.django_db
+def test_token_refresh_disabled_raises_expired(search_client, expired_user):
+    with pytest.raises(ExpiredGlobusToken):
+        load_search_client(expired_user)
+
+
+def wait_for_groups_refresh(key):
+    for _ in range(500):
+        if cache.get(f'{key}:lock') is None:
+            return
+        time.sleep(0.01)
+
+
+def test_cached_groups_refreshed_ahead_of_expiry(settings):
+    settings.GLOBUS_GROUPS_CACHE_TIMEOUT = 300
+    settings.GLOBUS_GROUPS_REFRESH_AHEAD = 60
+    key = get_groups_cache_key('refresh-ahead-uuid')
+    new_groups = [{'id': 'new-group-uuid'}]
+    cache.set(key, (time.time() - 270, []), 300)
+    assert get_cached_user_groups('refresh-ahead-uuid',
+                                  lambda: new_groups) == []
+    wait_for_groups_refresh(key)
+    _, groups = cache.get(key)
+    assert [g['id'] for g in groups] == ['new-group-uuid']
+
+
+def test_fresh_cached_groups_not_refreshed(settings):
+    key = get_groups_cache_key('fresh-uuid')
+    cache.set(key, (time.time(), []), 300)
+
+    def load_groups():
+        raise AssertionError('Groups should not be fetched')
+    assert get_cached_user_groups('fresh-uuid', load_groups) == []
+    assert cache.get(f'{key}:lock') is None
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('allowed_groups, is_member', [
+    ([], True),
+    ([{'name': 'Group 2', 'uuid': 'test-group-2-uuid'}], True),
+    ([{'name': 'Other Group', 'uuid': 'other-group-uuid'}], False),
+])
+def test_is_allowed_group_member(groups_client, user, mock_data,
+                                 allowed_groups, is_member):
+    groups = mock_data['get_user_groups']
+    groups_client.return_value.get_my_groups.return_value.data = groups
+    assert is_allowed_group_member(user, allowed_groups) is is_member
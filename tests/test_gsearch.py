@@ -1,3 +1,5 @@
+import json
+import pickle
 import pytest
 from unittest import mock
 from urllib.parse import quote_plus
@@ -9,7 +11,9 @@ from globus_portal_framework.gsearch import (
     process_search_data, get_facets, get_search_filters,
     get_date_range_for_date, get_search_query, parse_filters,
     prepare_search_facets, serialize_gsearch_range, deserialize_gsearch_range,
-    get_facet_filter_type,
+    get_facet_filter_type, batch, LazyResult, LazyField, parse_date_filter,
+    parse_datetime, Facet, Bucket, get_canonical_filters,
+    get_canonical_query_string, get_canonical_search_url,
 )
 import globus_portal_framework.modifiers.facets
 from globus_portal_framework.exc import (
@@ -289,6 +293,98 @@ def test_process_search_data_string_field_missing(mock_data):
     assert data['foo'] == 'bar'
 
 
+def test_process_search_data_func_field_error():
+    gmeta = {'subject': 'test', 'entries': [{'content': {}}]}
+    data = process_search_data([('foo', lambda x: x[0]['foo'])], [gmeta])[0]
+    assert data['foo'] is None
+
+
+def test_process_search_data_overwrite_warns_once(caplog):
+    gmeta = {'subject': 'test', 'entries': [{'content': {'foo': 'bar'}}]}
+    mappers = ['foo', ('foo', lambda x: 'baz'), ('subject', 'foo')]
+    data = process_search_data(mappers, [gmeta] * 3)
+    assert [d['foo'] for d in data] == ['baz'] * 3
+    assert [d['subject'] for d in data] == ['bar'] * 3
+    assert caplog.text.count('overwrite previous fields') == 2
+
+
+def test_process_search_data_batch_field():
+    gmeta = [{'subject': str(n), 'entries': [{'content': {'size': n * 1e9}}]}
+             for n in range(3)]
+    calls = []
+
+    def size_gb(page):
+        calls.append(page)
+        return [content[0]['size'] / 1e9 for content in page]
+
+    mappers = [('size_gb', batch(size_gb)), 'size',
+               ('double', lambda x: x[0]['size'] * 2)]
+    data = process_search_data(mappers, gmeta)
+    assert len(calls) == 1
+    assert [d['size_gb'] for d in data] == [0, 1, 2]
+    assert [d['size'] for d in data] == [0, 1e9, 2e9]
+    assert [d['double'] for d in data] == [0, 2e9, 4e9]
+    assert list(data[0]) == ['subject', 'all', 'size_gb', 'size', 'double']
+
+
+@pytest.mark.parametrize('func', [
+    lambda page: 1 / 0,
+    lambda page: [1],
+])
+def test_process_search_data_batch_field_errors(func):
+    gmeta = [{'subject': str(n), 'entries': [{'content': {}}]}
+             for n in range(3)]
+    data = process_search_data([('foo', batch(func))], gmeta)
+    assert [d['foo'] for d in data] == [None] * 3
+
+
+def test_process_search_data_lazy_fields():
+    gmeta = [{'subject': str(n), 'entries': [{'content': {'n': n}}]}
+             for n in range(3)]
+    calls = []
+
+    def double(content):
+        calls.append(content)
+        return content[0]['n'] * 2
+
+    mappers = ['n', ('double', double), ('path', 'n'),
+               ('page', batch(lambda page: [len(page)] * len(page)))]
+    data = process_search_data(mappers, gmeta, lazy=True)
+    assert all(isinstance(d, LazyResult) for d in data)
+    assert not calls
+    assert data[1]['double'] == 2
+    assert data[1].get('double') == 2
+    assert len(calls) == 1
+    assert data[2]['page'] == 3
+    assert data[0] == {'subject': '0', 'all': [{'n': 0}], 'n': 0,
+                       'double': 0, 'path': 0, 'page': 3}
+    assert data[2].resolve()['double'] == 4
+    assert len(calls) == 3
+
+
+def test_lazy_result_copies():
+    gmeta = {'subject': 'test', 'entries': [{'content': {'foo': 'bar'}}]}
+    result = process_search_data([('foo', lambda x: 'baz')], [gmeta],
+                                 lazy=True)[0]
+    expected = {'subject': 'test', 'all': [{'foo': 'bar'}], 'foo': 'baz'}
+    assert json.loads(json.dumps(result)) == expected
+    assert result.resolve() == expected
+
+    result = process_search_data([('foo', lambda x: 'baz')], [gmeta],
+                                 lazy=True)[0]
+    copied = dict(result)
+    assert isinstance(copied['foo'], LazyField)
+    assert copied['foo']() == 'baz'
+    assert result['foo'] == 'baz'
+
+
+def test_lazy_result_pickles():
+    gmeta = {'subject': 'test', 'entries': [{'content': {'foo': 'bar'}}]}
+    result = process_search_data([('foo', lambda x: 'baz')], [gmeta],
+                                 lazy=True)[0]
+    assert pickle.loads(pickle.dumps(result)) == result
+
+
 def test_pagination():
     assert get_pagination(1000, 0)['current_page'] == 1
     assert get_pagination(1000, 10)['current_page'] == 2
@@ -441,6 +537,98 @@ def test_facet_date_checked(mock_gs_facets, mock_portal_facets,
     assert r[2]['buckets'][0]['checked'] is True
 
 
+def test_facet_date_checked_with_overlapping_filters(
+        mock_gs_facets, mock_portal_facets, globus_response, rf):
+    dates = ['2016-12-29', '2016-12-30', '2017-01-02', '2017-01-04']
+    mock_gs_facets['facet_results'][2]['buckets'] = [
+        {'count': 1, 'value': d} for d in dates + ['2016-12-01 12:00:00']]
+    mock_portal_facets[2]['date_interval'] = 'day'
+    globus_response.data = mock_gs_facets
+    request = rf.get('/?filter-day.dates.value=2016-12-30'
+                     '&filter-day.dates.value=2016-12-31'
+                     '&filter-day.dates.value=2017-01-01'
+                     '&filter-day.dates.value=2017-01-04')
+    filters = get_search_filters(request)
+    r = get_facets(globus_response, mock_portal_facets, filters)
+    assert [b['checked'] for b in r[2]['buckets']] == [
+        False, True, False, True, False]
+
+
+def test_get_facets_does_not_modify_search_result(
+        mock_gs_facets, mock_portal_facets, globus_response):
+    globus_response.data = mock_gs_facets
+    bucket = dict(mock_gs_facets['facet_results'][1]['buckets'][0])
+    get_facets(globus_response, mock_portal_facets, [])
+    r = get_facets(globus_response, mock_portal_facets, [])
+    assert mock_gs_facets['facet_results'][1]['buckets'][0] == bucket
+    assert r[1]['buckets'][0]['value'] == '18000.0--19500.0'
+
+
+def test_facet_buckets_share_facet_keys(mock_gs_facets, mock_portal_facets,
+                                       globus_response):
+    globus_response.data = mock_gs_facets
+    facet = get_facets(globus_response, mock_portal_facets, [])[1]
+    assert isinstance(facet, Facet)
+    assert all(isinstance(b, Bucket) for b in facet['buckets'])
+    assert facet.to_dict()['buckets'] == [{
+        'count': 1, 'value': '18000.0--19500.0',
+        'search_filter_query_key':
+            'filter-range.remote_file_manifest.length',
+        'field_name': 'remote_file_manifest.length',
+        'filter_type': 'range', 'checked': False, 'datetime': None,
+    }]
+
+
+def test_bucket_dict_access():
+    facet = Facet({'field_name': 'foo'}, 'match-all', 'filter-match-all.foo')
+    bucket = Bucket(facet, 2, 'bar')
+    bucket['checked'] = True
+    bucket['label'] = 'Bar'
+    bucket['filter_type'] = 'match-any'
+    del bucket['datetime']
+    assert bucket == {
+        'count': 2, 'value': 'bar',
+        'search_filter_query_key': 'filter-match-all.foo',
+        'field_name': 'foo', 'filter_type': 'match-any', 'checked': True,
+        'label': 'Bar',
+    }
+    assert facet.filter_type == 'match-all'
+    assert bucket.pop('label') == 'Bar'
+    assert 'label' not in bucket
+    with pytest.raises(KeyError):
+        bucket['datetime']
+
+
+def test_facets_pickle_compactly(mock_gs_facets, mock_portal_facets,
+                                 globus_response):
+    mock_gs_facets['facet_results'][0]['buckets'] = [
+        {'count': n, 'value': f'value {n}'} for n in range(100)]
+    globus_response.data = mock_gs_facets
+    facets = get_facets(globus_response, mock_portal_facets, [])
+    facets[0]['buckets'][0]['label'] = 'First'
+    unpickled = pickle.loads(pickle.dumps(facets))
+    assert unpickled == facets
+    assert unpickled[0]['buckets'][0].facet is unpickled[0]
+    assert unpickled[0]['buckets'][0]['label'] == 'First'
+    as_dicts = [f.to_dict() for f in facets]
+    assert len(pickle.dumps(facets)) < len(pickle.dumps(as_dicts))
+
+
+@pytest.mark.parametrize('date', [
+    '2017', '2017-02', '2017-02-03', '2017-02-03 04:05:06', 2017,
+])
+def test_parse_datetime(date):
+    assert parse_datetime(date) == parse_date_filter(date)['datetime']
+
+
+@pytest.mark.parametrize('date', [
+    'not a date', '2017-13', '2017-02-03T04:05:06', '2017-02-03 04:05',
+])
+def test_parse_datetime_invalid(date):
+    with pytest.raises((InvalidRangeFilter, ValueError)):
+        parse_datetime(date)
+
+
 def test_get_facet_with_modifiers(mock_gs_facets, mock_portal_facets,
                                   globus_response, monkeypatch):
     globus_response.data = mock_gs_facets
@@ -618,3 +806,58 @@ def test_get_facet_filter_type_valid(facet_definition, filter_type):
 
 def test_get_facet_filter_type_invalid_filter():
     assert get_facet_filter_type({'field_name': 'foo', 'type': ''}) is None
+
+
+def test_get_canonical_filters():
+    filters = [
+        {'field_name': 'b', 'type': 'match_any', 'values': ['2', '1', '2']},
+        {'field_name': 'a', 'type': 'match_all', 'values': ['y']},
+        {'field_name': 'b', 'type': 'match_any', 'values': ['3']},
+        {'field_name': 'a', 'type': 'match_all', 'values': ['x', 'y']},
+        {'type': 'not', 'filter': {'type': 'match_all', 'field_name': 'c',
+                                   'values': ['z']}},
+    ]
+    assert get_canonical_filters(filters) == [
+        {'field_name': 'a', 'type': 'match_all', 'values': ['x', 'y']},
+        {'field_name': 'b', 'type': 'match_any', 'values': ['1', '2']},
+        {'field_name': 'b', 'type': 'match_any', 'values': ['3']},
+        filters[4],
+    ]
+    assert filters[1]['values'] == ['y']
+
+
+@pytest.mark.parametrize('query_string, canonical', [
+    ('', ''),
+    ('q=foo&page=1', 'q=foo'),
+    ('page=2&q=foo', 'page=2&q=foo'),
+    ('page=1&page=2', 'page=2'),
+    ('page=2&page=1', ''),
+    ('filter.a=2&q=foo&filter-match-all.a=1&filter.a=2',
+     'filter-match-all.a=1&filter-match-all.a=2&q=foo'),
+    ('filter-range.b=1--2&filter-range.b=1--2', 'filter-range.b=1--2'),
+])
+def test_get_canonical_query_string(rf, query_string, canonical):
+    request = rf.get(f'/?{query_string}')
+    assert get_canonical_query_string(request) == canonical
+    assert get_canonical_query_string(rf.get(f'/?{canonical}')) == canonical
+
+
+def test_canonical_query_string_keeps_separate_match_any_filters(rf):
+    request = rf.get('/?filter.a=1&filter-match-any.a=2')
+    assert get_canonical_query_string(
+        request, filter_match_default='match-any') == (
+        'filter-match-any.a=2&filter.a=1')
+
+
+def test_get_canonical_search_url(rf):
+    assert get_canonical_search_url(rf.get('/search/?q=foo')) is None
+    assert get_canonical_search_url(rf.get('/search/?page=1')) == '/search/'
+    assert (get_canonical_search_url(rf.get('/search/?q=a+b&filter.c=d')) ==
+            '/search/?filter-match-all.c=d&q=a+b')
+
+
+@pytest.mark.parametrize('query_string', [
+    'q=*', 'q=%2A', 'q=a%20b', 'q=a+b', 'filter-match-all.c=d%2Fe&q=',
+])
+def test_canonical_search_url_ignores_encoding(rf, query_string):
+    assert get_canonical_search_url(rf.get(f'/search/?{query_string}')) is None
@@ -0,0 +1,36 @@
+from unittest import mock
+import pytest
+
+from globus_portal_framework.gtransfer import preview
+
+
+@pytest.fixture
+def preview_request(monkeypatch):
+    get = mock.MagicMock()
+    response = get.return_value.__enter__.return_value
+    response.status_code = 200
+    response.iter_content.return_value = iter([b'line 1\nline 2\n'])
+    monkeypatch.setattr('globus_portal_framework.gtransfer.requests.get', get)
+    return get
+
+
+def get_authorization(preview_request):
+    _, kwargs = preview_request.call_args
+    return kwargs['headers'].get('Authorization')
+
+
+@pytest.mark.django_db
+def test_preview(preview_request, user):
+    assert preview(user, 'https://example.com/foo.txt',
+                   'transfer.api.globus.org') == 'line 1\nline 2'
+    assert get_authorization(preview_request) == 'Bearer access_token'
+
+
+@pytest.mark.django_db
+def test_preview_refreshes_expired_token(preview_request,
+                                         transfer_token_refresh,
+                                         expired_user):
+    preview(expired_user, 'https://example.com/foo.txt',
+            'transfer.api.globus.org')
+    transfer_token_refresh.assert_called_once_with('refresh_token')
+    assert get_authorization(preview_request) == 'Bearer new_access_token'
@@ -1,12 +1,23 @@
+import logging
 import pytest
 from datetime import timedelta
+from unittest import mock
 from urllib.parse import urlsplit, parse_qs, unquote_plus
 
+import globus_sdk
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
 from django.http import HttpResponse
 from django.urls import path, reverse, include
 from django.utils import timezone
 
-from globus_portal_framework import load_transfer_client, ExpiredGlobusToken
+from globus_portal_framework import (
+    load_transfer_client, load_search_client, ExpiredGlobusToken,
+)
+from globus_portal_framework.gclients import GlobusTokenStore
+from globus_portal_framework.views.base import allowed_groups
+from globus_portal_framework.views.generic import aload_user
+from tests.mocks import mock_user
 
 
 def my_transfer_view(request):
@@ -17,8 +28,27 @@ def my_transfer_view(request):
     return resp
 
 
+def my_detail_view(request):
+    """A django view which loads several clients, like a detail page"""
+    load_search_client(request.user)
+    load_transfer_client(request.user)
+    load_transfer_client(request.user)
+    return HttpResponse('<html><body>Hello Globus!</body></html>')
+
+
+async def my_async_detail_view(request):
+    user = await aload_user(request)
+    for load_client in [load_search_client, load_transfer_client]:
+        await sync_to_async(load_client)(user)
+    return HttpResponse('<html><body>Hello Globus!</body></html>')
+
+
 urlpatterns = [
     path('my-transfer-view/', my_transfer_view, name='my_transfer_view'),
+    path('my-detail-view/', my_detail_view, name='my_detail_view'),
+    path('my-async-detail-view/', my_async_detail_view,
+         name='my_async_detail_view'),
+    path('allowed-groups/', allowed_groups, name='allowed-groups'),
     path('', include('social_django.urls', namespace='social')),
 ]
 
@@ -70,3 +100,99 @@ def test_no_middleware_raises_exception(user, client, settings):
     user.save()
     with pytest.raises(ExpiredGlobusToken):
         client.get(reverse('my_transfer_view'))
+
+
+@pytest.fixture
+def token_stores():
+    with mock.patch('globus_portal_framework.gclients.GlobusTokenStore',
+                    wraps=GlobusTokenStore) as stores:
+        yield stores
+
+
+@pytest.mark.urls('tests.test_middleware')
+@pytest.mark.django_db
+@pytest.mark.parametrize('view', ['my_detail_view', 'my_async_detail_view'])
+def test_token_store_loads_tokens_once(user, client, token_stores, view):
+    client.force_login(user)
+    assert client.get(reverse(view)).status_code == 200
+    assert token_stores.call_count == 1
+
+
+@pytest.mark.urls('tests.test_middleware')
+@pytest.mark.django_db
+def test_tokens_loaded_per_client_without_token_store_middleware(
+        user, client, settings, token_stores):
+    settings.MIDDLEWARE = [m for m in settings.MIDDLEWARE
+                           if 'GlobusTokenStoreMiddleware' not in m]
+    client.force_login(user)
+    assert client.get(reverse('my_detail_view')).status_code == 200
+    assert token_stores.call_count > 3
+
+
+@pytest.fixture
+def allowed_groups_middleware(settings, groups_client, mock_data):
+    settings.MIDDLEWARE = settings.MIDDLEWARE + [
+        'globus_portal_framework.middleware.GlobusAllowedGroupsMiddleware']
+    settings.SOCIAL_AUTH_GLOBUS_ALLOWED_GROUPS = [
+        {'name': 'Test Group 2', 'uuid': 'test-group-2-uuid'}]
+    response = groups_client.return_value.get_my_groups.return_value
+    response.data = mock_data['get_user_groups']
+    return groups_client.return_value.get_my_groups
+
+
+@pytest.mark.urls('tests.test_middleware')
+@pytest.mark.django_db
+def test_allowed_groups_middleware_allows_members(
+        user, client, allowed_groups_middleware):
+    client.force_login(user)
+    for _ in range(3):
+        assert client.get(reverse('my_detail_view')).status_code == 200
+    assert allowed_groups_middleware.call_count == 1
+
+
+@pytest.mark.urls('tests.test_middleware')
+@pytest.mark.django_db
+def test_allowed_groups_middleware_logs_out_non_members(
+        user, client, allowed_groups_middleware):
+    allowed_groups_middleware.return_value.data = []
+    client.force_login(user)
+    r = client.get(reverse('my_detail_view'))
+    assert r.status_code == 302
+    assert r.url == reverse('allowed-groups')
+    assert '_auth_user_id' not in client.session
+
+
+@pytest.mark.urls('tests.test_middleware')
+@pytest.mark.django_db
+def test_allowed_groups_middleware_allows_on_groups_error(
+        user, client, allowed_groups_middleware):
+    allowed_groups_middleware.side_effect = globus_sdk.GlobusError()
+    client.force_login(user)
+    assert client.get(reverse('my_detail_view')).status_code == 200
+
+
+@pytest.mark.urls('tests.test_middleware')
+@pytest.mark.django_db
+def test_allowed_groups_middleware_allows_users_without_groups_token(
+        client, allowed_groups_middleware):
+    user = mock_user('bob', ['search.api.globus.org',
+                             'transfer.api.globus.org'])
+    client.force_login(user)
+    assert client.get(reverse('my_detail_view')).status_code == 200
+    assert not allowed_groups_middleware.called
+
+
+@pytest.mark.urls('tests.test_middleware')
+@pytest.mark.django_db
+def test_allowed_groups_middleware_logs_errors_once(
+        user, client, allowed_groups_middleware, caplog):
+    cache.clear()
+    allowed_groups_middleware.side_effect = globus_sdk.GlobusError()
+    client.force_login(user)
+    with caplog.at_level(logging.DEBUG,
+                         logger='globus_portal_framework.middleware'):
+        for _ in range(3):
+            assert client.get(reverse('my_detail_view')).status_code == 200
+    levels = [r.levelno for r in caplog.records
+              if 'Unable to check allowed groups' in r.getMessage()]
+    assert levels == [logging.WARNING, logging.DEBUG, logging.DEBUG]
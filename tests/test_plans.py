@@ -0,0 +1,86 @@
+import pytest
+
+from globus_portal_framework import IndexNotFound
+from globus_portal_framework.constants import DEFAULT_SEARCH_VERSION
+from globus_portal_framework.gsearch import (
+    get_index, prepare_search_facets, post_search,
+)
+from globus_portal_framework.plans import (
+    get_index_plan, get_facets_plan, get_facet_modifiers, get_fields_plan,
+    compile_index_plans,
+)
+
+
+def test_index_plan_is_compiled_once():
+    assert get_index_plan('testindex') is get_index_plan('testindex')
+    assert 'testindex' in compile_index_plans()
+
+
+def test_index_plan_search_template():
+    plan = get_index_plan('testindex')
+    search_data = plan.new_search_data()
+    assert search_data['@version'] == DEFAULT_SEARCH_VERSION
+    assert search_data['facets'] == prepare_search_facets(
+        get_index('testindex')['facets'])
+    search_data['facets'].append({'field_name': 'foo'})
+    assert len(plan.new_search_data()['facets']) == 4
+
+
+def test_facet_plans():
+    facets = get_index_plan('testindex').facets_plan.facets
+    assert [f.filter_type for f in facets] == [
+        'match-all', 'match-all', 'range', 'month']
+    assert facets[0].query_key == 'filter-match-all.perfdata.subjects.value'
+    assert [f.search_filter_type for f in facets] == [
+        'match_all', 'match_all', 'range', 'range']
+    assert facets[0].new_result()['unique_name'] == facets[0].unique_name
+    assert facets[0].new_result()['name'] == 'Subject'
+
+
+def test_index_plan_not_found():
+    with pytest.raises(IndexNotFound):
+        get_index_plan('not-an-index')
+
+
+def test_index_plan_recompiled_on_settings_change(settings):
+    plan = get_index_plan('testindex')
+    settings.SEARCH_INDEXES = {
+        'testindex': dict(settings.SEARCH_INDEXES['testindex'],
+                          facets=[{'field_name': 'foo'}])
+    }
+    new_plan = get_index_plan('testindex')
+    assert new_plan is not plan
+    assert [f.field_name for f in new_plan.facets_plan.facets] == ['foo']
+
+
+def test_facets_plan_found_for_index_facets():
+    index_plan = get_index_plan('testindex')
+    facets = index_plan.data['facets']
+    filter_match = index_plan.data['filter_match']
+    assert get_facets_plan(facets, filter_match) is index_plan.facets_plan
+    assert (get_facets_plan(list(facets), filter_match) is not
+            index_plan.facets_plan)
+    assert (get_facets_plan(facets, 'match-any').facets[0].filter_type ==
+            'match-any')
+
+
+def test_fields_plan_found_for_index_fields():
+    index_plan = get_index_plan('testindex')
+    fields = index_plan.data['fields']
+    assert get_fields_plan(fields) is index_plan.fields_plan
+    assert [f[0] for f in index_plan.fields_plan.fields] == fields
+    assert get_fields_plan(list(fields)) is not index_plan.fields_plan
+
+
+def test_get_facet_modifiers_bad_import():
+    with pytest.raises(ImportError):
+        get_facet_modifiers(['globus_portal_framework.modifiers.facets.foo'])
+
+
+def test_post_search_uses_plan(search_client_inst, mock_data_search):
+    post_search('testindex', 'foo', [], page=2)
+    _, search_data = search_client_inst.post_search.call_args[0]
+    assert search_data['q'] == 'foo'
+    assert search_data['offset'] == 10
+    assert search_data['facets'] == (
+        get_index_plan('testindex').facets_plan.search_facets())
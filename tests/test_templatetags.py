@@ -1,7 +1,11 @@
+from unittest import mock
+
 import pytest
+from django import template
 from django.urls import path
 
 from globus_portal_framework.templatetags.is_active import is_active
+from globus_portal_framework.gsearch import get_template
 
 
 def view_simple(request):
@@ -42,3 +46,58 @@ def test_is_active_quietly_raises_error(rf):
     """Valid, but will raise warning"""
     r = rf.get('view-complex/1/2/3/')
     assert is_active(r, 'view-complex/', sun=1, moon=2, stars=3) == ''
+
+
+@pytest.fixture
+def override_templates(settings):
+    settings.TEMPLATES = [{
+        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'OPTIONS': {
+            'loaders': [('django.template.loaders.locmem.Loader', {
+                'base.html': 'base',
+                'component.html': 'component',
+                'myindex/component.html': 'custom component',
+            })],
+        },
+    }]
+    settings.SEARCH_INDEXES = {
+        'myindex': {'uuid': 'myindex', 'template_override_dir': 'myindex'},
+        'otherindex': {'uuid': 'otherindex'},
+    }
+
+
+def test_get_template_override(override_templates):
+    assert get_template('myindex', 'component.html') == (
+        'myindex/component.html')
+    assert get_template('myindex', 'base.html') == 'base.html'
+    assert get_template('otherindex', 'component.html') == 'component.html'
+
+
+def test_get_template_looks_up_templates_once(override_templates):
+    with mock.patch('django.template.loader.get_template',
+                    wraps=template.loader.get_template) as get:
+        for _ in range(3):
+            get_template('myindex', 'component.html')
+            get_template('myindex', 'base.html')
+    assert get.call_count == 2
+
+
+def test_get_template_looks_up_templates_in_debug(override_templates,
+                                                  settings):
+    settings.DEBUG = True
+    with mock.patch('django.template.loader.get_template',
+                    wraps=template.loader.get_template) as get:
+        for _ in range(3):
+            get_template('myindex', 'component.html')
+    assert get.call_count == 3
+
+
+def test_index_template_tag(override_templates):
+    tmpl = template.Template(
+        "{% load index_template %}"
+        "{% index_template 'component.html' as it_component %}"
+        "{% include it_component %}")
+    context = {'globus_portal_framework': {'index': 'myindex'}}
+    assert tmpl.render(template.Context(context)) == 'custom component'
+    context = {'globus_portal_framework': {'index': 'otherindex'}}
+    assert tmpl.render(template.Context(context)) == 'component'
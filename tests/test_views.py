@@ -5,11 +5,35 @@ import pytest
 from django.urls import reverse, path
 from django.urls.exceptions import NoReverseMatch
 from django.views.defaults import server_error
+from django.contrib.sessions.backends.signed_cookies import SessionStore
 
 from globus_portal_framework.urls import urlpatterns
+from globus_portal_framework.gsearch import get_search_filters
+from globus_portal_framework.views.generic import (
+    SearchView, SearchState, AsyncSearchView, AsyncDetailView
+)
+
+
+class MySearchState(SearchState):
+    def __init__(self, view):
+        super().__init__(view)
+        self.filters = self.filters + [
+            {'type': 'match_all', 'field_name': 'public', 'values': ['true']}]
+
+
+class MySearchView(SearchView):
+    search_state_class = MySearchState
+
 
 urlpatterns += [
     path('exception-view/', server_error),
+    path('<index>/search-view/', SearchView.as_view(), name='search-view'),
+    path('<index>/my-search-view/', MySearchView.as_view(),
+         name='my-search-view'),
+    path('<index>/async-search/', AsyncSearchView.as_view(),
+         name='async-search'),
+    path('<index>/async-detail/<subject>/', AsyncDetailView.as_view(),
+         name='async-detail'),
 ]
 
 
@@ -162,7 +186,134 @@ def test_allowed_groups(client):
 @pytest.mark.django_db
 def test_allowed_groups_with_user(groups_client, user, client, mock_data, globus_response):
     globus_response.data = mock_data['get_user_groups']
-    groups_client.return_value.get_my_groups.return_value = mock_data['get_user_groups']
+    groups_client.return_value.get_my_groups.return_value = globus_response
     client.force_login(user)
     r = client.get(reverse('allowed-groups'))
     assert r.status_code == 200
+
+
+@pytest.mark.urls('tests.test_views')
+def test_async_search_view(client, mock_data_search):
+    r = client.get(reverse('async-search', args=['testindex']))
+    assert r.status_code == 200
+    assert mock_data_search.post_search.call_count == 1
+    assert r.context['search']['total'] == 1
+    assert client.session['search']['index'] == 'testindex'
+
+
+@pytest.mark.urls('tests.test_views')
+def test_async_search_view_error(client, search_client_inst, settings):
+    settings.DEBUG = False
+    search_client_inst.post_search.side_effect = Exception('Search failed')
+    r = client.get(reverse('async-search', args=['testindex']))
+    assert r.status_code == 200
+    assert 'error' in r.context
+
+
+@pytest.mark.django_db
+@pytest.mark.urls('tests.test_views')
+def test_async_search_view_logged_in(client, user, mock_data_search):
+    client.force_login(user)
+    r = client.get(reverse('async-search', args=['testindex']))
+    assert r.status_code == 200
+    mock_data_search.post_search.assert_called_once()
+
+
+@pytest.mark.urls('tests.test_views')
+def test_async_detail_view(client, mock_data_get_subject):
+    url = reverse('async-detail', args=['testindex', 'mysubject'])
+    r = client.get(url)
+    assert r.status_code == 200
+    mock_data_get_subject.get_subject.assert_called_once()
+
+
+@pytest.fixture
+def lazy_index(settings):
+    calls = []
+
+    def field(name):
+        def get_field(content):
+            calls.append(name)
+            return name
+        return name, get_field
+
+    settings.SEARCH_INDEXES = {
+        'testindex': dict(settings.SEARCH_INDEXES['testindex'],
+                          lazy_fields=True,
+                          fields=[field('title'), field('unused')])
+    }
+    return calls
+
+
+def test_search_lazy_fields(client, mock_data_search, lazy_index):
+    r = client.get(reverse('search', args=['testindex']))
+    assert r.status_code == 200
+    assert 'title' in lazy_index
+    assert 'unused' not in lazy_index
+
+
+def test_detail_lazy_fields(client, mock_data_get_subject, lazy_index):
+    url = reverse('detail', args=['testindex', 'mysubject'])
+    r = client.get(url)
+    assert r.status_code == 200
+    assert lazy_index == ['title']
+    assert '<a class="h5">title</a>' in r.content.decode('utf-8')
+
+
+def test_search_view_parses_request_once(client, mock_data_search):
+    with mock.patch('globus_portal_framework.views.generic.'
+                    'get_search_filters', wraps=get_search_filters) as gsf:
+        r = client.get(reverse('search-view', args=['testindex']) +
+                       '?q=foo&filter.perfdata.subjects.value=bar')
+    assert r.status_code == 200
+    assert gsf.call_count == 1
+    assert client.session['search'] == {
+        'full_query': 'filter-match-all.perfdata.subjects.value=bar&q=foo',
+        'query': 'foo',
+        'index': 'testindex',
+    }
+
+
+def test_search_state_subclass(client, mock_data_search):
+    r = client.get(reverse('my-search-view', args=['testindex']))
+    assert r.status_code == 200
+    _, search_data = mock_data_search.post_search.call_args[0]
+    assert search_data['filters'] == [
+        {'type': 'match_all', 'field_name': 'public', 'values': ['true']}]
+
+
+@pytest.mark.parametrize('url_name', ['search', 'search-view', 'async-search'])
+def test_search_canonical_redirect(client, settings, mock_data_search,
+                                   url_name):
+    settings.SEARCH_CANONICAL_REDIRECT = True
+    url = reverse(url_name, args=['testindex'])
+    r = client.get(url + '?q=foo&page=1&filter.a=1')
+    assert r.status_code == 302
+    assert r.url == url + '?filter-match-all.a=1&q=foo'
+    assert client.get(r.url).status_code == 200
+
+
+def test_search_no_canonical_redirect_by_default(client, mock_data_search):
+    url = reverse('search', args=['testindex'])
+    assert client.get(url + '?q=foo&page=1').status_code == 200
+
+
+@pytest.mark.parametrize('url_name', ['search', 'search-view', 'async-search'])
+def test_search_session_only_saved_on_change(client, mock_data_search,
+                                             url_name):
+    url = reverse(url_name, args=['testindex'])
+    with mock.patch.object(SessionStore, 'save', autospec=True,
+                           side_effect=SessionStore.save) as session_save:
+        client.get(url + '?q=foo')
+        client.get(url + '?q=foo&page=1')
+        assert session_save.call_count == 1
+        client.get(url + '?q=bar')
+    assert session_save.call_count == 2
+
+
+@pytest.mark.parametrize('url_name', ['search', 'search-view', 'async-search'])
+def test_search_session_anonymous_disabled(client, settings, mock_data_search,
+                                           url_name):
+    settings.SEARCH_SESSION_ANONYMOUS = False
+    client.get(reverse(url_name, args=['testindex']) + '?q=foo')
+    assert 'search' not in client.session